@@ -1,6 +1,6 @@
 import os
-import json
 import logging
+import threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from flask import Flask, jsonify
@@ -10,6 +10,7 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 # Load environment variables at module level
 load_dotenv()
@@ -30,45 +31,6 @@ DEFAULT_CONFIG = {
 scheduler = None
 
 
-def cleanup_guest_postbacks(postbacks_file="/tmp/postbacks.json"):
-    """Clean up guest postbacks older than 24 hours."""
-    try:
-        if os.path.exists(postbacks_file):
-            with open(postbacks_file, "r") as f:
-                postbacks = json.load(f)
-
-            # Filter out postbacks older than 24 hours
-            cutoff_time = datetime.now() - timedelta(days=1)
-            filtered_postbacks = []
-
-            for postback in postbacks:
-                try:
-                    # Parse the timestamp from the postback
-                    timestamp_str = postback.get("timestamp", "")
-                    if timestamp_str:
-                        postback_time = datetime.fromisoformat(
-                            timestamp_str.replace("Z", "+00:00")
-                        )
-                        if postback_time.replace(tzinfo=None) >= cutoff_time:
-                            filtered_postbacks.append(postback)
-                    else:
-                        # If no timestamp, keep it (shouldn't happen but safe fallback)
-                        filtered_postbacks.append(postback)
-                except (ValueError, TypeError):
-                    # If timestamp parsing fails, keep the postback
-                    filtered_postbacks.append(postback)
-
-            # Write back the filtered postbacks
-            with open(postbacks_file, "w") as f:
-                json.dump(filtered_postbacks, f, indent=2)
-
-            print(
-                f"Guest postbacks cleanup completed. Removed {len(postbacks) - len(filtered_postbacks)} old postbacks."
-            )
-    except Exception as e:
-        print(f"Error during guest postbacks cleanup: {e}")
-
-
 def cleanup_stale_sessions(session_dir="/tmp/flask-sessions"):
     """Clean up stale server-side session files older than 48 hours."""
     try:
@@ -125,11 +87,121 @@ def create_app(test_config=None, *args, **kwargs):
         # App Configuration
         DEFAULT_CONFIG=DEFAULT_CONFIG,
         POSTBACKS_FILE="/tmp/postbacks.json",
+        # Guest postback rings (see app/utils/guest_store.py): number of slots
+        # per shard (newest records kept) and bytes per slot
+        GUEST_POSTBACK_LIMIT=int(os.getenv("GUEST_POSTBACK_LIMIT", "50")),
+        GUEST_POSTBACK_SLOT_SIZE=int(os.getenv("GUEST_POSTBACK_SLOT_SIZE", "16384")),
+        # Hours guest postbacks are kept; whole hourly segments are dropped after this
+        GUEST_POSTBACK_TTL_HOURS=int(os.getenv("GUEST_POSTBACK_TTL_HOURS", "24")),
+        # Guest tokens are hashed onto this many shards; the least recently
+        # written shards beyond GUEST_MAX_ACTIVE_SHARDS are removed
+        GUEST_SHARD_COUNT=int(os.getenv("GUEST_SHARD_COUNT", "256")),
+        GUEST_MAX_ACTIVE_SHARDS=int(os.getenv("GUEST_MAX_ACTIVE_SHARDS", "64")),
+        # Segments each process keeps mapped (each holds two file descriptors)
+        GUEST_MAX_MAPPED_SEGMENTS=int(os.getenv("GUEST_MAX_MAPPED_SEGMENTS", "128")),
+        # Postback ingest: "sync" inserts each postback inline, "batched"
+        # queues rows for a background writer (see app/utils/postback_ingest.py)
+        POSTBACK_INGEST_MODE=os.getenv("POSTBACK_INGEST_MODE", "sync").lower(),
+        POSTBACK_QUEUE_SIZE=int(os.getenv("POSTBACK_QUEUE_SIZE", "10000")),
+        POSTBACK_BATCH_SIZE=int(os.getenv("POSTBACK_BATCH_SIZE", "200")),
+        POSTBACK_FLUSH_INTERVAL=float(os.getenv("POSTBACK_FLUSH_INTERVAL", "0.5")),
+        POSTBACK_SPOOL_FILE=os.getenv("POSTBACK_SPOOL_FILE", "/tmp/postbacks-spool.ndjson"),
+        # Per-user postback retention: users are trimmed back to the cap once
+        # they exceed it by the slack margin (see app/utils/postback_retention.py)
+        POSTBACK_RETENTION_CAP=int(os.getenv("POSTBACK_RETENTION_CAP", "10000")),
+        POSTBACK_RETENTION_SLACK=int(os.getenv("POSTBACK_RETENTION_SLACK", "500")),
+        POSTBACK_RETENTION_INTERVAL=int(os.getenv("POSTBACK_RETENTION_INTERVAL", "60")),
+        # Seconds a user's postback total is cached for the postbacks list
+        POSTBACK_COUNT_CACHE_TTL=float(os.getenv("POSTBACK_COUNT_CACHE_TTL", "10")),
+        # Threads per worker that run Flask requests under asgi:app (uvicorn workers)
+        ASGI_WSGI_THREADS=int(os.getenv("ASGI_WSGI_THREADS", "16")),
+        # Maximum delayed (?delay=N) postback responses held at once per worker
+        POSTBACK_DELAY_MAX_PARKED=int(os.getenv("POSTBACK_DELAY_MAX_PARKED", "1000")),
+        # Live postback events: "auto" uses LISTEN/NOTIFY on PostgreSQL and an
+        # in-process bus otherwise (see app/utils/postback_events.py)
+        POSTBACK_EVENTS_BACKEND=os.getenv("POSTBACK_EVENTS_BACKEND", "auto").lower(),
+        POSTBACK_EVENTS_QUEUE_SIZE=int(os.getenv("POSTBACK_EVENTS_QUEUE_SIZE", "100")),
+        POSTBACK_EVENTS_MAX_SUBSCRIBERS=int(os.getenv("POSTBACK_EVENTS_MAX_SUBSCRIBERS", "500")),
+        # Longest timeout accepted by GET /api/postbacks/wait, in seconds
+        POSTBACK_WAIT_MAX_TIMEOUT=int(os.getenv("POSTBACK_WAIT_MAX_TIMEOUT", "120")),
+        # Seconds between database re-checks while waiting, for postbacks whose
+        # notification doesn't reach this worker
+        POSTBACK_WAIT_POLL_INTERVAL=float(os.getenv("POSTBACK_WAIT_POLL_INTERVAL", "2")),
+        # Open /postbacks/stream connections allowed per worker; each holds a
+        # worker thread, so keep this well below GUNICORN_THREADS
+        POSTBACK_STREAM_MAX_OPEN=int(os.getenv("POSTBACK_STREAM_MAX_OPEN", "2")),
+        # Seconds between keep-alive comments on /postbacks/stream
+        POSTBACK_STREAM_HEARTBEAT=float(os.getenv("POSTBACK_STREAM_HEARTBEAT", "15")),
         # Outbound request timeout (in seconds) for external APIs
         API_REQUEST_TIMEOUT=int(os.getenv("API_REQUEST_TIMEOUT", "60")),
+        # Adaptive API timeouts for GETs (see app/utils/timeouts.py): each endpoint's
+        # API_TIMEOUT_PERCENTILE latency over its last API_TIMEOUT_WINDOW
+        # responses times API_TIMEOUT_MULTIPLIER, within FLOOR..CEILING seconds
+        # (the ceiling defaults to API_REQUEST_TIMEOUT, and applies until an
+        # endpoint has API_TIMEOUT_MIN_SAMPLES responses)
+        API_TIMEOUT_ADAPTIVE=os.getenv("API_TIMEOUT_ADAPTIVE", "true").lower() in ["true", "1", "yes"],
+        API_TIMEOUT_FLOOR=float(os.getenv("API_TIMEOUT_FLOOR", "2")),
+        API_TIMEOUT_CEILING=float(os.getenv("API_TIMEOUT_CEILING") or 0) or None,
+        API_TIMEOUT_PERCENTILE=float(os.getenv("API_TIMEOUT_PERCENTILE", "99")),
+        API_TIMEOUT_MULTIPLIER=float(os.getenv("API_TIMEOUT_MULTIPLIER", "3")),
+        API_TIMEOUT_WINDOW=int(os.getenv("API_TIMEOUT_WINDOW", "200")),
+        API_TIMEOUT_MIN_SAMPLES=int(os.getenv("API_TIMEOUT_MIN_SAMPLES", "20")),
+        # Total seconds for all API calls (and retries) of one transaction
+        # (defaults to three times the ceiling)
+        API_REQUEST_DEADLINE=float(os.getenv("API_REQUEST_DEADLINE") or 0) or None,
+        # Keep-alive connections pooled per outbound API host, per worker process
+        HTTP_POOL_SIZE=int(os.getenv("HTTP_POOL_SIZE", "10")),
+        # Outbound API client: "sync" (pooled requests sessions) or "async"
+        # (httpx on an event-loop thread, see app/utils/async_client.py)
+        OUTBOUND_CLIENT=os.getenv("OUTBOUND_CLIENT", "sync").lower(),
+        HTTP_ASYNC_MAX_CONNECTIONS=int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "100")),
+        # Retries of failed API calls (see app/utils/retry.py): attempts per
+        # call, backoff base/cap in seconds, and the per-environment budget
+        # (retries allowed per 10s: API_RETRY_BUDGET_MIN + ratio * calls)
+        API_RETRY_MAX_ATTEMPTS=int(os.getenv("API_RETRY_MAX_ATTEMPTS", "3")),
+        API_RETRY_BACKOFF=float(os.getenv("API_RETRY_BACKOFF", "0.25")),
+        API_RETRY_MAX_BACKOFF=float(os.getenv("API_RETRY_MAX_BACKOFF", "4")),
+        API_RETRY_BUDGET_RATIO=float(os.getenv("API_RETRY_BUDGET_RATIO", "0.2")),
+        API_RETRY_BUDGET_MIN=int(os.getenv("API_RETRY_BUDGET_MIN", "10")),
+        # Gateway circuit breakers (see app/utils/circuit_breaker.py): open when
+        # CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW calls (at least
+        # CIRCUIT_MIN_CALLS) failed, and fail fast for CIRCUIT_OPEN_SECONDS
+        CIRCUIT_WINDOW=int(os.getenv("CIRCUIT_WINDOW", "20")),
+        CIRCUIT_FAILURE_RATE=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+        CIRCUIT_MIN_CALLS=int(os.getenv("CIRCUIT_MIN_CALLS", "5")),
+        CIRCUIT_OPEN_SECONDS=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),
+        # Parent intent details cache (see app/utils/intent_cache.py): entries
+        # kept per worker and seconds each lookup is reused
+        INTENT_CACHE_SIZE=int(os.getenv("INTENT_CACHE_SIZE", "256")),
+        INTENT_CACHE_TTL=float(os.getenv("INTENT_CACHE_TTL", "60")),
+        # Batch runner limits (see app/utils/batch.py): transactions and worker
+        # threads per batch, batches running at once and finished batches
+        # kept per worker
+        BATCH_MAX_TRANSACTIONS=int(os.getenv("BATCH_MAX_TRANSACTIONS", "1000")),
+        BATCH_MAX_CONCURRENCY=int(os.getenv("BATCH_MAX_CONCURRENCY", "20")),
+        BATCH_MAX_RUNNING=int(os.getenv("BATCH_MAX_RUNNING", "3")),
+        BATCH_HISTORY=int(os.getenv("BATCH_HISTORY", "20")),
+        # Transaction submission: "sync" makes the gateway calls inside the form
+        # POST, "jobs" queues them to a bounded thread pool and the page polls
+        # for the result (see app/utils/transaction_jobs.py)
+        TRANSACTION_MODE=os.getenv("TRANSACTION_MODE", "sync").lower(),
+        TRANSACTION_JOB_WORKERS=int(os.getenv("TRANSACTION_JOB_WORKERS", "8")),
+        TRANSACTION_JOB_MAX_PENDING=int(os.getenv("TRANSACTION_JOB_MAX_PENDING", "100")),
+        TRANSACTION_JOB_TTL=float(os.getenv("TRANSACTION_JOB_TTL", "600")),
+        TRANSACTION_JOB_DIR=os.getenv("TRANSACTION_JOB_DIR", "/tmp/transaction-jobs"),
+        # Outbound intent ledger (see app/utils/intent_ledger.py): seconds between
+        # background writes, queued events, how long a postback may wait for its
+        # intent's row, days kept, and intents read per latency report
+        INTENT_LEDGER_FLUSH_INTERVAL=float(os.getenv("INTENT_LEDGER_FLUSH_INTERVAL", "0.5")),
+        INTENT_LEDGER_QUEUE_SIZE=int(os.getenv("INTENT_LEDGER_QUEUE_SIZE", "10000")),
+        INTENT_LEDGER_MATCH_WINDOW=float(os.getenv("INTENT_LEDGER_MATCH_WINDOW", "30")),
+        INTENT_LEDGER_RETENTION_DAYS=int(os.getenv("INTENT_LEDGER_RETENTION_DAYS", "30")),
+        INTENT_LEDGER_REPORT_LIMIT=int(os.getenv("INTENT_LEDGER_REPORT_LIMIT", "50000")),
         # WU Check feature flag
         ENABLE_WU_CHECK=os.getenv("ENABLE_WU_CHECK", "false").lower() in ["true", "1", "yes"],
         WU_API_BASE_URL=os.getenv("WU_API_BASE_URL", "https://api-terminal-gateway.tillpayments.com/devices"),
+        # Offer the "mock" environment (a local app/mock_gateway.py server) on the config page
+        ENABLE_MOCK_GATEWAY=os.getenv("ENABLE_MOCK_GATEWAY", "false").lower() in ["true", "1", "yes"],
         # Email Configuration (if using email for invites)
         MAIL_SERVER=os.getenv("MAIL_SERVER"),
         MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
@@ -167,6 +239,76 @@ def create_app(test_config=None, *args, **kwargs):
     sess = Session()
     sess.init_app(app)
 
+    # Sharded per-guest postback store (memory-mapped ring buffers)
+    from .utils.guest_store import GuestPostbackStore
+    guest_store = GuestPostbackStore(app)
+
+    # Per-user postback retention (counters updated on ingest, trimmed by job)
+    from .utils.postback_retention import PostbackRetention
+    retention = PostbackRetention(app)
+
+    # Cached postback totals for the (cursor-paginated) postbacks list
+    from .utils.pagination import CountCache
+    app.extensions["postback_counts"] = CountCache(ttl=app.config["POSTBACK_COUNT_CACHE_TTL"])
+
+    # Slots for open /postbacks/stream connections in this worker
+    app.extensions["postback_streams"] = threading.BoundedSemaphore(max(1, app.config["POSTBACK_STREAM_MAX_OPEN"]))
+
+    # Cap and counters for delayed postback responses
+    from .utils.deferred import DeferredResponseEngine
+    DeferredResponseEngine(app)
+
+    # Retry policy and counters for outbound API calls
+    from .utils.retry import ApiRetryPolicy
+    ApiRetryPolicy(app)
+
+    # Per-gateway circuit breakers for outbound API calls
+    from .utils.circuit_breaker import CircuitBreakers
+    CircuitBreakers(app)
+
+    # Latency histograms of outbound API calls
+    from .utils.call_metrics import OutboundCallMetrics
+    OutboundCallMetrics(app)
+
+    # Per-endpoint timeouts from observed latency, and per-transaction deadlines
+    from .utils.timeouts import AdaptiveTimeouts
+    AdaptiveTimeouts(app)
+
+    # Short-lived cache of parent intent details for linked refunds/reversals
+    from .utils.intent_cache import IntentDetailsCache
+    IntentDetailsCache(app)
+
+    # Pooled keep-alive client for outbound API calls
+    from .utils.http_client import HttpClient
+    HttpClient(app)
+
+    # Asyncio outbound client for API calls (opt-in)
+    if app.config.get("OUTBOUND_CLIENT") == "async":
+        from .utils.async_client import AsyncHttpClient
+        AsyncHttpClient(app)
+
+    # Background runner for batch transactions (/batch)
+    from .utils.batch import BatchRunner
+    BatchRunner(app)
+
+    # Background transaction jobs for form submissions (opt-in)
+    if app.config.get("TRANSACTION_MODE") == "jobs":
+        from .utils.transaction_jobs import TransactionJobs
+        TransactionJobs(app)
+
+    # Outbound intent ledger, written by a background thread
+    from .utils.intent_ledger import IntentLedger
+    intent_ledger = IntentLedger(app)
+
+    # Notification bus for newly ingested postbacks (feeds /postbacks/stream)
+    from .utils.postback_events import PostbackEventBus
+    PostbackEventBus(app)
+
+    # Write-behind postback ingest (opt-in)
+    if app.config.get("POSTBACK_INGEST_MODE") == "batched":
+        from .utils.postback_ingest import PostbackWriter
+        PostbackWriter(app)
+
     # JWT error handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -194,19 +336,19 @@ def create_app(test_config=None, *args, **kwargs):
     # Note: Database initialization and admin user creation moved to init_db.py
     # to avoid circular dependency issues with Flask-Migrate
 
-    # Initialize scheduler for guest postbacks cleanup (only in production/non-testing)
+    # Initialize scheduler for periodic cleanup and retention jobs (only in production/non-testing)
     if not app.config.get("TESTING", False) and scheduler is None:
         scheduler = BackgroundScheduler()
-        # Run cleanup daily at 2 AM
         from functools import partial
-        postbacks_path = app.config.get("POSTBACKS_FILE", "/tmp/postbacks.json")
+        # Drop guest postback segments past their TTL (one unlink per segment)
         scheduler.add_job(
-            func=partial(cleanup_guest_postbacks, postbacks_file=postbacks_path),
-            trigger=CronTrigger(hour=2, minute=0),
+            func=guest_store.expire,
+            trigger=CronTrigger(minute=5),
             id="cleanup_guest_postbacks",
-            name="Daily cleanup of guest postbacks",
+            name="Hourly expiry of guest postback segments",
             replace_existing=True,
         )
+        # Remove stale session files daily at 2:30 AM
         session_dir = app.config.get("SESSION_FILE_DIR", "/tmp/flask-sessions")
         scheduler.add_job(
             func=partial(cleanup_stale_sessions, session_dir=session_dir),
@@ -215,8 +357,26 @@ def create_app(test_config=None, *args, **kwargs):
             name="Daily cleanup of stale sessions",
             replace_existing=True,
         )
+        # Trim postbacks over the retention cap every POSTBACK_RETENTION_INTERVAL seconds
+        scheduler.add_job(
+            func=retention.sweep,
+            trigger=IntervalTrigger(seconds=app.config["POSTBACK_RETENTION_INTERVAL"]),
+            id="enforce_postback_retention",
+            name="Trim user postbacks over the retention cap",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            func=intent_ledger.sweep,
+            trigger=CronTrigger(hour=3, minute=15),
+            id="expire_outbound_intents",
+            name="Daily expiry of old outbound intent ledger entries",
+            replace_existing=True,
+        )
         scheduler.start()
-        print("Scheduler started for daily cleanup jobs (guest postbacks + stale sessions)")
+        print(
+            "Scheduler started for cleanup jobs "
+            "(guest postbacks + stale sessions + postback retention + intent ledger)"
+        )
 
     # Register blueprints
     from .routes import init_app as init_routes
@@ -230,8 +390,14 @@ def create_app(test_config=None, *args, **kwargs):
     init_routes(app)
 
     # Register CLI commands
-    from app.cli import init_db
+    from app.cli import init_db, backfill_postbacks, batch_run, run_scenario
+    from app.mock_gateway import mock_gateway
+    from app.utils.api import ENVIRONMENT_URLS
     app.cli.add_command(init_db)
+    app.cli.add_command(backfill_postbacks)
+    app.cli.add_command(batch_run)
+    app.cli.add_command(run_scenario)
+    app.cli.add_command(mock_gateway)
 
     # Context processor to make version and feature flags available in all templates
     @app.context_processor
@@ -246,6 +412,8 @@ def create_app(test_config=None, *args, **kwargs):
         return {
             "app_version": version,
             "wu_check_enabled": app.config.get("ENABLE_WU_CHECK", False),
+            "mock_gateway_enabled": app.config.get("ENABLE_MOCK_GATEWAY", False),
+            "mock_gateway_url": ENVIRONMENT_URLS["mock"],
         }
 
     @app.route("/")
@@ -0,0 +1,190 @@
+"""
+ASGI wrapper around the Flask app.
+
+Every request is served by the Flask app through asgiref's WsgiToAsgi,
+run on a pool of ASGI_WSGI_THREADS threads per worker (asgiref's default
+runs every WSGI call on one shared thread, so requests would queue behind
+each other), except delayed postbacks (POST /postback?delay=N). For those the delay is
+stripped from the query string, the Flask route stores the postback and
+returns straight away, and the finished response is held on the event loop
+for N seconds before being sent. A WSGI thread is only busy while the
+postback is being stored, so hundreds of slow receivers can be simulated by
+a single worker.
+
+Long-polls on GET /api/postbacks/wait are handled the same way: the Flask
+route is only asked for an immediate answer (timeout=0), and while the
+intents are still pending the request waits on the event loop for an
+ingest notification, or at most POSTBACK_WAIT_POLL_INTERVAL seconds,
+before asking again.
+
+Run with: gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from .utils.deferred import parse_delay
+from .utils.postback_wait import WAIT_CHANNEL_HEADER, AsyncIntentWaiter, parse_wait_timeout
+
+logger = logging.getLogger(__name__)
+
+POSTBACK_PATH = re.compile(r"^/postback(/\d+|/guest/[^/]+)?/?$")
+WAIT_PATH = re.compile(r"^/api/postbacks/wait/?$")
+
+
+# asgiref's synchronous run_wsgi_app, without its thread_sensitive sync_to_async wrapper
+_run_wsgi_app = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs the WSGI app on its own thread pool."""
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+def _split_delay(query_string):
+    """Return (delay_seconds, query string without the delay parameter)."""
+    params = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    delay_values = [value for key, value in params if key == "delay"]
+    remaining = [(key, value) for key, value in params if key != "delay"]
+    delay = parse_delay(delay_values[-1]) if delay_values else 0
+    return delay, urlencode(remaining).encode("latin-1")
+
+
+def _split_timeout(query_string):
+    """Return (timeout parameter or None, query string with timeout=0)."""
+    params = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    timeout_values = [value for key, value in params if key == "timeout"]
+    remaining = [(key, value) for key, value in params if key != "timeout"]
+    remaining.append(("timeout", "0"))
+    return (timeout_values[-1] if timeout_values else None), urlencode(remaining).encode("latin-1")
+
+
+def create_asgi_app(flask_app):
+    """Wrap a Flask app so delayed postbacks and long-polls don't pin a thread."""
+    wsgi_app = ThreadPoolWsgiToAsgi(flask_app, max(1, int(flask_app.config.get("ASGI_WSGI_THREADS", 16))))
+    engine = flask_app.extensions["deferred_responses"]
+    bus = flask_app.extensions["postback_events"]
+    channel_header = WAIT_CHANNEL_HEADER.lower().encode("latin-1")
+
+    async def call_wsgi(scope):
+        """Run a body-less request through Flask and return (start message, body)."""
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def buffer_send(message):
+            messages.append(message)
+
+        await wsgi_app(scope, receive, buffer_send)
+        start = next(m for m in messages if m["type"] == "http.response.start")
+        body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+        return start, body
+
+    async def wait_for_postbacks(scope, send):
+        timeout_param, query_string = _split_timeout(scope.get("query_string", b""))
+        timeout = parse_wait_timeout(timeout_param, flask_app.config["POSTBACK_WAIT_MAX_TIMEOUT"])
+        scope = dict(scope, query_string=query_string)
+        loop = asyncio.get_running_loop()
+        poll_interval = flask_app.config["POSTBACK_WAIT_POLL_INTERVAL"]
+        deadline = loop.time() + timeout
+        waiter = None
+        subscribed = False
+        try:
+            while True:
+                start, body = await call_wsgi(scope)
+                if start["status"] != 200:
+                    break
+                result = json.loads(body)
+                remaining = deadline - loop.time()
+                if result["complete"] or remaining <= 0:
+                    break
+                if not subscribed:
+                    subscribed = True
+                    channel = next(
+                        (value for name, value in start["headers"] if name.lower() == channel_header), b""
+                    ).decode("latin-1")
+                    # None when the subscriber cap is reached; we then only poll
+                    waiter = bus.subscribe(
+                        subscription=AsyncIntentWaiter(channel, result["pending"], loop)
+                    )
+                    if waiter is not None:
+                        # Check again now that we're subscribed, then wait
+                        continue
+                # Re-check now and then in case the notification never reaches us
+                if waiter is not None:
+                    await waiter.wait(min(remaining, poll_interval))
+                else:
+                    await asyncio.sleep(min(remaining, poll_interval))
+        finally:
+            if waiter is not None:
+                bus.unsubscribe(waiter)
+
+        headers = [(name, value) for name, value in start["headers"] if name.lower() != channel_header]
+        await send(dict(start, headers=headers))
+        await send({"type": "http.response.body", "body": body})
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET" and WAIT_PATH.match(scope["path"]):
+            await wait_for_postbacks(scope, send)
+            return
+
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not POSTBACK_PATH.match(scope["path"])
+        ):
+            await wsgi_app(scope, receive, send)
+            return
+
+        delay, query_string = _split_delay(scope.get("query_string", b""))
+        # The route never sleeps itself on this path
+        scope = dict(scope, query_string=query_string)
+        if delay <= 0:
+            await wsgi_app(scope, receive, send)
+            return
+
+        if not engine.try_acquire():
+            logger.warning(f"Deferred postback cap reached; responding without {delay}s delay")
+            await wsgi_app(scope, receive, send)
+            return
+
+        try:
+            messages = []
+
+            async def buffer_send(message):
+                messages.append(message)
+
+            await wsgi_app(scope, receive, buffer_send)
+            logger.info(f"Parking postback response for {delay} seconds (non-blocking delay)")
+            await asyncio.sleep(delay)
+        finally:
+            engine.release()
+
+        for message in messages:
+            await send(message)
+
+    app.flask_app = flask_app
+    return app
@@ -2,9 +2,11 @@
 CLI commands for Terminal Connect Test application.
 
 Provides a one-shot `flask init-db` command that replaces the old
-subprocess-chained init_db.py with direct Flask-Migrate API calls.
+subprocess-chained init_db.py with direct Flask-Migrate API calls, plus
+maintenance commands for stored postbacks.
 """
 
+import json
 import os
 import sys
 from pathlib import Path
@@ -150,4 +152,184 @@ def _create_admin_user() -> None:
         db.session.commit()
         print(f"Admin user created successfully: {admin_email}")
     except Exception as e:
-        print(f"Failed to create admin user: {e}")
\ No newline at end of file
+        print(f"Failed to create admin user: {e}")
+
+
+@click.command("backfill-postbacks")
+@click.option("--batch-size", default=500, show_default=True, help="Rows updated per commit.")
+@with_appcontext
+def backfill_postbacks(batch_size):
+    """Populate denormalized postback columns from the stored JSON payloads."""
+    from sqlalchemy import select, update
+    from app import db
+    from app.models import UserPostback
+    from app.utils.helpers import extract_postback_fields
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(UserPostback.id, UserPostback.postback_data)
+            .where(UserPostback.id > last_id)
+            .order_by(UserPostback.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        values = []
+        for postback_id, postback_data in rows:
+            try:
+                payload = json.loads(postback_data).get("payload")
+            except (ValueError, AttributeError):
+                payload = None
+            values.append({"id": postback_id, **extract_postback_fields(payload)})
+
+        db.session.execute(update(UserPostback), values)
+        db.session.commit()
+        updated += len(values)
+        last_id = rows[-1][0]
+        click.echo(f"Backfilled {updated} postbacks...")
+
+    click.echo(f"Backfill complete: {updated} postbacks updated")
+
+
+@click.command("batch-run")
+@click.option(
+    "--type",
+    "kind",
+    type=click.Choice(["sale", "unlinked_refund", "linked_refund", "reversal"]),
+    default="sale",
+    show_default=True,
+    help="Transaction type.",
+)
+@click.option("--count", default=10, show_default=True, help="Number of transactions.")
+@click.option("--concurrency", default=1, show_default=True, help="Transactions in flight at once.")
+@click.option("--rate", type=float, default=None, help="Maximum transactions started per second.")
+@click.option("--amount", default="1.00", show_default=True, help="Amount for sales and refunds.")
+@click.option("--parent-intent-id", "parent_intent_ids", multiple=True, help="Parent intent for linked types (repeatable, used in turn).")
+@click.option("--via-pinpad", is_flag=True, help="Process linked types on the PINpad of a WP TID.")
+@click.option("--reference-prefix", default=None, help="Merchant reference prefix (default: current timestamp).")
+@click.option("--postback-url", default=None, help="Postback URL sent with each intent.")
+@click.option("--json", "as_json", is_flag=True, help="Print the full report as JSON.")
+@with_appcontext
+def batch_run(kind, count, concurrency, rate, amount, parent_intent_ids, via_pinpad, reference_prefix, postback_url, as_json):
+    """Submit a batch of transactions with the default (environment) configuration."""
+    from decimal import Decimal
+    from flask import current_app, session
+    from app.utils.batch import BatchRun, session_snapshot
+    from app.utils.transactions import LINKED_TYPES, REVERSAL
+    from app.utils.validation import is_valid_uuid, validate_amount, validate_config
+
+    app = current_app._get_current_object()
+    limit_error = app.extensions["batch_runner"].check_limits(count, concurrency, rate)
+    if limit_error:
+        raise click.BadParameter(limit_error)
+    if kind != REVERSAL:
+        is_valid, error = validate_amount(amount)
+        if not is_valid:
+            raise click.BadParameter(error, param_hint="--amount")
+    if kind in LINKED_TYPES and not (parent_intent_ids and all(map(is_valid_uuid, parent_intent_ids))):
+        raise click.BadParameter("a valid UUID v4 is required for linked types", param_hint="--parent-intent-id")
+
+    with app.test_request_context():
+        if not validate_config():
+            click.echo("MID, TID, API_KEY and BASE_URL must be configured", err=True)
+            sys.exit(1)
+        if postback_url:
+            session["POSTBACK_URL"] = postback_url
+        config = session_snapshot()
+
+    run = BatchRun(
+        kind,
+        count,
+        concurrency=concurrency,
+        rate=rate,
+        amount=None if kind == REVERSAL else Decimal(amount),
+        parent_intent_ids=parent_intent_ids,
+        via_pinpad=via_pinpad,
+        reference_prefix=reference_prefix,
+    )
+    click.echo(f"Running {count} x {kind} (concurrency {run.concurrency}, rate {rate or 'unlimited'})...", err=True)
+    report = run.run(app, config)
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+    click.echo(
+        f"{report['completed']} completed, {report['succeeded']} succeeded, {report['failed']} failed "
+        f"in {report['elapsed']}s ({report['throughput']}/s)"
+    )
+    for stage, latency in report["latency_ms"].items():
+        click.echo(
+            f"  {stage:<12} p50 {latency['p50']}ms  p90 {latency['p90']}ms  "
+            f"p95 {latency['p95']}ms  p99 {latency['p99']}ms  max {latency['max']}ms"
+        )
+    for error in report["errors"]:
+        click.echo(f"  {error['count']} x [{error['stage']}] {error['error']}")
+
+
+@click.command("run-scenario")
+@click.argument("scenario_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--instances", type=int, default=None, help="Override the scenario's instance count.")
+@click.option("--concurrency", type=int, default=None, help="Override the scenario's concurrency.")
+@click.option("--user-email", default=None, help="Send postbacks to, and wait on postbacks of, this user.")
+@click.option("--postback-url", default=None, help="Public URL of this app's postback endpoint for that user.")
+@click.option("--json", "as_json", is_flag=True, help="Print the full report as JSON.")
+@with_appcontext
+def run_scenario(scenario_file, instances, concurrency, user_email, postback_url, as_json):
+    """Run a YAML/JSON transaction scenario with the default (environment) configuration."""
+    from flask import current_app, session, url_for
+    from app.models import User
+    from app.utils.batch import session_snapshot
+    from app.utils.scenarios import ScenarioRun, load_scenario_file, postback_owner
+    from app.utils.validation import validate_config
+
+    app = current_app._get_current_object()
+    runner = app.extensions["batch_runner"]
+    scenario, error = load_scenario_file(scenario_file, runner.max_transactions, runner.max_concurrency)
+    if error:
+        raise click.BadParameter(error, param_hint="SCENARIO_FILE")
+    scenario["instances"] = instances or scenario["instances"]
+    scenario["concurrency"] = concurrency or scenario["concurrency"]
+    limit_error = runner.check_limits(scenario["instances"], scenario["concurrency"], None)
+    if limit_error:
+        raise click.BadParameter(limit_error)
+
+    with app.test_request_context():
+        if not validate_config():
+            click.echo("MID, TID, API_KEY and BASE_URL must be configured", err=True)
+            sys.exit(1)
+        if user_email:
+            user = User.query.filter_by(email=user_email).first()
+            if user is None:
+                raise click.BadParameter(f"no user with email {user_email}", param_hint="--user-email")
+            session["user_id"] = user.id
+            session["POSTBACK_URL"] = postback_url or url_for("postbacks.postback", user_id=user.id, _external=True)
+        elif postback_url:
+            session["POSTBACK_URL"] = postback_url
+        config = session_snapshot()
+        config.update(postback_owner())
+
+    run = ScenarioRun(scenario)
+    click.echo(
+        f"Running scenario {scenario['name']}: {run.count} instances, concurrency {run.concurrency}...", err=True
+    )
+    report = run.run(app, config)
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+    click.echo(
+        f"{report['succeeded']} of {report['completed']} instances passed in {report['elapsed']}s "
+        f"({report['throughput']}/s)"
+    )
+    end_to_end = report["latency_ms"]["end_to_end"]
+    if end_to_end:
+        click.echo(f"  end to end   p50 {end_to_end['p50']}ms  p95 {end_to_end['p95']}ms  max {end_to_end['max']}ms")
+    for step in report["steps"]:
+        latency = step["latency_ms"].get("step")
+        timing = f"  p50 {latency['p50']}ms  p95 {latency['p95']}ms" if latency else ""
+        click.echo(f"  {step['name']:<12} {step['passed']} passed, {step['failed']} failed, {step['skipped']} skipped{timing}")
+        for error in step["errors"]:
+            click.echo(f"    {error['count']} x [{error['stage']}] {error['error']}")
@@ -0,0 +1,437 @@
+"""
+Mock Terminal Connect gateway for benchmarking and offline testing.
+
+Implements the gateway endpoints this app calls, under /devices:
+
+- POST /merchant/{mid}/intent/payment|refund|reversal   create an intent
+- POST /merchant/{mid}/intent/{id}/process              send it to the TID
+- GET  /merchant/{mid}/intent/{id}                      intent details
+- GET  /merchant/{mid}/terminals                        terminals (WU check)
+
+Processed intents (and non-pinpad refunds/reversals, which the gateway
+completes itself) get a postback POSTed to the intent's postbackUrl once
+the postback delay has passed, APPROVED or, at the decline rate, DECLINED.
+Creates honour Idempotency-Key like the real gateway, so retried calls get
+the same intent back. GET /__mock/stats returns request and postback
+counters.
+
+Latency and postback delay are distributions in milliseconds: "80" or
+"fixed:80", "uniform:20-200", "normal:80,20", "lognormal:80,0.5" (median,
+sigma) or "exp:80" (mean). Each response is delayed by a sample from the
+endpoint's distribution, and at the error rate answered with a 503.
+
+Run it with `flask mock-gateway` or `python -m app.mock_gateway` (threaded
+WSGI server, or `--server asyncio` for uvicorn, where delays don't hold a
+thread), or under another server via the factories, configured by the
+MOCK_* environment variables:
+
+    gunicorn 'app.mock_gateway:create_wsgi_app()'
+    uvicorn --factory app.mock_gateway:create_asgi_app
+
+Then choose the "mock" environment (MOCK_GATEWAY_URL, by default
+http://127.0.0.1:5055/devices) on the configuration page.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import click
+import requests
+
+logger = logging.getLogger(__name__)
+
+BASE_PATH = "/devices"
+CREATE_PATH = re.compile(r"^/merchant/([^/]+)/intent/(payment|refund|reversal)$")
+PROCESS_PATH = re.compile(r"^/merchant/([^/]+)/intent/([^/]+)/process$")
+DETAILS_PATH = re.compile(r"^/merchant/([^/]+)/intent/([^/]+)$")
+TERMINALS_PATH = re.compile(r"^/merchant/([^/]+)/terminals$")
+STATS_PATH = "/__mock/stats"
+
+# Endpoint names used for latency overrides and counters
+OPERATIONS = ("create", "process", "details", "terminals")
+# Intents kept for details lookups and idempotent replays
+MAX_INTENTS = 100000
+
+
+def parse_distribution(spec):
+    """Sampler returning seconds for a latency spec in milliseconds; None or "" means no delay."""
+    spec = str(spec or "0").strip().lower()
+    name, _, params = spec.partition(":")
+    if not params:
+        name, params = "fixed", name
+    try:
+        values = [float(v) for v in re.split(r"[,-]", params) if v.strip()]
+        if name == "fixed" and len(values) == 1:
+            ms = values[0]
+            return lambda rng: ms / 1000
+        if name == "uniform" and len(values) == 2:
+            low, high = values
+            return lambda rng: rng.uniform(low, high) / 1000
+        if name == "normal" and len(values) == 2:
+            mean, stddev = values
+            return lambda rng: max(0.0, rng.gauss(mean, stddev)) / 1000
+        if name == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(0, sigma) * median / 1000
+        if name in ("exp", "exponential") and len(values) == 1:
+            mean = values[0]
+            return lambda rng: rng.expovariate(1 / mean) / 1000 if mean > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency distribution: {spec!r}")
+
+
+class PostbackSender:
+    """Sends scheduled postbacks from a small thread pool."""
+
+    def __init__(self, workers=8, timeout=10):
+        self.timeout = timeout
+        self._heap = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mock-postback")
+        self._session = requests.Session()
+        self._thread = None
+        self.stats = {"scheduled": 0, "sent": 0, "failed": 0}
+
+    def schedule(self, url, payload, delay):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), url, payload))
+            self.stats["scheduled"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mock-postbacks", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, url, payload = heapq.heappop(self._heap)
+            self._pool.submit(self._send, url, payload)
+
+    def _send(self, url, payload):
+        try:
+            self._session.post(url, json=payload, timeout=self.timeout).raise_for_status()
+            self.stats["sent"] += 1
+        except requests.exceptions.RequestException as e:
+            self.stats["failed"] += 1
+            logger.warning(f"Mock postback to {url} failed: {e}")
+
+
+class MockGateway:
+    """Framework-free gateway logic: handle() returns the response and how long to delay it."""
+
+    def __init__(
+        self,
+        latency="0",
+        latencies=None,
+        error_rate=0.0,
+        decline_rate=0.0,
+        postback_delay="0",
+        seed=None,
+        sender=None,
+    ):
+        default = parse_distribution(latency)
+        latencies = latencies or {}
+        self.latency = {op: parse_distribution(latencies[op]) if latencies.get(op) else default for op in OPERATIONS}
+        self.error_rate = float(error_rate)
+        self.decline_rate = float(decline_rate)
+        self.postback_delay = parse_distribution(postback_delay)
+        self.sender = sender or PostbackSender()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._intents = {}
+        self._idempotent = {}
+        self.stats = {op: 0 for op in OPERATIONS}
+        self.stats.update(errors_injected=0, not_found=0, unauthorized=0)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=os.getenv("MOCK_LATENCY", "0"),
+            latencies={op: os.getenv(f"MOCK_LATENCY_{op.upper()}") for op in OPERATIONS},
+            error_rate=os.getenv("MOCK_ERROR_RATE", "0"),
+            decline_rate=os.getenv("MOCK_DECLINE_RATE", "0"),
+            postback_delay=os.getenv("MOCK_POSTBACK_DELAY", "200"),
+            seed=os.getenv("MOCK_SEED") or None,
+        )
+
+    def _sample(self, sampler):
+        with self._lock:
+            return sampler(self._rng)
+
+    def _chance(self, rate):
+        with self._lock:
+            return self._rng.random() < rate
+
+    def handle(self, method, path, headers, body):
+        """Returns (status, response dict, delay in seconds). headers has lower-case names."""
+        if not path.startswith(BASE_PATH):
+            if method == "GET" and path == STATS_PATH:
+                return 200, self.snapshot(), 0.0
+            return 404, {"message": "Not found"}, 0.0
+        path = path[len(BASE_PATH):].rstrip("/")
+
+        route = self._route(method, path)
+        if route is None:
+            return 404, {"message": "Not found"}, 0.0
+        op, handler, args = route
+        delay = self._sample(self.latency[op])
+        with self._lock:
+            self.stats[op] += 1
+
+        if not headers.get("x-api-key"):
+            with self._lock:
+                self.stats["unauthorized"] += 1
+            return 401, {"message": "Missing API key"}, delay
+        if self.error_rate and self._chance(self.error_rate):
+            with self._lock:
+                self.stats["errors_injected"] += 1
+            return 503, {"message": "Service temporarily unavailable (mock)"}, delay
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"message": "Request body must be JSON"}, delay
+        status, response = handler(*args, payload=payload if isinstance(payload, dict) else {}, headers=headers)
+        if status == 404:
+            with self._lock:
+                self.stats["not_found"] += 1
+        return status, response, delay
+
+    def _route(self, method, path):
+        if method == "POST":
+            if match := CREATE_PATH.match(path):
+                return "create", self._create, match.groups()
+            if match := PROCESS_PATH.match(path):
+                return "process", self._process, match.groups()
+        elif method == "GET":
+            if match := TERMINALS_PATH.match(path):
+                return "terminals", self._terminals, match.groups()
+            if match := DETAILS_PATH.match(path):
+                return "details", self._details, match.groups()
+        return None
+
+    def _create(self, mid, kind, payload, headers):
+        key = headers.get("idempotency-key")
+        with self._lock:
+            replayed = self._intents.get(self._idempotent.get((mid, key))) if key else None
+            if replayed is not None:
+                return 200, self._intent_response(replayed)
+            intent = {
+                "intentId": str(uuid.uuid4()),
+                "mid": mid,
+                "type": kind,
+                "status": "CREATED",
+                "amount": payload.get("subTotal", payload.get("amount")),
+                "merchantReference": payload.get("merchantReference"),
+                "parentIntentId": payload.get("parentIntentId"),
+                "postbackUrl": payload.get("postbackUrl"),
+                "createdAt": time.time(),
+            }
+            self._intents[intent["intentId"]] = intent
+            if key:
+                intent["idempotencyKey"] = (mid, key)
+                self._idempotent[(mid, key)] = intent["intentId"]
+            if len(self._intents) > MAX_INTENTS:
+                # Evicted intents take their idempotency key with them
+                evicted = self._intents.pop(next(iter(self._intents)))
+                self._idempotent.pop(evicted.get("idempotencyKey"), None)
+
+        # Non-pinpad refunds and reversals are completed by the gateway itself
+        if payload.get("isNonPinpadRefund") or payload.get("isNonPinpad"):
+            host = payload.get("transactionDetails") or {}
+            self._complete(intent, host.get("tid"))
+        return 200, self._intent_response(intent)
+
+    def _process(self, mid, intent_id, payload, headers):
+        with self._lock:
+            intent = self._intents.get(intent_id)
+            if intent is None or intent["mid"] != mid:
+                return 404, {"message": "Intent not found"}
+            if intent["status"] != "CREATED":
+                # Already processed: a retried call gets the same answer
+                return 200, {"intentId": intent_id, "status": "processing"}
+            # Claimed under the lock, so a racing retry can't schedule a second postback
+            intent["status"] = "PROCESSING"
+        self._complete(intent, payload.get("tid"))
+        return 200, {"intentId": intent_id, "status": "processing"}
+
+    def _complete(self, intent, tid):
+        """Settle an intent and schedule its postback."""
+        declined = self.decline_rate and self._chance(self.decline_rate)
+        with self._lock:
+            intent.update(
+                status="DECLINED" if declined else "APPROVED",
+                tid=tid,
+                transactionId=f"mock-{uuid.uuid4().hex[:12]}",
+                approvalCode=None if declined else f"{self._rng.randrange(1000000):06d}",
+            )
+        if intent["postbackUrl"]:
+            postback = {
+                "intentId": intent["intentId"],
+                "transactionId": intent["transactionId"],
+                "transactionType": intent["type"],
+                "status": intent["status"],
+                "terminalId": tid,
+                "merchantReference": intent["merchantReference"],
+                "amount": intent["amount"],
+                "currency": "AUD",
+            }
+            self.sender.schedule(intent["postbackUrl"], postback, self._sample(self.postback_delay))
+
+    def _details(self, mid, intent_id, payload, headers):
+        intent = self._intents.get(intent_id)
+        if intent is None or intent["mid"] != mid:
+            return 404, {"message": "Intent not found"}
+        response = self._intent_response(intent)
+        if intent.get("approvalCode"):
+            # Host details that non-pinpad refunds and reversals of this sale need
+            response["transactionDetails"] = {
+                "externalData": json.dumps(
+                    {
+                        "gatewayReferenceNumber": intent["transactionId"],
+                        "originalAmount": intent["amount"],
+                        "originalApprovalCode": intent["approvalCode"],
+                        "originalTransactionType": intent["type"],
+                        "hostMerchantId": mid,
+                        "hostTerminalId": intent.get("tid"),
+                    }
+                )
+            }
+        return 200, response
+
+    def _terminals(self, mid, payload, headers):
+        return 200, {
+            "merchantId": mid,
+            "terminals": [{"terminalId": f"MOCK{mid[-4:]}{n:02d}", "status": "ACTIVE"} for n in range(1, 4)],
+        }
+
+    @staticmethod
+    def _intent_response(intent):
+        return {key: intent[key] for key in ("intentId", "status", "amount", "merchantReference") if key in intent}
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, intents=len(self._intents), postbacks=dict(self.sender.stats))
+
+
+def create_wsgi_app(gateway=None):
+    """WSGI app serving a MockGateway (from the MOCK_* variables by default)."""
+    gateway = gateway or MockGateway.from_env()
+
+    def application(environ, start_response):
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+        headers = {
+            key[5:].replace("_", "-").lower(): value for key, value in environ.items() if key.startswith("HTTP_")
+        }
+        status, response, delay = gateway.handle(environ["REQUEST_METHOD"], environ.get("PATH_INFO", ""), headers, body)
+        if delay:
+            time.sleep(delay)
+        data = json.dumps(response).encode()
+        start_response(
+            f"{status} {'OK' if status < 400 else 'Error'}",
+            [("Content-Type", "application/json"), ("Content-Length", str(len(data)))],
+        )
+        return [data]
+
+    application.gateway = gateway
+    return application
+
+
+def create_asgi_app(gateway=None):
+    """ASGI app serving a MockGateway; delays are awaited on the event loop."""
+    gateway = gateway or MockGateway.from_env()
+
+    async def application(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                else:
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        status, response, delay = gateway.handle(scope["method"], scope["path"], headers, body)
+        if delay:
+            await asyncio.sleep(delay)
+        data = json.dumps(response).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": data})
+
+    application.gateway = gateway
+    return application
+
+
+@click.command("mock-gateway")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=None, type=int, help="Port (default: from MOCK_GATEWAY_URL, else 5055).")
+@click.option("--server", type=click.Choice(["wsgi", "asyncio"]), default="wsgi", show_default=True)
+@click.option("--latency", default=lambda: os.getenv("MOCK_LATENCY", "0"), help="Latency of every endpoint, in ms.")
+@click.option("--create-latency", default=None, help="Latency of intent creates.")
+@click.option("--process-latency", default=None, help="Latency of process calls.")
+@click.option("--details-latency", default=None, help="Latency of intent details lookups.")
+@click.option("--error-rate", default=lambda: float(os.getenv("MOCK_ERROR_RATE", "0")), type=float, help="Share of calls answered with 503.")
+@click.option("--decline-rate", default=lambda: float(os.getenv("MOCK_DECLINE_RATE", "0")), type=float, help="Share of transactions declined.")
+@click.option("--postback-delay", default=lambda: os.getenv("MOCK_POSTBACK_DELAY", "200"), help="Delay before each postback, in ms.")
+@click.option("--seed", default=None, type=int, help="Random seed, for repeatable runs.")
+def mock_gateway(host, port, server, latency, create_latency, process_latency, details_latency, error_rate, decline_rate, postback_delay, seed):
+    """Run a local mock Terminal Connect gateway."""
+    try:
+        gateway = MockGateway(
+            latency=latency,
+            latencies={
+                "create": create_latency or os.getenv("MOCK_LATENCY_CREATE"),
+                "process": process_latency or os.getenv("MOCK_LATENCY_PROCESS"),
+                "details": details_latency or os.getenv("MOCK_LATENCY_DETAILS"),
+                "terminals": os.getenv("MOCK_LATENCY_TERMINALS"),
+            },
+            error_rate=error_rate,
+            decline_rate=decline_rate,
+            postback_delay=postback_delay,
+            seed=seed,
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    port = port or urlsplit(os.getenv("MOCK_GATEWAY_URL", "")).port or 5055
+    click.echo(f"Mock gateway ({server}) on http://{host}:{port}{BASE_PATH}")
+
+    if server == "asyncio":
+        import uvicorn
+
+        uvicorn.run(create_asgi_app(gateway), host=host, port=port, log_level="warning")
+    else:
+        from werkzeug.serving import run_simple
+
+        run_simple(host, port, create_wsgi_app(gateway), threaded=True)
+
+
+if __name__ == "__main__":
+    mock_gateway()
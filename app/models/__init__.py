@@ -3,7 +3,7 @@ import bcrypt
 import secrets
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, Integer, DateTime, Boolean, ForeignKey, func
+from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Index, func
 from typing import List, Optional
 
 
@@ -237,6 +237,10 @@ class UserConfig(db.Model):
 
 class UserPostback(db.Model):
     __tablename__ = "user_postbacks"
+    __table_args__ = (
+        # Serves keyset pagination (newest first) and oldest-first retention trims
+        Index("ix_user_postbacks_user_created", "user_id", db.desc("created_at"), "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(
@@ -247,9 +251,13 @@ class UserPostback(db.Model):
     )  # 'sale', 'refund', 'reversal'
     transaction_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, index=True)
     intent_id: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
-    amount: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
-    currency: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    amount: Mapped[Optional[str]] = mapped_column(String(20), nullable=True, index=True)
+    currency: Mapped[Optional[str]] = mapped_column(String(10), nullable=True, index=True)
     status: Mapped[str] = mapped_column(String(50), nullable=False)
+    # Denormalized from the payload at ingest so lists/searches skip the JSON
+    terminal_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, index=True)
+    payload_status: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, index=True)
+    merchant_reference: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, index=True)
     postback_data: Mapped[str] = mapped_column(Text, nullable=False)  # JSON string
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=utc_now, nullable=False
@@ -269,6 +277,66 @@ class UserPostback(db.Model):
             "amount": self.amount,
             "currency": self.currency,
             "status": self.status,
+            "terminal_id": self.terminal_id,
+            "payload_status": self.payload_status,
+            "merchant_reference": self.merchant_reference,
             "postback_data": self.postback_data,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
+
+
+class OutboundIntent(db.Model):
+    """An intent this app created, joined to its postback for latency reporting."""
+
+    __tablename__ = "outbound_intents"
+    __table_args__ = (
+        # Serves the per-environment/TID latency report over a time window
+        Index("ix_outbound_intents_env_tid_created", "environment", "tid", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    intent_id: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
+    # Owner: the logged-in user, or the guest session's token digest
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    guest_key: Mapped[Optional[str]] = mapped_column(String(16), nullable=True, index=True)
+    environment: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    mid: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    tid: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    transaction_type: Mapped[str] = mapped_column(
+        String(50), nullable=False
+    )  # 'sale', 'unlinked_refund', 'linked_refund', 'reversal'
+    amount: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # cents
+    merchant_reference: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    requested_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # create call sent
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)  # create call returned
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    postback_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    postback_status: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    # Latencies in seconds: create and process calls, postback arrival after
+    # processing (or creation, for intents the gateway completes), and the
+    # whole create -> postback span
+    create_latency: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    process_latency: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    postback_latency: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    end_to_end_latency: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    def to_dict(self) -> dict:
+        """Convert the ledger entry to a dictionary for API responses."""
+        return {
+            "intent_id": self.intent_id,
+            "environment": self.environment,
+            "mid": self.mid,
+            "tid": self.tid,
+            "transaction_type": self.transaction_type,
+            "amount": self.amount,
+            "merchant_reference": self.merchant_reference,
+            "requested_at": self.requested_at.isoformat() if self.requested_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "processed_at": self.processed_at.isoformat() if self.processed_at else None,
+            "postback_at": self.postback_at.isoformat() if self.postback_at else None,
+            "postback_status": self.postback_status,
+            "create_latency": self.create_latency,
+            "process_latency": self.process_latency,
+            "postback_latency": self.postback_latency,
+            "end_to_end_latency": self.end_to_end_latency,
+        }
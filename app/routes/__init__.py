@@ -2,6 +2,8 @@ from .config import bp as config_bp
 from .sales import bp as sales_bp
 from .refunds import bp as refunds_bp
 from .reversals import bp as reversals_bp
+from .batch import bp as batch_bp
+from .latency import bp as latency_bp
 from .postbacks import bp as postbacks_bp
 from .auth import auth_bp
 from .admin import admin_bp
@@ -15,6 +17,8 @@ def init_app(app):
     app.register_blueprint(sales_bp)
     app.register_blueprint(refunds_bp)
     app.register_blueprint(reversals_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(latency_bp)
     app.register_blueprint(postbacks_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError
 from ..models import db, User, Invite, UserConfig, UserPostback
 from ..utils.auth import admin_required
+from ..utils.intent_ledger import MAX_REPORT_HOURS, latency_report
 from ..schemas import InviteUserSchema, UpdateUserSchema, UpdateInviteSchema
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/api/admin")
@@ -512,3 +513,89 @@ def get_admin_stats(admin_user):
             jsonify({"message": "Failed to fetch statistics", "error": "stats_failed"}),
             500,
         )
+
+
+# Metrics Routes
+@admin_bp.route("/metrics/postback-delays", methods=["GET"])
+@admin_required
+def get_postback_delay_metrics(admin_user):
+    """Get counters for delayed postback responses in this worker."""
+    engine = current_app.extensions["deferred_responses"]
+    return jsonify({"postback_delays": engine.snapshot()}), 200
+
+
+@admin_bp.route("/metrics/http-pool", methods=["GET"])
+@admin_required
+def get_http_pool_metrics(admin_user):
+    """Get outbound connection pool counters for this worker."""
+    return jsonify({"http_pool": current_app.extensions["http_client"].stats()}), 200
+
+
+@admin_bp.route("/metrics/api-retries", methods=["GET"])
+@admin_required
+def get_api_retry_metrics(admin_user):
+    """Get retry counters for outbound API calls in this worker, per environment."""
+    return jsonify({"api_retries": current_app.extensions["api_retries"].stats()}), 200
+
+
+@admin_bp.route("/metrics/intent-cache", methods=["GET"])
+@admin_required
+def get_intent_cache_metrics(admin_user):
+    """Get hit/miss counters of the intent details cache in this worker."""
+    return jsonify({"intent_cache": current_app.extensions["intent_details_cache"].snapshot()}), 200
+
+
+@admin_bp.route("/metrics/intent-latency", methods=["GET"])
+@admin_required
+def get_intent_latency_metrics(admin_user):
+    """Get the create -> postback latency report across all users, plus this worker's ledger counters."""
+    hours = min(max(request.args.get("hours", 24, type=int) or 24, 1), MAX_REPORT_HOURS)
+    report = latency_report(
+        hours=hours,
+        environment=request.args.get("environment") or None,
+        tid=request.args.get("tid") or None,
+        limit=current_app.extensions["intent_ledger"].report_limit,
+    )
+    return jsonify({"intent_latency": report, "ledger": current_app.extensions["intent_ledger"].snapshot()}), 200
+
+
+@admin_bp.route("/metrics/transaction-jobs", methods=["GET"])
+@admin_required
+def get_transaction_job_metrics(admin_user):
+    """Get counters of background transaction jobs in this worker (null unless TRANSACTION_MODE=jobs)."""
+    jobs = current_app.extensions.get("transaction_jobs")
+    return jsonify({"transaction_jobs": jobs.snapshot() if jobs is not None else None}), 200
+
+
+@admin_bp.route("/metrics/outbound-calls", methods=["GET"])
+@admin_required
+def get_outbound_call_metrics(admin_user):
+    """Get latency percentiles of outbound API calls in this worker (?format=prometheus for histograms)."""
+    metrics = current_app.extensions["outbound_metrics"]
+    if request.args.get("format") == "prometheus":
+        return Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+    return jsonify({"outbound_calls": metrics.snapshot()}), 200
+
+
+@admin_bp.route("/metrics/api-timeouts", methods=["GET"])
+@admin_required
+def get_api_timeout_metrics(admin_user):
+    """Get the current adaptive timeout of each outbound API endpoint in this worker."""
+    return jsonify({"api_timeouts": current_app.extensions["api_timeouts"].snapshot()}), 200
+
+
+# Circuit Breaker Routes
+@admin_bp.route("/circuit-breakers", methods=["GET"])
+@admin_required
+def get_circuit_breakers(admin_user):
+    """Get the state of each gateway circuit breaker in this worker."""
+    return jsonify({"circuit_breakers": current_app.extensions["circuit_breakers"].snapshot()}), 200
+
+
+@admin_bp.route("/circuit-breakers/reset", methods=["POST"])
+@admin_required
+def reset_circuit_breakers(admin_user):
+    """Close a gateway's circuit breaker (or all of them, without a base_url) in this worker."""
+    data = request.get_json(silent=True) or {}
+    reset = current_app.extensions["circuit_breakers"].reset(data.get("base_url"))
+    return jsonify({"message": f"Reset {reset} circuit breaker(s)", "reset": reset}), 200
@@ -0,0 +1,180 @@
+from decimal import Decimal
+
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+
+from ..utils.batch import BatchRun, session_snapshot
+from ..utils.helpers import generate_merchant_reference, get_guest_token, is_charge_anywhere_tid
+from ..utils.scenarios import ScenarioRun, parse_scenario, postback_owner
+from ..utils.transactions import LINKED_TYPES, REVERSAL, TRANSACTION_TYPES
+from ..utils.validation import ensure_config_session, is_valid_uuid, validate_amount, validate_config
+from .user import login_required
+
+bp = Blueprint("batch", __name__)
+
+BUSY_MESSAGE = "Too many batches are running. Please try again when one finishes."
+
+
+def _owner():
+    """Batches are only visible to the user or guest session that started them."""
+    return session.get("user_id") or get_guest_token()
+
+
+def _int_field(name, default):
+    try:
+        return int(request.form.get(name) or default)
+    except ValueError:
+        return None
+
+
+@bp.route("/batch", methods=["GET", "POST"])
+@login_required
+def batch():
+    runner = current_app.extensions["batch_runner"]
+
+    if request.method == "POST":
+        ensure_config_session()
+        if not validate_config():
+            return redirect(url_for("config.config"))
+
+        kind = request.form.get("type")
+        if kind not in TRANSACTION_TYPES:
+            flash("Choose a transaction type", "danger")
+            return redirect(url_for("batch.batch"))
+
+        count = _int_field("count", 1)
+        concurrency = _int_field("concurrency", 1)
+        if count is None or concurrency is None:
+            flash("Count and concurrency must be whole numbers", "danger")
+            return redirect(url_for("batch.batch"))
+        try:
+            rate = float(request.form.get("rate") or 0) or None
+        except ValueError:
+            flash("Rate must be a number", "danger")
+            return redirect(url_for("batch.batch"))
+        limit_error = runner.check_limits(count, concurrency, rate)
+        if limit_error:
+            flash(limit_error, "danger")
+            return redirect(url_for("batch.batch"))
+
+        amount = None
+        if kind != REVERSAL:
+            amount_str = request.form.get("amount", "")
+            is_valid, error = validate_amount(amount_str)
+            if not is_valid:
+                flash(error, "danger")
+                return redirect(url_for("batch.batch"))
+            amount = Decimal(amount_str)
+
+        parent_intent_ids = []
+        if kind in LINKED_TYPES:
+            parent_intent_ids = request.form.get("parent_intent_ids", "").split()
+            if not parent_intent_ids:
+                flash("At least one Original Sale Reference is required", "danger")
+                return redirect(url_for("batch.batch"))
+            if not all(is_valid_uuid(intent_id) for intent_id in parent_intent_ids):
+                flash("Original Sale References must be valid UUID v4s", "danger")
+                return redirect(url_for("batch.batch"))
+
+        run = BatchRun(
+            kind,
+            count,
+            concurrency=concurrency,
+            rate=rate,
+            amount=amount,
+            parent_intent_ids=parent_intent_ids,
+            via_pinpad=request.form.get("via_pinpad") == "yes",
+            reference_prefix=request.form.get("merchant_reference") or None,
+            owner=_owner(),
+        )
+        config = session_snapshot()
+        # Attributes the batch's intents to this session in the intent ledger
+        config.update(postback_owner())
+        if runner.start(run, config) is None:
+            flash(BUSY_MESSAGE, "warning")
+            return redirect(url_for("batch.batch"))
+        flash(f"Started batch {run.id}: {count} x {kind.replace('_', ' ')}", "success")
+        return redirect(url_for("batch.batch_run", run_id=run.id))
+
+    return render_template(
+        "batch.html",
+        runs=[run.report() for run in runner.runs(_owner())],
+        default_merchant_reference=generate_merchant_reference(),
+        show_pinpad_options=is_charge_anywhere_tid(session.get("TID", "")),
+        max_transactions=runner.max_transactions,
+        max_concurrency=runner.max_concurrency,
+    )
+
+
+@bp.route("/batch/scenario", methods=["GET", "POST"])
+@login_required
+def scenario():
+    runner = current_app.extensions["batch_runner"]
+    scenario_text = ""
+
+    if request.method == "POST":
+        ensure_config_session()
+        if not validate_config():
+            return redirect(url_for("config.config"))
+
+        uploaded = request.files.get("scenario_file")
+        if uploaded and uploaded.filename:
+            scenario_text = uploaded.read().decode("utf-8", errors="replace")
+        else:
+            scenario_text = request.form.get("scenario", "")
+
+        parsed, error = parse_scenario(scenario_text, runner.max_transactions, runner.max_concurrency)
+        if error:
+            flash(error, "danger")
+        else:
+            run = ScenarioRun(parsed, owner=_owner())
+            config = session_snapshot()
+            config.update(postback_owner())
+            if runner.start(run, config) is None:
+                flash(BUSY_MESSAGE, "warning")
+                return render_template("scenario.html", scenario_text=scenario_text)
+            flash(f"Started scenario {parsed['name']} ({run.id}): {run.count} instances", "success")
+            return redirect(url_for("batch.batch_run", run_id=run.id))
+
+    return render_template("scenario.html", scenario_text=scenario_text)
+
+
+@bp.route("/batch/<run_id>", methods=["GET"])
+@login_required
+def batch_run(run_id):
+    run = current_app.extensions["batch_runner"].get(run_id, _owner())
+    if run is None:
+        flash("Batch not found", "warning")
+        return redirect(url_for("batch.batch"))
+    template = "scenario_run.html" if isinstance(run, ScenarioRun) else "batch_run.html"
+    return render_template(template, report=run.report())
+
+
+@bp.route("/batch/<run_id>/report", methods=["GET"])
+@login_required
+def batch_report(run_id):
+    run = current_app.extensions["batch_runner"].get(run_id, _owner())
+    if run is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(run.report()), 200
+
+
+@bp.route("/batch/<run_id>/cancel", methods=["POST"])
+@login_required
+def cancel_batch(run_id):
+    run = current_app.extensions["batch_runner"].get(run_id, _owner())
+    if run is None:
+        flash("Batch not found", "warning")
+        return redirect(url_for("batch.batch"))
+    run.cancel()
+    flash(f"Cancelling batch {run_id}; transactions in flight will finish", "info")
+    return redirect(url_for("batch.batch_run", run_id=run_id))
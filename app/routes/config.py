@@ -14,6 +14,7 @@ from flask import (
 from ..utils.api import ENVIRONMENT_URLS
 from ..utils.validation import validate_url
 from ..utils.auth import optional_jwt_user
+from ..utils.helpers import guest_postback_url
 from ..models import db, UserConfig, User
 
 
@@ -93,8 +94,8 @@ def config(user):
                     "postbacks.postback", user_id=session["user_id"], _external=True
                 )
             else:
-                # Generic postback URL for guests
-                postback_url = url_for("postbacks.postback", _external=True)
+                # Postback URL scoped to this guest session
+                postback_url = guest_postback_url()
         
         # Append delay query parameter if delay is configured
         if postback_delay > 0:
@@ -179,8 +180,8 @@ def config(user):
                 "postbacks.postback", user_id=session["user_id"], _external=True
             )
         else:
-            # Generic postback URL for guests
-            postback_url = url_for("postbacks.postback", _external=True)
+            # Postback URL scoped to this guest session
+            postback_url = guest_postback_url()
     return render_template(
         "config.html",
         environment=session.get("ENVIRONMENT", defaults["ENVIRONMENT"]),
@@ -298,8 +299,8 @@ def update_config(user, config_id):
                 "postbacks.postback", user_id=session["user_id"], _external=True
             )
         else:
-            # Generic postback URL for guests
-            postback_url = url_for("postbacks.postback", _external=True)
+            # Postback URL scoped to this guest session
+            postback_url = guest_postback_url()
     
     # Append delay query parameter if delay is configured
     if postback_delay > 0:
@@ -0,0 +1,48 @@
+from flask import Blueprint, current_app, jsonify, render_template, request, session
+
+from ..utils.auth import optional_jwt_user
+from ..utils.guest_store import token_key
+from ..utils.intent_ledger import MAX_REPORT_HOURS, latency_report
+from .user import login_required
+
+bp = Blueprint("latency", __name__)
+
+
+def _report_filters():
+    """Window and environment/TID filters from the query string."""
+    hours = request.args.get("hours", 24, type=int) or 24
+    return {
+        "hours": min(max(hours, 1), MAX_REPORT_HOURS),
+        "environment": request.args.get("environment", "").strip() or None,
+        "tid": request.args.get("tid", "").strip() or None,
+        "limit": current_app.extensions["intent_ledger"].report_limit,
+    }
+
+
+def _session_owner():
+    """The logged-in user's or guest session's ledger scope, or None without either."""
+    if session.get("user_id"):
+        return {"user_id": session["user_id"]}
+    if session.get("guest_token"):
+        return {"guest_key": token_key(session["guest_token"])}
+    return None
+
+
+@bp.route("/latency", methods=["GET"])
+@login_required
+def latency():
+    """Create -> process -> postback latency of this session's intents, per environment and TID."""
+    filters = _report_filters()
+    owner = _session_owner()
+    report = latency_report(**filters, **owner) if owner else None
+    return render_template("latency.html", report=report, filters=filters)
+
+
+@bp.route("/api/latency", methods=["GET"])
+@optional_jwt_user
+def api_latency(user):
+    """The latency report as JSON, for the authenticated user or the guest session."""
+    owner = {"user_id": user.id} if user else _session_owner()
+    if owner is None:
+        return jsonify({"error": "Authentication required"}), 401
+    return jsonify(latency_report(**_report_filters(), **owner))
@@ -1,62 +1,35 @@
 import json
 import datetime
-import os
 import time
 import logging
-import threading
-import queue
-import asyncio
-from flask import Blueprint, request, jsonify, render_template, current_app, session
+from flask import Blueprint, Response, request, jsonify, render_template, current_app, session, url_for
+from sqlalchemy.orm import load_only
 from ..utils.auth import optional_jwt_user
+from ..utils.deferred import parse_delay
+from ..utils.helpers import extract_postback_fields, get_guest_token
+from ..utils.guest_store import PUBLIC_KEY, token_key
+from ..utils.pagination import keyset_paginate
+from ..utils.postback_events import (
+    guest_channel,
+    guest_postback_event,
+    postback_event,
+    user_channel,
+)
+from ..utils.postback_search import search_filter
+from ..utils.postback_wait import (
+    MAX_WAIT_INTENTS,
+    WAIT_CHANNEL_HEADER,
+    IntentWaiter,
+    find_intent_postbacks,
+    parse_intent_ids,
+    parse_wait_timeout,
+    wait_result,
+)
 from ..models import db
-from ..models import UserPostback, User, UserConfig
+from ..models import UserPostback, User, UserConfig, utc_now
 
 bp = Blueprint("postbacks", __name__)
 
-# --- Guest User Postback Helpers (File-based) ---
-
-
-def clear_guest_postbacks_if_new_day():
-    today = datetime.date.today().isoformat()
-    postbacks_file = current_app.config["POSTBACKS_FILE"]
-    meta_file = postbacks_file + ".meta"
-    os.makedirs(os.path.dirname(postbacks_file), exist_ok=True)
-    last_day = None
-    if os.path.exists(meta_file):
-        try:
-            with open(meta_file, "r") as f:
-                last_day = f.read().strip()
-        except Exception:
-            last_day = None
-    if last_day != today:
-        try:
-            with open(postbacks_file, "w") as f:
-                json.dump([], f)
-            with open(meta_file, "w") as f:
-                f.write(today)
-        except Exception:
-            pass
-
-
-def load_guest_postbacks():
-    clear_guest_postbacks_if_new_day()
-    postbacks_file = current_app.config["POSTBACKS_FILE"]
-    try:
-        if not os.path.exists(postbacks_file):
-            return []
-        with open(postbacks_file, "r") as f:
-            data = f.read().strip()
-            return json.loads(data) if data else []
-    except Exception:
-        return []
-
-
-def save_guest_postbacks(postbacks):
-    postbacks_file = current_app.config["POSTBACKS_FILE"]
-    with open(postbacks_file, "w") as f:
-        json.dump(postbacks, f)
-
-
 # --- General Helpers ---
 
 
@@ -93,13 +66,61 @@ def get_transaction_type(postback_data):
     return "N/A"
 
 
+def build_postback_row(user_id, postback_data, headers):
+    """Build the UserPostback column values for an incoming postback."""
+    return {
+        "user_id": user_id,
+        "transaction_type": get_transaction_type(postback_data),
+        "transaction_id": postback_data.get("transactionId") if postback_data.get("transactionId") else None,
+        "intent_id": postback_data.get("intentId", "unknown_intent"),
+        "status": "received",
+        "postback_data": json.dumps(
+            {
+                "payload": postback_data,
+                "headers": mask_headers(headers),
+            }
+        ),
+        "created_at": utc_now(),
+        **extract_postback_fields(postback_data),
+    }
+
+
+# Columns needed to render a row of the postbacks list
+SUMMARY_COLUMNS = (
+    UserPostback.id,
+    UserPostback.created_at,
+    UserPostback.transaction_type,
+    UserPostback.transaction_id,
+    UserPostback.intent_id,
+    UserPostback.payload_status,
+    UserPostback.terminal_id,
+    UserPostback.merchant_reference,
+)
+
+
+def user_postbacks_query(user_id, search_query=""):
+    """Query a user's postbacks, optionally filtered by a search string."""
+    query = UserPostback.query.filter_by(user_id=user_id)
+    if search_query:
+        # Indexed search over the ID columns; the JSON blob is never scanned
+        query = query.filter(search_filter(search_query))
+    return query
+
+
+def cached_postback_total(user_id, search_query, query):
+    """Total rows for a user's (searched) postbacks, cached briefly per process."""
+    counts = current_app.extensions["postback_counts"]
+    return counts.get_or_compute(user_id, search_query, query.count)
+
+
 # --- Routes ---
 
 
 @bp.route("/postback", methods=["POST"])
 @bp.route("/postback/<int:user_id>", methods=["POST"])
+@bp.route("/postback/guest/<guest_token>", methods=["POST"])
 @optional_jwt_user
-def postback(user=None, user_id=None):
+def postback(user=None, user_id=None, guest_token=None):
     """Handle incoming postback messages from Terminal Connect"""
     logger = logging.getLogger(__name__)
     postback_data = request.get_json()
@@ -107,10 +128,11 @@ def postback(user=None, user_id=None):
 
     # Determine user_id from multiple sources (priority order):
     # 1. URL parameter (for user-specific postback URLs)
-    # 2. JWT authenticated user
-    # 3. Session authenticated user
-    if user_id:
-        # URL parameter takes precedence (user-specific postback URL)
+    # 2. Guest token in the URL (guest postback URLs)
+    # 3. JWT authenticated user
+    # 4. Session authenticated user
+    if user_id or guest_token:
+        # URL parameters take precedence (user- or guest-specific postback URL)
         pass
     elif user:  # JWT authenticated user
         user_id = user.id
@@ -121,34 +143,24 @@ def postback(user=None, user_id=None):
 
     if user_id:
         # Logged-in user: save to database
-        count = UserPostback.query.filter_by(user_id=user_id).count()
-        if count >= 10000:
-            # Overwrite the oldest postback
-            oldest = (
-                UserPostback.query.filter_by(user_id=user_id)
-                .order_by(UserPostback.created_at.asc())
-                .first()
+        row = build_postback_row(user_id, postback_data, dict(request.headers))
+        writer = current_app.extensions.get("postback_writer")
+        if writer is not None:
+            # Batched ingest: the background writer inserts the row
+            writer.enqueue(row)
+        else:
+            stored = UserPostback(**row)
+            db.session.add(stored)
+            db.session.commit()
+            # Overflow beyond the per-user cap is trimmed by the retention job
+            current_app.extensions["postback_retention"].note_ingest(user_id)
+            current_app.extensions["postback_counts"].invalidate(user_id)
+            current_app.extensions["postback_events"].publish(
+                user_channel(user_id), postback_event(row, stored.id)
             )
-            if oldest:
-                db.session.delete(oldest)
-
-        new_postback = UserPostback(
-            user_id=user_id,
-            transaction_type=get_transaction_type(postback_data),
-            transaction_id=postback_data.get("transactionId") if postback_data.get("transactionId") else None,
-            intent_id=postback_data.get("intentId", "unknown_intent"),
-            status="received",
-            postback_data=json.dumps(
-                {
-                    "payload": postback_data,
-                    "headers": mask_headers(dict(request.headers)),
-                }
-            ),
-        )
-        db.session.add(new_postback)
-        db.session.commit()
     else:
-        # Guest user: save to file
+        # Guest user: save to the guest's shard of the guest store
+        guest_token = guest_token or session.get("guest_token")
         record = {
             "payload": postback_data,
             "received_at": datetime.datetime.now(datetime.UTC)
@@ -157,52 +169,35 @@ def postback(user=None, user_id=None):
             .replace("+00:00", "Z"),
             "headers": mask_headers(dict(request.headers)),
         }
-        postbacks = load_guest_postbacks()
-        postbacks.append(record)
-        if len(postbacks) > 50:
-            postbacks = postbacks[-50:]
-        save_guest_postbacks(postbacks)
+        current_app.extensions["guest_postbacks"].append(record, guest_token)
+        current_app.extensions["postback_events"].publish(
+            guest_channel(token_key(guest_token)), guest_postback_event(record)
+        )
+
+    # Join to the outbound intent, if this app created it, for latency reporting
+    current_app.extensions["intent_ledger"].record_postback(
+        postback_data.get("intentId"), postback_data.get("status")
+    )
 
     # Apply postback delay if configured via URL query parameter
-    logger = logging.getLogger(__name__)
-    delay_seconds = 0
-    
-    # Get delay from URL query parameter
     delay_param = request.args.get('delay', '0')
     logger.info(f"Postback delay processing started. delay param from URL: '{delay_param}'")
-    
-    try:
-        delay_seconds = int(delay_param) if delay_param else 0
-        logger.info(f"Parsed delay from URL: {delay_seconds} seconds")
-        
-        # Validate delay range
-        if delay_seconds < 0 or delay_seconds > 600:
-            logger.warning(f"Invalid delay value {delay_seconds}, must be 0-600. Using 0.")
-            delay_seconds = 0
-            
-    except ValueError:
-        logger.error(f"Invalid delay parameter '{delay_param}', must be numeric. Using 0.")
-        delay_seconds = 0
-    
-    # Apply delay if configured and valid
+    delay_seconds = parse_delay(delay_param)
+
+    # Apply delay if configured and valid. This holds the request thread; the
+    # ASGI entry point (app/asgi.py) parks delayed responses on its event loop
+    # instead and strips the delay parameter before the route sees it.
     if delay_seconds > 0:
-        logger.info(f"Applying non-blocking delay of {delay_seconds} seconds...")
-        
-        # Use a threading approach to avoid blocking the main thread
-        # Create a queue to wait for completion  
-        delay_queue = queue.Queue()
-        
-        def delayed_completion():
-            time.sleep(delay_seconds)
-            delay_queue.put("completed")
-        
-        # Start the delay in a separate thread
-        delay_thread = threading.Thread(target=delayed_completion)
-        delay_thread.start()
-        
-        # Wait for completion (this blocks this request but not others)
-        delay_queue.get()
-        logger.info(f"Non-blocking delay completed: {delay_seconds} seconds")
+        engine = current_app.extensions["deferred_responses"]
+        if engine.try_acquire():
+            logger.info(f"Applying non-blocking delay of {delay_seconds} seconds...")
+            try:
+                time.sleep(delay_seconds)
+            finally:
+                engine.release()
+            logger.info(f"Non-blocking delay completed: {delay_seconds} seconds")
+        else:
+            logger.warning(f"Deferred postback cap reached; skipping {delay_seconds}s delay")
     else:
         logger.info(f"No delay applied (delay_seconds={delay_seconds})")
 
@@ -214,7 +209,7 @@ def postback(user=None, user_id=None):
 @optional_jwt_user
 def list_postbacks(user):
     """Display the list of received postbacks with pagination"""
-    # Get pagination and search parameters
+    # Get pagination and search parameters (page is only used for guests)
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
     search_query = request.args.get("search", "").strip()
@@ -252,40 +247,35 @@ def list_postbacks(user):
         }
         column_preferences = {**default_preferences, **column_preferences}
         
-        # Logged-in user: get postbacks from database with pagination
-        query = UserPostback.query.filter_by(user_id=user_id)
-        
-        # Add search functionality
-        if search_query:
-            # Search in intent_id, transaction_id, and postback_data (for terminal_id)
-            # Database-agnostic approach that works with both SQLite and PostgreSQL
-            search_filter = db.or_(
-                UserPostback.intent_id.ilike(f'%{search_query}%'),
-                UserPostback.transaction_id.ilike(f'%{search_query}%'),
-                # Simple string search in JSON data - works with both databases
-                UserPostback.postback_data.ilike(f'%{search_query}%')
-            )
-            query = query.filter(search_filter)
-        
-        pagination = (
-            query.order_by(UserPostback.created_at.desc())
-            .paginate(page=page, per_page=per_page, error_out=False)
+        # Logged-in user: keyset pagination over the database, newest first.
+        # Only the summary columns are loaded; postback_data stays in the DB.
+        query = user_postbacks_query(user_id, search_query).options(
+            load_only(*SUMMARY_COLUMNS)
+        )
+        pagination = keyset_paginate(
+            query,
+            UserPostback,
+            per_page,
+            cursor=request.args.get("cursor"),
+            total=cached_postback_total(user_id, search_query, query),
         )
 
         # Format for template
         postbacks = []
         for pb in pagination.items:
-            pb_data = json.loads(pb.postback_data)
             # Format time without microseconds
             formatted_time = pb.created_at.replace(microsecond=0).isoformat().replace("+00:00", "Z")
             postbacks.append(
                 {
-                    "payload": pb_data.get("payload"),
-                    "headers": pb_data.get("headers"),
+                    # Payload and headers are fetched on expand from the detail endpoint
+                    "detail_url": url_for("postbacks.postback_detail", postback_id=pb.id),
                     "received_at": formatted_time,
                     "transaction_type": pb.transaction_type,
                     "transaction_id": pb.transaction_id,
                     "intent_id": pb.intent_id,
+                    "payload_status": pb.payload_status,
+                    "terminal_id": pb.terminal_id,
+                    "merchant_reference": pb.merchant_reference,
                 }
             )
     else:
@@ -300,8 +290,10 @@ def list_postbacks(user):
             "reference": True
         }
         
-        # Guest user: get postbacks from file with manual pagination
-        all_postbacks = load_guest_postbacks()
+        # Guest user: the session's own postbacks plus any sent to the bare /postback URL,
+        # with manual pagination
+        guest_store = current_app.extensions["guest_postbacks"]
+        all_postbacks = guest_store.recent(get_guest_token()) + guest_store.recent()
         
         # Apply search filter for guest users
         if search_query:
@@ -339,6 +331,8 @@ def list_postbacks(user):
                 self.has_next = page < self.pages
                 self.prev_num = page - 1 if self.has_prev else None
                 self.next_num = page + 1 if self.has_next else None
+                self.prev_params = {"page": self.prev_num}
+                self.next_params = {"page": self.next_num}
                 self.items = postbacks
 
         pagination = SimplePagination(page, per_page, total)
@@ -346,6 +340,71 @@ def list_postbacks(user):
     return render_template("postbacks.html", postbacks=postbacks, pagination=pagination, column_preferences=column_preferences, user_id=user_id)
 
 
+@bp.route("/postbacks/<int:postback_id>/detail", methods=["GET"])
+@optional_jwt_user
+def postback_detail(user, postback_id):
+    """Return the payload and masked headers of one of the user's postbacks."""
+    user_id = user.id if user else session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    postback = UserPostback.query.filter_by(id=postback_id, user_id=user_id).first()
+    if not postback:
+        return jsonify({"error": "Postback not found"}), 404
+
+    try:
+        data = json.loads(postback.postback_data)
+    except ValueError:
+        data = {}
+    return jsonify({"payload": data.get("payload"), "headers": data.get("headers")})
+
+
+@bp.route("/postbacks/stream", methods=["GET"])
+@optional_jwt_user
+def stream_postbacks(user):
+    """Server-Sent Events stream of postbacks as they are ingested."""
+    user_id = user.id if user else session.get("user_id")
+    if user_id:
+        channels = [user_channel(user_id)]
+    else:
+        channels = [guest_channel(token_key(get_guest_token())), guest_channel(PUBLIC_KEY)]
+
+    # Each open stream holds a worker thread, so only a few may be open at once
+    streams = current_app.extensions["postback_streams"]
+    if not streams.acquire(blocking=False):
+        return jsonify({"error": "Too many open postback streams"}), 503
+    bus = current_app.extensions["postback_events"]
+    # Subscribe before responding so nothing ingested in between is missed
+    subscription = bus.subscribe(*channels)
+    if subscription is None:
+        streams.release()
+        return jsonify({"error": "Too many open postback streams"}), 503
+    heartbeat = current_app.config["POSTBACK_STREAM_HEARTBEAT"]
+
+    def generate():
+        yield "retry: 3000\n\n"
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id = f"id: {event['id']}\n" if event.get("id") else ""
+            yield f"{event_id}event: postback\ndata: {json.dumps(event)}\n\n"
+
+    def close():
+        bus.unsubscribe(subscription)
+        streams.release()
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Also runs if the client goes away before the stream starts
+    response.call_on_close(close)
+    return response
+
+
 @bp.route("/postbacks/column-preferences", methods=["POST"])
 @optional_jwt_user
 def save_column_preferences(user):
@@ -371,3 +430,79 @@ def save_column_preferences(user):
             return jsonify({"error": "User not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/api/postbacks", methods=["GET"])
+@optional_jwt_user
+def api_list_postbacks(user):
+    """List the authenticated user's postbacks as JSON with cursor pagination."""
+    user_id = user.id if user else session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), 100)
+    search_query = request.args.get("search", "").strip()
+    include_total = request.args.get("include_total", "false").lower() in ["true", "1", "yes"]
+
+    query = user_postbacks_query(user_id, search_query)
+    pagination = keyset_paginate(
+        query,
+        UserPostback,
+        per_page,
+        cursor=request.args.get("cursor"),
+        total=cached_postback_total(user_id, search_query, query) if include_total else None,
+    )
+    return jsonify(
+        {
+            "postbacks": [pb.to_dict() for pb in pagination.items],
+            "pagination": pagination.to_dict(),
+        }
+    )
+
+
+@bp.route("/api/postbacks/wait", methods=["GET"])
+@optional_jwt_user
+def api_wait_for_postbacks(user):
+    """Long-poll until postbacks for the given intents are stored, or the timeout passes."""
+    user_id = user.id if user else session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    intent_ids = parse_intent_ids(request.args)
+    if not intent_ids:
+        return jsonify({"error": "intent_id is required"}), 400
+    if len(intent_ids) > MAX_WAIT_INTENTS:
+        return jsonify({"error": f"At most {MAX_WAIT_INTENTS} intent IDs can be waited on"}), 400
+    mode = request.args.get("mode", "all").lower()
+    if mode not in ("all", "any"):
+        return jsonify({"error": "mode must be 'all' or 'any'"}), 400
+    timeout = parse_wait_timeout(request.args.get("timeout"), current_app.config["POSTBACK_WAIT_MAX_TIMEOUT"])
+    poll_interval = current_app.config["POSTBACK_WAIT_POLL_INTERVAL"]
+
+    channel = user_channel(user_id)
+    bus = current_app.extensions["postback_events"]
+    # Subscribe before the first check so a postback stored in between still wakes us
+    waiter = bus.subscribe(subscription=IntentWaiter(channel, intent_ids)) if timeout > 0 else None
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            result = wait_result(find_intent_postbacks(user_id, intent_ids), intent_ids, mode)
+            remaining = deadline - time.monotonic()
+            if result["complete"] or remaining <= 0:
+                break
+            # Don't hold a database connection while waiting
+            db.session.rollback()
+            # Re-check now and then in case the notification never reaches us;
+            # without a subscription (subscriber cap reached) just poll
+            if waiter is not None:
+                waiter.wait(min(remaining, poll_interval))
+            else:
+                time.sleep(min(remaining, poll_interval))
+    finally:
+        if waiter is not None:
+            bus.unsubscribe(waiter)
+
+    response = jsonify(result)
+    # Lets the ASGI layer subscribe to the same channel when it waits instead
+    response.headers[WAIT_CHANNEL_HEADER] = channel
+    return response
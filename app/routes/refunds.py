@@ -1,10 +1,9 @@
-import json
 from decimal import Decimal
 
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 
-from ..utils.api import make_api_request, process_intent
-from ..utils.helpers import generate_merchant_reference, is_charge_anywhere_tid, get_postback_url
+from ..utils.helpers import generate_merchant_reference, is_charge_anywhere_tid
+from ..utils.transactions import LINKED_REFUND, UNLINKED_REFUND, flash_transaction_result, run_transaction
 from ..utils.validation import validate_amount, validate_config, is_valid_uuid, ensure_config_session
 from .user import login_required
 
@@ -35,29 +34,9 @@ def unlinked_refund():
             flash("Merchant reference is required", "danger")
             return redirect(url_for("refunds.unlinked_refund"))
 
-        # First API call to create refund intent
-        endpoint = f"/merchant/{session['MID']}/intent/refund"
-        payload = {
-            "amount": int(amount * 100),
-            "merchantReference": merchant_reference,
-            "postbackUrl": get_postback_url(),
-        }
-
-        response_data, error = make_api_request(endpoint, payload=payload)
-
-        if error:
-            flash(f"Error creating refund intent: {error}", "danger")
-            return redirect(url_for("refunds.unlinked_refund"))
-
-        # Second API call to process the intent
-        intent_id = response_data["intentId"]
-        _, process_error = process_intent(intent_id)
-        if process_error:
-            flash(
-                f"Process failed for Intent ID {intent_id}: {process_error}", "danger"
-            )
-        else:
-            flash(f"Successfully processed Intent ID: {intent_id}", "success")
+        # Create the refund intent, then process it on the TID
+        result = run_transaction(UNLINKED_REFUND, merchant_reference, amount=amount)
+        flash_transaction_result(UNLINKED_REFUND, result)
         return redirect(url_for("refunds.unlinked_refund"))
 
     return render_template(
@@ -106,77 +85,16 @@ def linked_refund():
         # Check if via_pinpad option is selected (only relevant for Charge Anywhere TIDs)
         via_pinpad = show_pinpad_options and request.form.get("via_pinpad") == "yes"
 
-        # First API call to create refund intent
-        endpoint = f"/merchant/{session['MID']}/intent/refund"
-        payload = {
-            "amount": int(amount * 100),
-            "merchantReference": merchant_reference,
-            "parentIntentId": parent_intent_id,
-            "postbackUrl": get_postback_url(),
-        }
-
-        # Only handle non-pinpad logic if pinpad options are shown and via_pinpad is not selected
-        if show_pinpad_options and not via_pinpad:
-            # Get transaction details for the parent intent
-            details_endpoint = f"/merchant/{session['MID']}/intent/{parent_intent_id}"
-            details_data, details_error = make_api_request(
-                details_endpoint, method="GET"
-            )
-
-            if details_error:
-                flash(f"Error getting transaction details: {details_error}", "danger")
-                return redirect(url_for("refunds.linked_refund"))
-
-            # Parse externalData string into dictionary
-            external_data_str = details_data.get("transactionDetails", {}).get(
-                "externalData"
-            )
-            if not external_data_str:
-                flash("Could not find externalData in transaction details", "danger")
-                return redirect(url_for("refunds.linked_refund"))
-            try:
-                external_data = json.loads(external_data_str)
-            except json.JSONDecodeError:
-                flash("Error parsing transaction details", "danger")
-                return redirect(url_for("refunds.linked_refund"))
-
-            # Add transaction details and isNonPinpadRefund to the payload
-            payload["transactionDetails"] = {
-                "gatewayReferenceNumber": external_data["gatewayReferenceNumber"],
-                "originalAmount": external_data["originalAmount"],
-                "originalApprovalCode": external_data["originalApprovalCode"],
-                "originalTransactionType": external_data["originalTransactionType"],
-                "mid": external_data["hostMerchantId"],
-                "tid": external_data["hostTerminalId"],
-            }
-            payload["isNonPinpadRefund"] = True
-
-        response_data, error = make_api_request(endpoint, payload=payload)
-
-        if error:
-            flash(f"Error creating refund intent: {error}", "danger")
-            return redirect(url_for("refunds.linked_refund"))
-
-        # Get the intent ID
-        intent_id = response_data["intentId"]
-
-        # Process the intent based on conditions:
-        # - If no pinpad options are shown (non-WP TID), always process
-        # - If pinpad options are shown and via_pinpad is true, process
-        should_process = not show_pinpad_options or via_pinpad
-        
-        if should_process:
-            _, process_error = process_intent(intent_id)
-            if process_error:
-                flash(
-                    f"Process failed for Intent ID {intent_id}: {process_error}",
-                    "danger",
-                )
-                return redirect(url_for("refunds.linked_refund"))
-            else:
-                flash(f"Successfully processed Intent ID: {intent_id}", "success")
-        else:
-            flash(f"Successfully created refund Intent ID: {intent_id}", "success")
+        # Non-pinpad refunds on WP TIDs send the parent sale's details and
+        # aren't processed here; everything else is created then processed
+        result = run_transaction(
+            LINKED_REFUND,
+            merchant_reference,
+            amount=amount,
+            parent_intent_id=parent_intent_id,
+            via_pinpad=via_pinpad,
+        )
+        flash_transaction_result(LINKED_REFUND, result)
         return redirect(url_for("refunds.linked_refund"))
 
     return render_template(
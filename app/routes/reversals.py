@@ -1,8 +1,7 @@
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
-import json
 
-from ..utils.api import make_api_request, process_intent
-from ..utils.helpers import generate_merchant_reference, is_charge_anywhere_tid, get_postback_url
+from ..utils.helpers import generate_merchant_reference, is_charge_anywhere_tid
+from ..utils.transactions import REVERSAL, flash_transaction_result, run_transaction
 from ..utils.validation import is_valid_uuid, validate_config, ensure_config_session
 from .user import login_required
 
@@ -39,70 +38,12 @@ def reversal():
         # Check if via_pinpad checkbox is checked (only relevant for Charge Anywhere TIDs)
         via_pinpad = show_pinpad_options and "via_pinpad" in request.form
 
-        # First API call to create reversal intent
-        endpoint = f"/merchant/{session['MID']}/intent/reversal"
-        payload = {
-            "merchantReference": merchant_reference,
-            "parentIntentId": parent_intent_id,
-            "postbackUrl": get_postback_url(),
-        }
-
-        # Only handle non-pinpad logic if pinpad options are shown and via_pinpad is not checked
-        if show_pinpad_options and not via_pinpad:
-            details_endpoint = f"/merchant/{session['MID']}/intent/{parent_intent_id}"
-            details_data, details_error = make_api_request(
-                details_endpoint, method="GET"
-            )
-            if details_error:
-                flash(f"Error getting transaction details: {details_error}", "danger")
-                return redirect(url_for("reversals.reversal"))
-            external_data_str = details_data.get("transactionDetails", {}).get(
-                "externalData"
-            )
-            if not external_data_str:
-                flash("Could not find externalData in transaction details", "danger")
-                return redirect(url_for("reversals.reversal"))
-            try:
-                external_data = json.loads(external_data_str)
-            except Exception:
-                flash("Error parsing transaction details", "danger")
-                return redirect(url_for("reversals.reversal"))
-            payload["transactionDetails"] = {
-                "gatewayReferenceNumber": external_data["gatewayReferenceNumber"],
-                "originalAmount": external_data["originalAmount"],
-                "originalApprovalCode": external_data["originalApprovalCode"],
-                "originalTransactionType": external_data["originalTransactionType"],
-                "mid": external_data["hostMerchantId"],
-                "tid": external_data["hostTerminalId"],
-            }
-            payload["isNonPinpad"] = True
-
-        response_data, error = make_api_request(endpoint, payload=payload)
-
-        if error:
-            flash(f"Error creating reversal intent: {error}", "danger")
-            return redirect(url_for("reversals.reversal"))
-
-        # Second API call to process the intent
-        intent_id = response_data["intentId"]
-
-        # Process the intent based on conditions:
-        # - If no pinpad options are shown (non-WP TID), always process
-        # - If pinpad options are shown and via_pinpad is true, process
-        should_process = not show_pinpad_options or via_pinpad
-        
-        if should_process:
-            _, process_error = process_intent(intent_id)
-            if process_error:
-                flash(
-                    f"Process failed for Intent ID {intent_id}: {process_error}",
-                    "danger",
-                )
-                return redirect(url_for("reversals.reversal"))
-            else:
-                flash(f"Successfully processed Intent ID: {intent_id}", "success")
-        else:
-            flash(f"Successfully created reversal Intent ID: {intent_id}", "success")
+        # Non-pinpad reversals on WP TIDs send the parent sale's details and
+        # aren't processed here; everything else is created then processed
+        result = run_transaction(
+            REVERSAL, merchant_reference, parent_intent_id=parent_intent_id, via_pinpad=via_pinpad
+        )
+        flash_transaction_result(REVERSAL, result)
         return redirect(url_for("reversals.reversal"))
 
     return render_template(
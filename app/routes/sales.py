@@ -1,9 +1,12 @@
 from decimal import Decimal
 
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, session, url_for
 
-from ..utils.api import make_api_request, process_intent
+from ..utils.batch import session_snapshot
 from ..utils.helpers import generate_merchant_reference
+from ..utils.scenarios import postback_owner
+from ..utils.transaction_jobs import job_owner
+from ..utils.transactions import SALE, flash_transaction_result, run_transaction
 from ..utils.validation import validate_amount, validate_config, ensure_config_session
 from .user import login_required
 
@@ -37,30 +40,35 @@ def sale():
             flash("Merchant reference is required", "danger")
             return redirect(url_for("sales.sale"))
 
-        # First API call to create payment intent
-        endpoint = f"/merchant/{session['MID']}/intent/payment"
-        payload = {
-            "subTotal": int(amount * 100),
-            "merchantReference": merchant_reference,
-        }
+        jobs = current_app.extensions.get("transaction_jobs")
+        if jobs is not None:
+            # Job mode: the gateway calls run in the background and the page polls
+            config = session_snapshot()
+            config.update(postback_owner())
+            job_id = jobs.submit(SALE, config, merchant_reference=merchant_reference, amount=amount)
+            if job_id is None:
+                flash("Too many transactions are in progress. Please try again shortly.", "warning")
+                return redirect(url_for("sales.sale"))
+            return redirect(url_for("sales.sale", job=job_id))
 
-        response_data, error = make_api_request(endpoint, payload=payload)
-
-        if error:
-            flash(f"Error creating payment intent: {error}", "danger")
-            return redirect(url_for("sales.sale"))
-
-        # Second API call to process the intent
-        intent_id = response_data["intentId"]
-        _, process_error = process_intent(intent_id)
-        if process_error:
-            flash(
-                f"Process failed for Intent ID {intent_id}: {process_error}", "danger"
-            )
-        else:
-            flash(f"Successfully processed Intent ID: {intent_id}", "success")
+        # Create the payment intent, then process it on the TID
+        result = run_transaction(SALE, merchant_reference, amount=amount)
+        flash_transaction_result(SALE, result)
         return redirect(url_for("sales.sale"))
 
     return render_template(
-        "sale.html", default_merchant_reference=generate_merchant_reference()
+        "sale.html",
+        default_merchant_reference=generate_merchant_reference(),
+        job_id=request.args.get("job"),
     )
+
+
+@bp.route("/sale/jobs/<job_id>", methods=["GET"])
+@login_required
+def sale_job(job_id):
+    """Status of a sale submitted in job mode, for the sale page to poll."""
+    jobs = current_app.extensions.get("transaction_jobs")
+    job = jobs.get(job_id, job_owner()) if jobs is not None else None
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
@@ -11,6 +11,7 @@ from flask import (
 )
 from ..models import db, User, Invite, UserConfig, UserPostback
 from app.utils.email import send_email
+from app.utils.helpers import get_guest_token
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta, UTC
 import secrets
@@ -90,6 +91,8 @@ def create_user_blueprint(name="user"):
     @user_bp.route("/guest-login")
     def guest_login():
         session["is_guest"] = True
+        # Scopes the guest's postback URL and stored postbacks to this session
+        get_guest_token()
         flash("You are browsing as a guest.", "info")
         return redirect(url_for("config.config"))
 
@@ -341,4 +344,11 @@ def create_user_blueprint(name="user"):
         users = User.query.all()
         return render_template("admin/user_list.html", users=users)
 
+    @user_bp.route("/admin/outbound-calls", methods=["GET"])
+    @admin_required
+    def outbound_calls():
+        metrics = current_app.extensions["outbound_metrics"].snapshot()
+        timeouts = current_app.extensions["api_timeouts"].snapshot()
+        return render_template("admin/outbound_calls.html", series=metrics["series"], timeouts=timeouts)
+
     return user_bp
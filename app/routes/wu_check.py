@@ -1,5 +1,6 @@
 import json
 import os
+import time
 import requests
 from flask import (
     Blueprint,
@@ -11,7 +12,7 @@ from flask import (
 )
 
 from ..utils.auth import optional_jwt_user
-from ..utils.api import VERIFY_PATH, _get_timeout_seconds
+from ..utils.retry import FAILED, TIMED_OUT
 
 bp = Blueprint("wu_check", __name__)
 
@@ -64,22 +65,32 @@ def wu_check(user):
             api_key = keys[selected_key]
             base = current_app.config["WU_API_BASE_URL"].rstrip("/")
             url = f"{base}/merchant/{mid_value}/terminals"
+            metrics = current_app.extensions["outbound_metrics"]
+            timeouts = current_app.extensions["api_timeouts"]
+            started = time.perf_counter()
+
+            def record(outcome):
+                elapsed = time.perf_counter() - started
+                metrics.record("GET", url, outcome, elapsed)
+                timeouts.record("GET", url, outcome, elapsed)
+
             try:
-                timeout = _get_timeout_seconds()
-                resp = requests.get(
+                resp = current_app.extensions["http_client"].get(
                     url,
                     headers={"x-api-key": api_key},
-                    timeout=timeout,
-                    verify=VERIFY_PATH,
+                    timeout=timeouts.timeout_for("GET", url),
                 )
+                record(resp.status_code if resp.status_code >= 400 else None)
                 try:
                     body_str = json.dumps(resp.json(), indent=2)
                 except ValueError:
                     body_str = resp.text
                 result = {"status_code": resp.status_code, "body": body_str}
             except requests.exceptions.Timeout:
+                record(TIMED_OUT)
                 error = "Request timed out."
             except requests.exceptions.RequestException:
+                record(FAILED)
                 current_app.logger.error(
                     "WU check request to %s failed", url, exc_info=True
                 )
@@ -1,14 +1,29 @@
+import hashlib
+import logging
+import time
 import requests
 from flask import current_app, flash, session
 import os
+from urllib3.exceptions import NewConnectionError
 
 from .validation import validate_config
 from .helpers import get_postback_url
+from .retry import (
+    CONNECT_FAILED,
+    CONNECTION_RESET,
+    FAILED,
+    IDEMPOTENCY_HEADER,
+    TIMED_OUT,
+    idempotency_key,
+)
+from .timeouts import DEADLINE_EXCEEDED, attempt_timeout, current_deadline, deadline_allows
 
 ENVIRONMENT_URLS = {
     "production": "https://api-terminal-gateway.tillpayments.com/devices",
     "sandbox": "https://api-terminal-gateway.tillvision.show/devices",
     "dev-test": "https://api-terminal-gateway.tillpayments.dev/devices",
+    # Local mock gateway (app/mock_gateway.py), offered when ENABLE_MOCK_GATEWAY is set
+    "mock": os.getenv("MOCK_GATEWAY_URL", "http://127.0.0.1:5055/devices"),
 }
 
 # Use system CA bundle; fall back to Python's default (requests uses certifi
@@ -19,26 +34,17 @@ VERIFY_PATH = (
     else None  # requests uses its own bundled certs (certifi) automatically
 )
 
-
-def _get_timeout_seconds():
-    """Return configured API request timeout in seconds (default 60)."""
-    try:
-        timeout_val = int(current_app.config.get("API_REQUEST_TIMEOUT", 60))
-        # enforce sane bounds: 1s - 300s
-        if timeout_val < 1:
-            return 60
-        if timeout_val > 300:
-            return 300
-        return timeout_val
-    except Exception:
-        return 60
+logger = logging.getLogger(__name__)
 
 
-def make_api_request(endpoint, method="POST", payload=None):
-    """Helper function to make API requests with proper headers and error handling"""
-    if not validate_config():
-        return None, "Missing configuration values"
+def prepare_api_call(endpoint, method="POST", payload=None):
+    """Build an API call from the session's configuration.
 
+    Returns a plain dict (method, url, headers, json, timeout, deadline)
+    that either outbound client can send, so it can be handed to another
+    thread. The timeout adapts to the endpoint's recent latency and the
+    deadline is the enclosing request_deadline(), if any (see utils/timeouts.py).
+    """
     # Get values from session, with defaults as fallback
     defaults = current_app.config["DEFAULT_CONFIG"]
     api_key = session.get("API_KEY", defaults["API_KEY"])
@@ -53,24 +59,47 @@ def make_api_request(endpoint, method="POST", payload=None):
     if payload and endpoint.endswith(("/payment", "/refund", "/reversal")):
         payload["postbackUrl"] = postback_url
         # Log for debugging delay functionality
-        import logging
-        logger = logging.getLogger(__name__)
         logger.info(f"Added postback URL to {endpoint}: {postback_url}")
 
+    # Lets the gateway de-duplicate retried create calls (see utils/retry.py)
+    key = idempotency_key(session.get("MID", defaults["MID"]), endpoint, payload)
+    if key:
+        headers[IDEMPOTENCY_HEADER] = key
+
+    return {
+        "method": method,
+        "base_url": base_url,
+        "url": url,
+        "headers": headers,
+        "json": payload,
+        "timeout": current_app.extensions["api_timeouts"].timeout_for(method, url),
+        "deadline": current_deadline(),
+    }
+
+
+def _never_sent(error):
+    """Whether a requests ConnectionError failed before the request went out."""
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _attempt_api_call(call):
+    """One attempt at a prepared call. Returns (data, error, outcome); outcome is None on success."""
+    timeout_seconds = call["timeout"]
     try:
-        timeout_seconds = _get_timeout_seconds()
-        response = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
-            json=payload,
+        # Pooled keep-alive session for the environment's host (see utils/http_client.py)
+        response = current_app.extensions["http_client"].request(
+            call["method"],
+            call["url"],
+            headers=call["headers"],
+            json=call["json"],
             timeout=timeout_seconds,
-            verify=VERIFY_PATH,
         )
         response.raise_for_status()
-        return response.json(), None
-    except requests.exceptions.Timeout:
-        return None, f"Request timed out after {timeout_seconds} seconds"
+        return response.json(), None, None
+    except requests.exceptions.Timeout as e:
+        outcome = CONNECT_FAILED if isinstance(e, requests.exceptions.ConnectTimeout) else TIMED_OUT
+        return None, f"Request timed out after {timeout_seconds} seconds", outcome
     except requests.exceptions.RequestException as e:
         error_message = str(e)
         if hasattr(e.response, "json"):
@@ -79,7 +108,94 @@ def make_api_request(endpoint, method="POST", payload=None):
                 error_message = error_data.get("message", str(e))
             except:
                 pass
-        return None, error_message
+        if e.response is not None:
+            outcome = e.response.status_code
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            outcome = CONNECT_FAILED if _never_sent(e) else CONNECTION_RESET
+        else:
+            outcome = FAILED
+        return None, error_message, outcome
+
+
+def send_api_call(call):
+    """Send a prepared call over the pooled requests session, retrying per policy.
+
+    Returns (data, error). Fails fast while the gateway's circuit is open,
+    and once the call's deadline has passed.
+    """
+    retries = current_app.extensions["api_retries"]
+    breakers = current_app.extensions["circuit_breakers"]
+    metrics = current_app.extensions["outbound_metrics"]
+    timeouts = current_app.extensions["api_timeouts"]
+    retries.start(call)
+    attempt = 1
+    while True:
+        timeout = attempt_timeout(call)
+        if timeout is None:
+            data, error = None, DEADLINE_EXCEEDED
+            break
+        error = breakers.check(call)
+        if error:
+            data = None
+            break
+        started = time.perf_counter()
+        data, error, outcome = _attempt_api_call(dict(call, timeout=timeout))
+        elapsed = time.perf_counter() - started
+        metrics.record(call["method"], call["url"], outcome, elapsed)
+        timeouts.record(call["method"], call["url"], outcome, elapsed)
+        breakers.record(call, outcome)
+        delay = retries.next_delay(call, outcome, attempt)
+        if delay is None or not deadline_allows(call, delay):
+            break
+        logger.warning(f"Retrying {call['method']} {call['url']} in {delay:.2f}s after {outcome} (attempt {attempt})")
+        time.sleep(delay)
+        attempt += 1
+    retries.finish(call, attempt, error is None)
+    return data, error
+
+
+def send_api_calls(calls):
+    """Send prepared calls, concurrently when the async client is enabled."""
+    async_client = current_app.extensions.get("async_http_client")
+    if async_client is not None:
+        return async_client.run_calls(calls)
+    return [send_api_call(call) for call in calls]
+
+
+def make_api_request(endpoint, method="POST", payload=None):
+    """Helper function to make API requests with proper headers and error handling"""
+    if not validate_config():
+        return None, "Missing configuration values"
+    return send_api_calls([prepare_api_call(endpoint, method, payload)])[0]
+
+
+def make_api_requests(requests_to_send):
+    """Make several independent API requests, given as (endpoint, method, payload) tuples.
+
+    Returns a (data, error) tuple per request, in order. With
+    OUTBOUND_CLIENT=async the requests are in flight concurrently.
+    """
+    if not validate_config():
+        return [(None, "Missing configuration values")] * len(requests_to_send)
+    return send_api_calls([prepare_api_call(*args) for args in requests_to_send])
+
+
+def get_intent_details(intent_id):
+    """Fetch an intent's details, from the short-lived intent cache when possible"""
+    if not validate_config():
+        return None, "Missing configuration values"
+
+    defaults = current_app.config["DEFAULT_CONFIG"]
+    base_url = session.get("BASE_URL", defaults["BASE_URL"])
+    mid = session.get("MID", defaults["MID"])
+    # Callers with different API keys don't share entries
+    api_key = hashlib.sha256(session.get("API_KEY", defaults["API_KEY"]).encode()).hexdigest()[:16]
+
+    endpoint = f"/merchant/{mid}/intent/{intent_id}"
+    cache = current_app.extensions["intent_details_cache"]
+    return cache.get_or_fetch(
+        (base_url, mid, api_key, intent_id), lambda: make_api_request(endpoint, method="GET")
+    )
 
 
 def process_intent(intent_id):
@@ -0,0 +1,180 @@
+"""
+Asyncio outbound client for Terminal Connect API calls (opt-in).
+
+With OUTBOUND_CLIENT=async, make_api_request() and process_intent() send
+their calls through an httpx.AsyncClient running on a dedicated event-loop
+thread in each worker process instead of the blocking pooled requests
+sessions. Routes stay synchronous: the request thread hands the prepared
+call to the loop and waits for its result, so the (data, error) contract is
+unchanged. Independent calls submitted together (make_api_requests()) are
+in flight at the same time on the loop, and any number of in-flight calls
+share the loop's single thread rather than one OS thread each.
+
+Calls are prepared (session config, headers, postback URL) in the Flask
+thread; only plain data crosses into the loop.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from .call_metrics import OutboundCallMetrics
+from .circuit_breaker import CircuitBreakers
+from .http_client import create_ssl_context
+from .retry import CONNECT_FAILED, CONNECTION_RESET, FAILED, TIMED_OUT, ApiRetryPolicy
+from .timeouts import DEADLINE_EXCEEDED, AdaptiveTimeouts, attempt_timeout, deadline_allows
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient:
+    """httpx.AsyncClient on a per-process event-loop thread, callable from sync code."""
+
+    def __init__(self, app=None, transport=None):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._pid = None
+        # Tests inject an httpx.MockTransport here
+        self.transport = transport
+        self.max_connections = 100
+        self.keepalive_connections = 10
+        self.stats = {"calls": 0, "in_flight": 0, "peak_in_flight": 0, "errors": 0}
+        self.retries = ApiRetryPolicy()
+        self.breakers = CircuitBreakers()
+        self.metrics = OutboundCallMetrics()
+        self.timeouts = AdaptiveTimeouts()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_connections = max(1, int(app.config.get("HTTP_ASYNC_MAX_CONNECTIONS", 100)))
+        self.keepalive_connections = max(1, int(app.config.get("HTTP_POOL_SIZE", 10)))
+        self.retries = app.extensions["api_retries"]
+        self.breakers = app.extensions["circuit_breakers"]
+        self.metrics = app.extensions["outbound_metrics"]
+        self.timeouts = app.extensions["api_timeouts"]
+        app.extensions["async_http_client"] = self
+
+    # --- Event loop ---
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return self._loop
+            # First use, or a forked worker: the parent's loop thread doesn't exist here
+            self._loop = asyncio.new_event_loop()
+            self._client = httpx.AsyncClient(
+                verify=create_ssl_context(),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.keepalive_connections,
+                ),
+                transport=self.transport,
+            )
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="outbound-http-loop", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+            return self._loop
+
+    def run(self, coro):
+        """Run a coroutine on the loop thread and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def shutdown(self):
+        with self._lock:
+            loop, client, thread = self._loop, self._client, self._thread
+            self._loop = self._client = self._thread = None
+        if loop is None or not thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    # --- Calls ---
+
+    def run_calls(self, calls):
+        """Send prepared calls concurrently. Returns a (data, error) tuple per call, in order."""
+
+        async def send_all():
+            return await asyncio.gather(*(self.send(call) for call in calls))
+
+        return self.run(send_all())
+
+    async def send(self, call):
+        """Send one prepared call (see api.prepare_api_call()), retrying per policy.
+
+        Returns (data, error). Fails fast while the gateway's circuit is open,
+        and once the call's deadline has passed.
+        """
+        self.stats["calls"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        self.retries.start(call)
+        try:
+            attempt = 1
+            while True:
+                timeout = attempt_timeout(call)
+                if timeout is None:
+                    data, error = None, DEADLINE_EXCEEDED
+                    break
+                error = self.breakers.check(call)
+                if error:
+                    data = None
+                    break
+                started = time.perf_counter()
+                data, error, outcome = await self._attempt(dict(call, timeout=timeout))
+                elapsed = time.perf_counter() - started
+                self.metrics.record(call["method"], call["url"], outcome, elapsed)
+                self.timeouts.record(call["method"], call["url"], outcome, elapsed)
+                self.breakers.record(call, outcome)
+                delay = self.retries.next_delay(call, outcome, attempt)
+                if delay is None or not deadline_allows(call, delay):
+                    break
+                logger.warning(
+                    f"Retrying {call['method']} {call['url']} in {delay:.2f}s after {outcome} (attempt {attempt})"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+            self.retries.finish(call, attempt, error is None)
+            if error is not None:
+                self.stats["errors"] += 1
+            return data, error
+        finally:
+            self.stats["in_flight"] -= 1
+
+    async def _attempt(self, call):
+        """One attempt at a call. Returns (data, error, outcome); outcome is None on success."""
+        try:
+            response = await self._client.request(
+                call["method"],
+                call["url"],
+                headers=call["headers"],
+                json=call["json"],
+                timeout=call["timeout"],
+            )
+            response.raise_for_status()
+            return response.json(), None, None
+        except httpx.TimeoutException as e:
+            # Pool and connect timeouts happen before the request is sent
+            outcome = CONNECT_FAILED if isinstance(e, (httpx.ConnectTimeout, httpx.PoolTimeout)) else TIMED_OUT
+            return None, f"Request timed out after {call['timeout']} seconds", outcome
+        except httpx.HTTPStatusError as e:
+            try:
+                message = e.response.json().get("message", str(e))
+            except (ValueError, AttributeError):
+                message = str(e)
+            return None, message, e.response.status_code
+        except httpx.ConnectError as e:
+            return None, str(e), CONNECT_FAILED
+        except httpx.TransportError as e:
+            return None, str(e), CONNECTION_RESET
+        except (httpx.HTTPError, ValueError) as e:
+            return None, str(e), FAILED
@@ -0,0 +1,265 @@
+"""
+Batch transaction runner for load-testing a terminal.
+
+A BatchRun submits `count` transactions of one type through the same flow
+as the forms (utils/transactions.py), from `concurrency` worker threads,
+starting at most `rate` transactions per second when a rate is given.
+Every worker runs in its own request context carrying a snapshot of the
+submitting session's configuration, so API calls, postback URLs, retries
+and circuit breakers behave exactly as they do for single transactions.
+
+The report has per-stage latency percentiles (create, process and the
+parent details lookup, plus the whole transaction), an error breakdown by
+stage and message, and throughput over the wall-clock duration.
+
+BatchRunner (app.extensions["batch_runner"]) runs batches for the web UI
+on background threads, at most BATCH_MAX_RUNNING at a time per worker, and
+keeps the last BATCH_HISTORY runs per worker in memory. The `flask batch-run` command runs one in the foreground.
+"""
+
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, session
+
+from .helpers import get_postback_url
+from .transactions import LINKED_TYPES, run_transaction
+
+PENDING = "pending"
+RUNNING = "running"
+FINISHED = "finished"
+CANCELLED = "cancelled"
+
+# Session keys copied into every worker's request context
+CONFIG_KEYS = ("ENVIRONMENT", "BASE_URL", "MID", "TID", "API_KEY")
+PERCENTILES = (50, 90, 95, 99)
+STAGES = ("transaction", "details", "create", "process")
+
+
+def session_snapshot():
+    """Configuration of the current session for batch workers, with its postback URL resolved."""
+    defaults = current_app.config["DEFAULT_CONFIG"]
+    config = {key: session.get(key, defaults.get(key)) for key in CONFIG_KEYS}
+    config["POSTBACK_URL"] = get_postback_url()
+    return {key: value for key, value in config.items() if value is not None}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_summary(values):
+    """Percentiles, mean and max of a list of seconds, in milliseconds."""
+    values = sorted(values)
+    if not values:
+        return None
+    summary = {f"p{pct}": round(percentile(values, pct) * 1000, 1) for pct in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values) * 1000, 1)
+    summary["max"] = round(values[-1] * 1000, 1)
+    summary["count"] = len(values)
+    return summary
+
+
+class BatchRun:
+    """N transactions of one type with a concurrency and optional rate limit."""
+
+    def __init__(
+        self,
+        kind,
+        count,
+        concurrency=1,
+        rate=None,
+        amount=None,
+        parent_intent_ids=(),
+        via_pinpad=False,
+        reference_prefix=None,
+        owner=None,
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.count = count
+        self.concurrency = max(1, min(concurrency, count))
+        self.rate = rate or None
+        self.amount = amount
+        self.parent_intent_ids = list(parent_intent_ids)
+        self.via_pinpad = via_pinpad
+        self.reference_prefix = reference_prefix or str(int(time.time()))
+        self.owner = owner
+        self.status = PENDING
+        self.results = []
+        self.created_at = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop starting new transactions; ones in flight finish."""
+        self._cancel.set()
+
+    def run(self, app, config):
+        """Run the batch to completion on this thread's pool. Returns the report."""
+        self.status = RUNNING
+        self.started = self._next_slot = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"batch-{self.id}") as pool:
+            for n in range(1, self.count + 1):
+                pool.submit(self._run_one, app, config, n)
+        self.finished = time.monotonic()
+        self.status = CANCELLED if self._cancel.is_set() else FINISHED
+        return self.report()
+
+    def _wait_for_slot(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _run_one(self, app, config, n):
+        if self._cancel.is_set():
+            return
+        self._wait_for_slot()
+        if self._cancel.is_set():
+            return
+
+        merchant_reference = f"{self.reference_prefix}-{n}"
+        parent_intent_id = None
+        if self.kind in LINKED_TYPES:
+            parent_intent_id = self.parent_intent_ids[(n - 1) % len(self.parent_intent_ids)]
+
+        started = time.perf_counter()
+        with app.test_request_context():
+            session.update(config)
+            try:
+                result = run_transaction(
+                    self.kind,
+                    merchant_reference,
+                    amount=self.amount,
+                    parent_intent_id=parent_intent_id,
+                    via_pinpad=self.via_pinpad,
+                )
+            except Exception as e:
+                result = {"intent_id": None, "error": str(e) or type(e).__name__, "stage": "exception", "timings": {}}
+        result["timings"]["transaction"] = time.perf_counter() - started
+        result.update(n=n, merchant_reference=merchant_reference)
+        with self._lock:
+            self.results.append(result)
+
+    def report(self):
+        with self._lock:
+            results = list(self.results)
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        failed = [r for r in results if r["error"]]
+        errors = Counter((r["stage"], r["error"]) for r in failed)
+        return {
+            "id": self.id,
+            "type": self.kind,
+            "status": self.status,
+            "count": self.count,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "completed": len(results),
+            "succeeded": len(results) - len(failed),
+            "failed": len(failed),
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(results) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                stage: summary
+                for stage in STAGES
+                if (summary := latency_summary([r["timings"][stage] for r in results if stage in r["timings"]]))
+            },
+            "errors": [
+                {"stage": stage, "error": error, "count": count}
+                for (stage, error), count in errors.most_common()
+            ],
+            "failures": [
+                {key: r.get(key) for key in ("n", "merchant_reference", "intent_id", "stage", "error")}
+                for r in sorted(failed, key=lambda r: r["n"])[:50]
+            ],
+        }
+
+
+class BatchRunner:
+    """Runs batches for the web UI on background threads."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._runs = OrderedDict()
+        self.max_transactions = 1000
+        self.max_concurrency = 20
+        self.history = 20
+        self.max_running = 3
+        self._running = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_transactions = max(1, int(app.config.get("BATCH_MAX_TRANSACTIONS", 1000)))
+        self.max_concurrency = max(1, int(app.config.get("BATCH_MAX_CONCURRENCY", 20)))
+        self.history = max(1, int(app.config.get("BATCH_HISTORY", 20)))
+        self.max_running = max(1, int(app.config.get("BATCH_MAX_RUNNING", 3)))
+        app.extensions["batch_runner"] = self
+
+    def check_limits(self, count, concurrency, rate):
+        """Error message if a batch is outside the configured limits, otherwise None."""
+        if not 1 <= count <= self.max_transactions:
+            return f"Count must be between 1 and {self.max_transactions}"
+        if not 1 <= concurrency <= self.max_concurrency:
+            return f"Concurrency must be between 1 and {self.max_concurrency}"
+        if rate is not None and rate <= 0:
+            return "Rate must be greater than zero"
+        return None
+
+    def start(self, run, config):
+        """Run a batch on a background thread and remember it.
+
+        Returns the run, or None when BATCH_MAX_RUNNING batches are already
+        running in this worker.
+        """
+        with self._lock:
+            if self._running >= self.max_running:
+                return None
+            self._running += 1
+            self._runs[run.id] = run
+            while len(self._runs) > self.history:
+                self._runs.popitem(last=False)
+        try:
+            threading.Thread(target=self._run, args=(run, config), name=f"batch-{run.id}", daemon=True).start()
+        except Exception:
+            self._finished()
+            raise
+        return run
+
+    def _run(self, run, config):
+        try:
+            run.run(self.app, config)
+        finally:
+            self._finished()
+
+    def _finished(self):
+        with self._lock:
+            self._running -= 1
+
+    def get(self, run_id, owner=None):
+        run = self._runs.get(run_id)
+        if run is None or run.owner != owner:
+            return None
+        return run
+
+    def runs(self, owner=None):
+        with self._lock:
+            return [run for run in reversed(self._runs.values()) if run.owner == owner]
@@ -0,0 +1,170 @@
+"""
+Latency histograms for outbound gateway calls.
+
+Every attempt at a Terminal Connect call (both outbound clients, and the
+WU check) is timed and recorded in OutboundCallMetrics
+(app.extensions["outbound_metrics"]), labelled by:
+
+- environment: the gateway's name in ENVIRONMENT_URLS, or its host
+- endpoint: the path template, e.g. /merchant/{mid}/intent/payment or
+  /merchant/{mid}/intent/{intent_id}/process, so IDs don't multiply series
+- method
+- outcome: "ok", the HTTP status of an error response, or the retry
+  outcome (connect, timeout, reset, error) when no response came back
+
+Each series is a fixed-bucket histogram (exponential bounds from 1 ms to
+about two minutes, each 1.5x the last) plus a count and sum, so recording
+is O(1) and memory doesn't grow with traffic. Percentiles are interpolated
+within the bucket they fall in, which is accurate to the bucket width.
+Retries are recorded as separate attempts. Histograms are per worker
+process and start empty on restart.
+
+snapshot() summarises each series for the admin JSON endpoint and page;
+prometheus() renders the same histograms in the Prometheus text format.
+"""
+
+import bisect
+import re
+import threading
+from urllib.parse import urlsplit
+
+from .api import ENVIRONMENT_URLS
+
+OK = "ok"
+PERCENTILES = (50, 95, 99)
+# Upper bounds of the histogram buckets, in seconds (1ms * 1.5^n, up to ~2 minutes)
+BUCKETS = tuple(round(0.001 * 1.5 ** n, 6) for n in range(30))
+
+MERCHANT = re.compile(r"/merchant/[^/]+")
+INTENT = re.compile(r"/intent/(?!(?:payment|refund|reversal)$)[^/]+")
+
+
+def endpoint_template(path):
+    """Path with merchant and intent IDs replaced by placeholders."""
+    path = MERCHANT.sub("/merchant/{mid}", path.rstrip("/") or "/")
+    return INTENT.sub("/intent/{intent_id}", path)
+
+
+def outcome_label(outcome):
+    """Label for an attempt outcome as used by utils/retry.py (None is success)."""
+    return OK if outcome is None else str(outcome)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. Not thread-safe on its own."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct):
+        """Estimated percentile in seconds, interpolated within its bucket."""
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(value, self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        summary = {f"p{pct}": round(self.percentile(pct) * 1000, 1) for pct in PERCENTILES}
+        summary["mean"] = round(self.sum / self.count * 1000, 1)
+        summary["max"] = round(self.max * 1000, 1)
+        summary["count"] = self.count
+        return summary
+
+
+class OutboundCallMetrics:
+    """Per-worker latency histograms of outbound calls, keyed by label set."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._environments = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._environments = {
+            urlsplit(url).netloc.lower(): (name, urlsplit(url).path.rstrip("/")) for name, url in ENVIRONMENT_URLS.items()
+        }
+        app.extensions["outbound_metrics"] = self
+
+    def labels(self, method, url):
+        """(environment, endpoint template, method) for a call's URL."""
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        environment, base_path = self._environments.get(host, (host, ""))
+        path = parts.path
+        if base_path and path.startswith(base_path):
+            path = path[len(base_path):]
+        return environment, endpoint_template(path), method.upper()
+
+    def record(self, method, url, outcome, seconds):
+        """Record one attempt's duration. outcome as in utils/retry.py (None is success)."""
+        key = self.labels(method, url) + (outcome_label(outcome),)
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Summary (latency in ms) of every series, slowest p95 first."""
+        with self._lock:
+            series = [
+                {
+                    "environment": environment,
+                    "endpoint": endpoint,
+                    "method": method,
+                    "outcome": outcome,
+                    "latency_ms": histogram.summary(),
+                }
+                for (environment, endpoint, method, outcome), histogram in self._series.items()
+            ]
+        series.sort(key=lambda s: (-s["latency_ms"]["p95"], s["environment"], s["endpoint"]))
+        return {"buckets": len(BUCKETS), "series": series}
+
+    def prometheus(self, name="terminal_connect_call_duration_seconds"):
+        """The histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {name} Duration of outbound Terminal Connect call attempts.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            series = [(key, list(h.counts), h.count, h.sum) for key, h in sorted(self._series.items())]
+        for (environment, endpoint, method, outcome), counts, count, total in series:
+            labels = (
+                f'environment="{_escape(environment)}",endpoint="{_escape(endpoint)}",'
+                f'method="{method}",outcome="{_escape(outcome)}"'
+            )
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,169 @@
+"""
+Circuit breakers for the Terminal Connect gateways.
+
+Each gateway base URL has a breaker shared by all threads of a worker
+(app.extensions["circuit_breakers"]). Both outbound clients ask it before
+every attempt and report the outcome afterwards:
+
+- closed: calls go through. The outcomes of the last CIRCUIT_WINDOW calls
+  are kept, and once at least CIRCUIT_MIN_CALLS are known and the share of
+  failures (connection failures, timeouts, resets and 5xx responses)
+  reaches CIRCUIT_FAILURE_RATE, the breaker opens.
+- open: calls fail immediately with an "unavailable" error instead of
+  waiting out API_REQUEST_TIMEOUT, for CIRCUIT_OPEN_SECONDS.
+- half-open: after that, one probe call is let through at a time. If it
+  succeeds the breaker closes, otherwise it opens again.
+
+Client errors (4xx) mean the gateway is up and don't count as failures.
+"""
+
+import threading
+import time
+from collections import deque
+
+from .api import ENVIRONMENT_URLS
+from .retry import CONNECT_FAILED, CONNECTION_RESET, TIMED_OUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_gateway_failure(outcome):
+    """Whether an attempt's outcome suggests the gateway itself is failing."""
+    if outcome in (CONNECT_FAILED, TIMED_OUT, CONNECTION_RESET):
+        return True
+    return isinstance(outcome, int) and outcome >= 500
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one gateway. Not thread-safe on its own."""
+
+    def __init__(self, window, failure_rate, min_calls, open_seconds):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self, now):
+        """Whether a call may go out now."""
+        if self.state == OPEN:
+            if now - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN:
+            if self.probing:
+                self.rejected += 1
+                return False
+            self.probing = True
+        return True
+
+    def record(self, failed, now):
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open(now)
+            else:
+                self.state = CLOSED
+                self.outcomes.clear()
+            self.probing = False
+        elif self.state == CLOSED:
+            self.outcomes.append(failed)
+            if len(self.outcomes) >= self.min_calls and self.failure_ratio() >= self.failure_rate:
+                self._open(now)
+        # Results of calls that started before the breaker opened are ignored
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+
+    def failure_ratio(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def retry_after(self, now):
+        """Seconds until an open breaker lets a probe through."""
+        if self.state != OPEN:
+            return 0
+        return max(0, int(self.opened_at + self.open_seconds - now + 0.999))
+
+
+class CircuitBreakers:
+    """Per-base-URL circuit breakers shared by the threads of a worker."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self.window = 20
+        self.failure_rate = 0.5
+        self.min_calls = 5
+        self.open_seconds = 30.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.window = max(1, int(app.config.get("CIRCUIT_WINDOW", 20)))
+        self.failure_rate = min(1.0, max(0.01, float(app.config.get("CIRCUIT_FAILURE_RATE", 0.5))))
+        self.min_calls = max(1, int(app.config.get("CIRCUIT_MIN_CALLS", 5)))
+        self.open_seconds = max(1.0, float(app.config.get("CIRCUIT_OPEN_SECONDS", 30)))
+        app.extensions["circuit_breakers"] = self
+
+    def _breaker(self, base_url):
+        breaker = self._breakers.get(base_url)
+        if breaker is None:
+            breaker = self._breakers[base_url] = CircuitBreaker(
+                self.window, self.failure_rate, self.min_calls, self.open_seconds
+            )
+        return breaker
+
+    def check(self, call):
+        """Error message if the call's gateway circuit is open, otherwise None."""
+        now = time.monotonic()
+        with self._lock:
+            breaker = self._breaker(call["base_url"])
+            if breaker.allow(now):
+                return None
+            retry_after = breaker.retry_after(now)
+        if retry_after:
+            wait = f"try again in {retry_after}s"
+        else:
+            wait = "a recovery check is in progress"
+        return f"Gateway {call['base_url']} is unavailable after repeated failures; {wait}"
+
+    def record(self, call, outcome):
+        """Report the outcome of an attempt that check() let through."""
+        with self._lock:
+            self._breaker(call["base_url"]).record(is_gateway_failure(outcome), time.monotonic())
+
+    def reset(self, base_url=None):
+        """Close one breaker, or all of them. Returns how many were reset."""
+        with self._lock:
+            if base_url is None:
+                count = len(self._breakers)
+                self._breakers.clear()
+                return count
+            return 1 if self._breakers.pop(base_url, None) is not None else 0
+
+    def snapshot(self):
+        environments = {url: name for name, url in ENVIRONMENT_URLS.items()}
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "base_url": base_url,
+                    "environment": environments.get(base_url),
+                    "state": breaker.state,
+                    "failure_ratio": round(breaker.failure_ratio(), 3),
+                    "recent_calls": len(breaker.outcomes),
+                    "retry_after": breaker.retry_after(now),
+                    "times_opened": breaker.times_opened,
+                    "rejected": breaker.rejected,
+                }
+                for base_url, breaker in sorted(self._breakers.items())
+            ]
@@ -0,0 +1,75 @@
+"""
+Bookkeeping for delayed postback responses (?delay=N on /postback).
+
+Under the ASGI entry point (asgi.py) a delayed postback is parked on the
+event loop after the Flask route has stored it, so no WSGI thread is held
+while the delay runs. The plain WSGI route still sleeps in its request
+thread. Both paths go through DeferredResponseEngine so the number of
+concurrently parked responses is capped (POSTBACK_DELAY_MAX_PARKED) and
+visible to admins.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Valid range for the ?delay= query parameter, in seconds
+MAX_POSTBACK_DELAY = 600
+
+
+def parse_delay(delay_param):
+    """Parse a ?delay= value, returning 0 for anything invalid or out of range."""
+    try:
+        delay_seconds = int(delay_param) if delay_param else 0
+    except ValueError:
+        logger.error(f"Invalid delay parameter '{delay_param}', must be numeric. Using 0.")
+        return 0
+    if delay_seconds < 0 or delay_seconds > MAX_POSTBACK_DELAY:
+        logger.warning(f"Invalid delay value {delay_seconds}, must be 0-{MAX_POSTBACK_DELAY}. Using 0.")
+        return 0
+    return delay_seconds
+
+
+class DeferredResponseEngine:
+    """Caps and counts postback responses that are being held back."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.max_parked = 1000
+        self.in_flight = 0
+        self.peak = 0
+        self.total = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_parked = max(1, int(app.config.get("POSTBACK_DELAY_MAX_PARKED", 1000)))
+        app.extensions["deferred_responses"] = self
+
+    def try_acquire(self):
+        """Reserve a parking slot. Returns False when the cap is reached."""
+        with self._lock:
+            if self.in_flight >= self.max_parked:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.total += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def snapshot(self):
+        """Current counters for the admin metrics endpoint."""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "peak": self.peak,
+                "total": self.total,
+                "rejected": self.rejected,
+                "max_parked": self.max_parked,
+            }
@@ -38,7 +38,7 @@ def send_email(to_email: str, subject: str, html_content: str) -> bool:
         "htmlContent": html_content,
     }
     try:
-        response = requests.post(
+        response = current_app.extensions["http_client"].post(
             BREVO_API_URL,
             json=data,
             headers=headers,
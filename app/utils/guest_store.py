@@ -0,0 +1,470 @@
+"""
+Shared-memory store for guest postbacks.
+
+Every guest session has its own token (see get_guest_token()), embedded in
+the guest postback URL as /postback/guest/<token>. Postbacks are stored
+under a short digest of that token, and the digest picks one of
+GUEST_SHARD_COUNT shards, so concurrent guests write to and scan different
+files instead of one contended store. Postbacks sent to the bare /postback
+URL without a token go to a shared "public" key that every guest sees.
+
+Each shard is a directory <POSTBACKS_FILE>.shards/<shard>/ of hourly
+segments, <YYYYMMDDHH>.ring for the UTC hour the postbacks arrived in. A
+segment is a fixed-size ring buffer in a memory-mapped file that every
+gunicorn worker on the host maps. It starts with a header holding the ring
+geometry, head and tail sequence numbers, the segment's hour and the time
+of its last write, followed by GUEST_POSTBACK_LIMIT slots of
+GUEST_POSTBACK_SLOT_SIZE bytes, each holding one JSON record tagged with its
+sequence number. GUEST_POSTBACK_LIMIT is therefore a per-shard cap: guests
+whose tokens hash to different shards never evict each other's postbacks.
+
+Appends take a short flock on the shard's current segment, write the record
+into slot head % slots and advance head, so an ingest is a single slot
+write. Reads take no lock: they walk the live slots of the shard's newest
+segments, keeping the records for the reader's key, and use the sequence
+tag, read before and after copying a slot, to skip any slot that is being
+overwritten. Parsed records are cached per process, so repeated page views
+don't re-parse anything.
+
+Retention drops whole segments: expire() unlinks segment files older than
+GUEST_POSTBACK_TTL_HOURS, and segments past the TTL are ignored by reads
+until then. At most GUEST_MAX_ACTIVE_SHARDS shards are kept: when a new one
+is started, the shards that were written to least recently are removed, and
+each process keeps only that many shards mapped, least recently used first
+out. Each mapped segment holds two file descriptors (its append lock and the
+mapping's own), so a process also maps at most GUEST_MAX_MAPPED_SEGMENTS
+segments, unmapping the oldest mappings first.
+"""
+
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GPBRING3"
+# magic, slot count, slot size, head, tail, segment hour (YYYYMMDDHH), last write (unix ms)
+HEADER = struct.Struct("<8sIIQQ10sQ")
+HEADER_SIZE = 64
+# sequence number + 1 (0 = empty or being written), record length
+SLOT = struct.Struct("<QI")
+SEGMENT_SUFFIX = ".ring"
+HOUR_FORMAT = "%Y%m%d%H"
+
+# Payload fields kept when a record has to be shrunk to fit its slot
+SUMMARY_FIELDS = ("intentId", "transactionId", "transactionType", "terminalId", "status", "merchantReference")
+
+
+def current_hour(now=None):
+    return (now or datetime.datetime.now(datetime.timezone.utc)).strftime(HOUR_FORMAT)
+
+
+def token_key(token):
+    """Digest a guest token is stored under; raw tokens are never written to disk."""
+    return hashlib.sha256((token or "public").encode()).hexdigest()[:16]
+
+
+PUBLIC_KEY = token_key(None)
+
+
+class Segment:
+    """One hour's ring buffer, mapped into this process."""
+
+    def __init__(self, path, hour, fd, mm):
+        self.path = path
+        self.hour = hour
+        self.fd = fd
+        self.mm = mm
+        self.pid = os.getpid()
+        self.inode = os.fstat(fd).st_ino
+        # Parsed records of the live slots, by sequence number
+        self.cache = {}
+        # Unmapped once no thread holds the segment any more
+        weakref.finalize(self, os.close, fd)
+
+    def is_current(self):
+        """Whether this mapping is usable here and still the file at path (not unlinked/replaced)."""
+        if self.pid != os.getpid():
+            return False
+        try:
+            return os.stat(self.path).st_ino == self.inode
+        except FileNotFoundError:
+            return False
+
+
+class GuestShard:
+    """The hourly ring-buffer segments of one shard directory."""
+
+    def __init__(self, store, shard_id):
+        self.store = store
+        self.shard_id = shard_id
+        self.directory = store.shard_path(shard_id)
+        self._lock = threading.Lock()
+        self._segments = {}
+
+    def segment_path(self, hour):
+        return os.path.join(self.directory, f"{hour}{SEGMENT_SUFFIX}")
+
+    def segment_hours(self):
+        """Hours that have a segment file on disk, newest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        hours = [name[:-len(SEGMENT_SUFFIX)] for name in names if name.endswith(SEGMENT_SUFFIX)]
+        return sorted((hour for hour in hours if len(hour) == 10 and hour.isdigit()), reverse=True)
+
+    def last_write(self):
+        """Unix ms of the shard's newest write, or 0 if it has no readable segment."""
+        for hour in self.segment_hours():
+            try:
+                with open(self.segment_path(hour), "rb") as f:
+                    header = f.read(HEADER.size)
+            except FileNotFoundError:
+                continue
+            if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+                return HEADER.unpack(header)[-1]
+        return 0
+
+    # --- Mapping ---
+
+    def _segment(self, hour, create=False):
+        """Map an hour's segment, creating it if asked. Returns None if it doesn't exist."""
+        segment = self._segments.get(hour)
+        if segment is not None and segment.is_current():
+            return segment
+        with self._lock:
+            segment = self._segments.get(hour)
+            if segment is not None and segment.is_current():
+                return segment
+            # Not mapped yet, mapped by a forked parent, or the file was removed since
+            path = self.segment_path(hour)
+            flags = os.O_RDWR | (os.O_CREAT if create else 0)
+            if create:
+                os.makedirs(self.directory, exist_ok=True)
+            try:
+                fd = os.open(path, flags, 0o644)
+            except FileNotFoundError:
+                return None
+            size = self.store.size
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    valid = self._valid_file(fd, hour)
+                    if not valid and create:
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, size)
+                        os.pwrite(
+                            fd,
+                            HEADER.pack(
+                                MAGIC, self.store.slot_count, self.store.slot_size, 0, 0, hour.encode(), 0
+                            ),
+                            0,
+                        )
+                        valid = True
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                if not valid:
+                    os.close(fd)
+                    return None
+                mm = mmap.mmap(fd, size)
+            except Exception:
+                os.close(fd)
+                raise
+            segment = Segment(path, hour, fd, mm)
+            self._segments[hour] = segment
+        # Outside the shard lock: this may release other shards' segments
+        self.store._mapped(self, hour)
+        return segment
+
+    def _valid_file(self, fd, hour):
+        if os.fstat(fd).st_size != self.store.size:
+            return False
+        magic, slot_count, slot_size, _, _, segment_hour, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+        return (
+            magic == MAGIC
+            and slot_count == self.store.slot_count
+            and slot_size == self.store.slot_size
+            and segment_hour == hour.encode()
+        )
+
+    def _release(self, hour):
+        with self._lock:
+            self._segments.pop(hour, None)
+
+    @contextmanager
+    def _file_lock(self, segment):
+        fcntl.flock(segment.fd, fcntl.LOCK_EX)
+        try:
+            yield segment.mm
+        finally:
+            fcntl.flock(segment.fd, fcntl.LOCK_UN)
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + (seq % self.store.slot_count) * self.store.slot_size
+
+    # --- Writes ---
+
+    def append(self, data):
+        """Write one encoded record into the current hour's segment.
+
+        Returns whether this process had not written to that segment before.
+        """
+        hour = current_hour()
+        new_segment = hour not in self._segments
+        segment = self._segment(hour, create=True)
+        with self._file_lock(segment) as mm:
+            magic, slot_count, slot_size, head, tail, segment_hour, _ = HEADER.unpack_from(mm, 0)
+            offset = self._slot_offset(head)
+            SLOT.pack_into(mm, offset, 0, 0)
+            mm[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+            SLOT.pack_into(mm, offset, head + 1, len(data))
+            head += 1
+            HEADER.pack_into(
+                mm, 0, magic, slot_count, slot_size, head,
+                max(tail, head - slot_count), segment_hour, int(time.time() * 1000),
+            )
+        return new_segment
+
+    def expire(self, cutoff):
+        """Unlink segments older than cutoff. Returns how many were removed."""
+        removed = 0
+        for hour in self.segment_hours():
+            if hour >= cutoff:
+                continue
+            self._release(hour)
+            try:
+                os.unlink(self.segment_path(hour))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        # Drop mappings of segments another worker already removed
+        for hour in [hour for hour in self._segments if hour < cutoff]:
+            self._release(hour)
+        if not self.segment_hours():
+            self.remove()
+        return removed
+
+    def remove(self):
+        """Remove the shard directory and everything in it."""
+        with self._lock:
+            self._segments.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # --- Reads ---
+
+    def recent(self, key, cutoff, limit):
+        """The newest records stored under key (up to limit), newest first."""
+        newest_first = []
+        for hour in self.segment_hours():
+            if hour < cutoff or len(newest_first) >= limit:
+                break
+            segment = self._segment(hour)
+            if segment is not None:
+                records = [r for r in self._read_segment(segment) if r.get("guest") == key]
+                newest_first.extend(reversed(records[-(limit - len(newest_first)):]))
+        return newest_first
+
+    def _read_segment(self, segment):
+        head, tail = HEADER.unpack_from(segment.mm, 0)[3:5]
+        start = max(tail, head - self.store.slot_count)
+        records = []
+        for seq in range(start, head):
+            record = self._read_slot(segment, seq)
+            if record is not None:
+                records.append(record)
+        # Slots are overwritten as the ring wraps, so only keep the live window cached
+        segment.cache = {seq: rec for seq, rec in segment.cache.items() if seq >= start}
+        return records
+
+    def _read_slot(self, segment, seq):
+        cached = segment.cache.get(seq)
+        if cached is not None:
+            return cached
+        mm = segment.mm
+        offset = self._slot_offset(seq)
+        tag, length = SLOT.unpack_from(mm, offset)
+        if tag != seq + 1 or length > self.store.slot_size - SLOT.size:
+            return None
+        data = mm[offset + SLOT.size:offset + SLOT.size + length]
+        # The slot was overwritten while we copied it
+        if SLOT.unpack_from(mm, offset)[0] != tag:
+            return None
+        try:
+            record = json.loads(data)
+        except ValueError:
+            logger.warning(f"Skipping unreadable guest postback slot {seq} of {segment.path}")
+            return None
+        segment.cache[seq] = record
+        return record
+
+
+class GuestPostbackStore:
+    """Per-guest postbacks in hash-sharded ring-buffer segments of shared memory-mapped files."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        # Shards mapped by this process, least recently used first
+        self._shards = OrderedDict()
+        # Segments mapped by this process, (shard ID, hour) -> shard, oldest mapping first
+        self._mapped_segments = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config["POSTBACKS_FILE"] + ".shards"
+        self.slot_count = max(1, int(app.config.get("GUEST_POSTBACK_LIMIT", 50)))
+        self.slot_size = max(1024, int(app.config.get("GUEST_POSTBACK_SLOT_SIZE", 16384)))
+        self.ttl_hours = max(1, int(app.config.get("GUEST_POSTBACK_TTL_HOURS", 24)))
+        self.shard_count = max(1, int(app.config.get("GUEST_SHARD_COUNT", 256)))
+        self.max_active_shards = max(1, int(app.config.get("GUEST_MAX_ACTIVE_SHARDS", 64)))
+        self.max_mapped_segments = max(1, int(app.config.get("GUEST_MAX_MAPPED_SEGMENTS", 128)))
+        app.extensions["guest_postbacks"] = self
+
+    @property
+    def size(self):
+        return HEADER_SIZE + self.slot_count * self.slot_size
+
+    def shard_path(self, shard_id):
+        return os.path.join(self.root, f"{shard_id:04d}")
+
+    def shard_for(self, key):
+        return int(key, 16) % self.shard_count
+
+    def _cutoff(self):
+        """Oldest hour still within the TTL."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return current_hour(now - datetime.timedelta(hours=self.ttl_hours - 1))
+
+    def shard_ids(self):
+        """Shards that have a directory on disk."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _shard(self, shard_id):
+        with self._lock:
+            shard = self._shards.get(shard_id)
+            if shard is None:
+                shard = self._shards[shard_id] = GuestShard(self, shard_id)
+                # Unmap the least recently used shards; their files stay on disk
+                while len(self._shards) > self.max_active_shards:
+                    self._drop_mapped(self._shards.popitem(last=False)[0])
+            else:
+                self._shards.move_to_end(shard_id)
+            return shard
+
+    def _forget(self, shard_id):
+        with self._lock:
+            self._drop_mapped(shard_id)
+            return self._shards.pop(shard_id, None)
+
+    def _mapped(self, shard, hour):
+        """Note a newly mapped segment, and unmap the oldest beyond GUEST_MAX_MAPPED_SEGMENTS.
+
+        Each mapping holds file descriptors (the append lock's and mmap's), so
+        this bounds the descriptors a process keeps open however shards and
+        hours add up.
+        """
+        key = (shard.shard_id, hour)
+        with self._lock:
+            self._mapped_segments[key] = shard
+            self._mapped_segments.move_to_end(key)
+            evicted = []
+            while len(self._mapped_segments) > self.max_mapped_segments:
+                evicted.append(self._mapped_segments.popitem(last=False))
+        # Closed once no thread is still using them (see Segment)
+        for (_, old_hour), old_shard in evicted:
+            old_shard._release(old_hour)
+
+    def _drop_mapped(self, shard_id):
+        # The shard's segments go with it; called with self._lock held
+        for key in [key for key in self._mapped_segments if key[0] == shard_id]:
+            del self._mapped_segments[key]
+
+    # --- Writes ---
+
+    def append(self, record, token=None):
+        """Write one record for the guest holding token (None: the shared public key)."""
+        key = token_key(token)
+        shard = self._shard(self.shard_for(key))
+        new_shard = not os.path.isdir(shard.directory)
+        if shard.append(self._encode(dict(record, guest=key))):
+            # First write of the hour to this shard in this process: drop its old segments
+            shard.expire(self._cutoff())
+        if new_shard:
+            self.evict_idle_shards(keep=shard.shard_id)
+
+    def evict_idle_shards(self, keep=None):
+        """Remove the least recently written shards beyond GUEST_MAX_ACTIVE_SHARDS."""
+        shard_ids = self.shard_ids()
+        excess = len(shard_ids) - self.max_active_shards
+        if excess <= 0:
+            return 0
+        idle = sorted(
+            (GuestShard(self, shard_id) for shard_id in shard_ids if shard_id != keep),
+            key=GuestShard.last_write,
+        )
+        for shard in idle[:excess]:
+            (self._forget(shard.shard_id) or shard).remove()
+        logger.info(f"Evicted {min(excess, len(idle))} idle guest postback shards")
+        return min(excess, len(idle))
+
+    def expire(self):
+        """Unlink segments older than the TTL in every shard. Returns how many were removed."""
+        cutoff = self._cutoff()
+        removed = 0
+        for shard_id in self.shard_ids():
+            with self._lock:
+                shard = self._shards.get(shard_id) or GuestShard(self, shard_id)
+            removed += shard.expire(cutoff)
+        if removed:
+            logger.info(f"Removed {removed} expired guest postback segments")
+        return removed
+
+    def clear(self):
+        """Remove every guest postback."""
+        with self._lock:
+            self._shards.clear()
+            self._mapped_segments.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _encode(self, record):
+        """Serialize a record, shrinking it to a payload summary if it won't fit in a slot."""
+        capacity = self.slot_size - SLOT.size
+        data = json.dumps(record).encode()
+        if len(data) <= capacity:
+            return data
+        payload = record.get("payload") or {}
+        summary = {key: str(payload[key])[:200] for key in SUMMARY_FIELDS if payload.get(key) is not None}
+        logger.warning(f"Guest postback of {len(data)} bytes exceeds slot size; storing a summary")
+        return json.dumps(
+            {
+                "payload": summary,
+                "received_at": record.get("received_at"),
+                "headers": {},
+                "guest": record.get("guest"),
+                "truncated": True,
+            }
+        ).encode()
+
+    # --- Reads ---
+
+    def recent(self, token=None):
+        """The newest postbacks of the guest holding token (up to GUEST_POSTBACK_LIMIT), oldest first."""
+        key = token_key(token)
+        shard = self._shard(self.shard_for(key))
+        return list(reversed(shard.recent(key, self._cutoff(), self.slot_count)))
@@ -1,3 +1,4 @@
+import secrets
 import time
 from flask import session, url_for
 
@@ -21,5 +22,39 @@ def get_postback_url():
                 "postbacks.postback", user_id=session["user_id"], _external=True
             )
         else:
-            postback_url = url_for("postbacks.postback", _external=True)
+            postback_url = guest_postback_url()
     return postback_url
+
+
+def get_guest_token():
+    """Get the guest session's postback token, creating it on first use."""
+    token = session.get("guest_token")
+    if not token:
+        token = secrets.token_urlsafe(16)
+        session["guest_token"] = token
+    return token
+
+
+def guest_postback_url():
+    """Postback URL that stores postbacks for the current guest session only."""
+    return url_for("postbacks.postback", guest_token=get_guest_token(), _external=True)
+
+
+def _clip(value, max_length):
+    """Stringify a payload value and clip it to the column length."""
+    if value is None or value == "":
+        return None
+    return str(value)[:max_length]
+
+
+def extract_postback_fields(payload):
+    """Pull the denormalized UserPostback columns out of a postback payload."""
+    if not isinstance(payload, dict):
+        payload = {}
+    return {
+        "terminal_id": _clip(payload.get("terminalId"), 100),
+        "payload_status": _clip(payload.get("status"), 50),
+        "merchant_reference": _clip(payload.get("merchantReference"), 255),
+        "amount": _clip(payload.get("amount"), 20),
+        "currency": _clip(payload.get("currency"), 10),
+    }
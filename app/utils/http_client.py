@@ -0,0 +1,154 @@
+"""
+Pooled keep-alive HTTP client for outbound API calls.
+
+Every outbound call (Terminal Connect, WU check, Brevo email) goes through
+the app's HttpClient (app.extensions["http_client"]) instead of the
+module-level requests functions, which open a fresh TCP connection and TLS
+handshake per call. The client keeps one requests.Session per upstream
+host, each with a connection pool of HTTP_POOL_SIZE keep-alive connections,
+so a sale's create-intent and process calls (and a linked refund's details
+lookup) reuse the same connection.
+
+The CA bundle (VERIFY_PATH, or requests' bundled certifi file) is loaded
+once into a shared SSL context rather than re-read for every new
+connection. Sessions don't keep cookies, since one session serves every
+user of the worker. Sessions are created per process, so a forked worker
+never shares sockets with its parent.
+
+stats() reports, per host, how many connections were opened and how many
+requests they served, for sizing HTTP_POOL_SIZE.
+"""
+
+import logging
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+from urllib3.util.ssl_ import create_urllib3_context
+
+from .api import ENVIRONMENT_URLS, VERIFY_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def host_key(url):
+    """scheme://host[:port] of a URL; each gets its own session and pool."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def create_ssl_context(cafile=None):
+    """SSL context with the CA bundle loaded once."""
+    context = create_urllib3_context()
+    context.load_verify_locations(cafile=cafile or VERIFY_PATH or DEFAULT_CA_BUNDLE_PATH)
+    return context
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections share one pre-loaded SSL context."""
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if verify is True and url.lower().startswith("https"):
+            # The CA bundle is already in the shared context; don't re-read it per connection
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+class HttpClient:
+    """Per-process pooled requests sessions, one per upstream host."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._pid = os.getpid()
+        self._ssl_context = None
+        self.pool_size = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.pool_size = max(1, int(app.config.get("HTTP_POOL_SIZE", 10)))
+        app.extensions["http_client"] = self
+        # Terminal Connect hosts are used by nearly every request, set them up front
+        for base_url in ENVIRONMENT_URLS.values():
+            self.session_for(base_url)
+
+    def _new_session(self):
+        if self._ssl_context is None:
+            self._ssl_context = create_ssl_context()
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = PooledAdapter(
+            self._ssl_context, pool_connections=1, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url):
+        """The pooled session for url's host, created on first use in this process."""
+        key = host_key(url)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's sockets must not be reused here
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = self._new_session()
+            return session
+
+    def request(self, method, url, **kwargs):
+        """requests.request() over the host's pooled session."""
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Connection pool counters per host, for this process."""
+        with self._lock:
+            sessions = dict(self._sessions) if self._pid == os.getpid() else {}
+        hosts = {}
+        for key, session in sessions.items():
+            opened = served = idle = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    opened += pool.num_connections
+                    served += pool.num_requests
+                    if pool.pool is not None:
+                        idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            hosts[key] = {
+                "connections_opened": opened,
+                "requests": served,
+                "reused": max(0, served - opened),
+                "idle_connections": idle,
+            }
+        return {"pool_size": self.pool_size, "hosts": hosts}
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
@@ -0,0 +1,105 @@
+"""
+Short-lived cache of intent details lookups.
+
+Linked refunds and reversals on Charge Anywhere TIDs look up the parent
+intent (GET /merchant/{mid}/intent/{id}) before creating their own, and
+testers often run several against the same sale in a row. Successful
+lookups are kept for INTENT_CACHE_TTL seconds in a per-worker LRU of at
+most INTENT_CACHE_SIZE entries, keyed by gateway base URL, MID, API key
+(hashed) and intent ID.
+
+Concurrent lookups of the same intent are single-flighted: the first
+caller fetches, the others wait for its result, so a burst makes one
+outbound call. Errors are returned to every waiter but never cached.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A lookup in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class IntentDetailsCache:
+    """Bounded TTL LRU of intent details with single-flight fetching."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self.max_size = 256
+        self.ttl = 60.0
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = max(1, int(app.config.get("INTENT_CACHE_SIZE", 256)))
+        self.ttl = max(0.0, float(app.config.get("INTENT_CACHE_TTL", 60)))
+        app.extensions["intent_details_cache"] = self
+
+    def get_or_fetch(self, key, fetch):
+        """Cached (data, None) for key, or the result of fetch(), which returns (data, error)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1], None
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            flight.result = (None, str(e))
+            raise
+        finally:
+            if flight.result is None:
+                # fetch() was interrupted (e.g. KeyboardInterrupt/SystemExit as a worker stops)
+                flight.result = (None, "Intent details lookup was interrupted")
+            with self._lock:
+                data, error = flight.result
+                if error is None and self.ttl > 0:
+                    self._entries[key] = (time.monotonic() + self.ttl, data)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.stats["evictions"] += 1
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                max_size=self.max_size,
+                ttl=self.ttl,
+                hit_ratio=round((self.stats["hits"] + self.stats["coalesced"]) / lookups, 3) if lookups else 0.0,
+            )
@@ -0,0 +1,332 @@
+"""
+Ledger of outbound intents, for create -> process -> postback latency.
+
+run_transaction() records each intent it creates and processes, and the
+/postback route records each postback's arrival, as events on an
+IntentLedger (app.extensions["intent_ledger"]). Nothing is written on the
+request path: a background thread applies queued events to the
+outbound_intents table every INTENT_LEDGER_FLUSH_INTERVAL seconds, creates
+first, then processes, then postbacks. Joining a postback to its intent
+stores the postback latency (after processing, or after creation for
+intents the gateway completes itself) and the end-to-end latency from the
+create call. A postback joined before its intent's process event is
+re-measured from processing when that event is written. Only the first
+postback for an intent is counted.
+
+A postback can reach a different worker process than the one that created
+its intent, before that worker has written the row, so postbacks that match
+no row are retried for INTENT_LEDGER_MATCH_WINDOW seconds. Postbacks for
+intents this app didn't create are dropped after that. If the queue is full,
+events are dropped and counted: the ledger is for measurement, unlike the
+postbacks themselves.
+
+latency_report() summarises the ledger per environment and TID; entries
+older than INTENT_LEDGER_RETENTION_DAYS are deleted by sweep().
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from flask import session
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..models import OutboundIntent, db, ensure_aware, utc_now
+from .batch import latency_summary
+from .guest_store import token_key
+
+logger = logging.getLogger(__name__)
+
+CREATE = "create"
+PROCESS = "process"
+POSTBACK = "postback"
+LATENCIES = ("create", "process", "postback", "end_to_end")
+# Longest latency report window, in hours
+MAX_REPORT_HOURS = 24 * 90
+
+
+def _seconds(start, end):
+    return (ensure_aware(end) - ensure_aware(start)).total_seconds()
+
+
+def _postback_latency(start, received_at):
+    # A postback can arrive before the process call's response does
+    return max(0.0, _seconds(start, received_at))
+
+
+def _insert_new_intents():
+    """INSERT into outbound_intents that skips intent IDs already recorded."""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(OutboundIntent)
+    return dialect_insert(OutboundIntent).on_conflict_do_nothing(index_elements=["intent_id"])
+
+
+def ledger_owner():
+    """Ledger owner fields for the current session (batch workers carry the submitter's)."""
+    user_id = session.get("user_id") or session.get("postback_user_id")
+    if user_id:
+        return {"user_id": user_id, "guest_key": None}
+    token = session.get("guest_token") or session.get("postback_guest_token")
+    return {"user_id": None, "guest_key": token_key(token) if token else None}
+
+
+class IntentLedger:
+    """Queues ledger events and writes them to outbound_intents on a background thread."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._unmatched = []
+        self.stats = {"recorded": 0, "dropped": 0, "written": 0, "joined": 0, "unmatched": 0, "failed": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = float(app.config.get("INTENT_LEDGER_FLUSH_INTERVAL", 0.5))
+        self.match_window = float(app.config.get("INTENT_LEDGER_MATCH_WINDOW", 30))
+        self.retention_days = int(app.config.get("INTENT_LEDGER_RETENTION_DAYS", 30))
+        self.report_limit = max(1, int(app.config.get("INTENT_LEDGER_REPORT_LIMIT", 50000)))
+        self._queue = queue.Queue(maxsize=max(1, int(app.config.get("INTENT_LEDGER_QUEUE_SIZE", 10000))))
+        # Tests drive the ledger through flush() instead of a live thread
+        self._autostart = not app.testing
+        app.extensions["intent_ledger"] = self
+        if self._autostart:
+            atexit.register(self.shutdown)
+
+    # --- Producer side ---
+
+    def record_create(self, intent_id, kind, requested_at, created_at, amount=None, merchant_reference=None):
+        """Record an intent created with the current session's configuration."""
+        row = {
+            "intent_id": intent_id,
+            "environment": session.get("ENVIRONMENT"),
+            "mid": session.get("MID"),
+            "tid": session.get("TID"),
+            "transaction_type": kind,
+            "amount": amount,
+            "merchant_reference": merchant_reference,
+            "requested_at": requested_at,
+            "created_at": created_at,
+            "create_latency": _seconds(requested_at, created_at),
+        }
+        row.update(ledger_owner())
+        self._record((CREATE, row))
+
+    def record_process(self, intent_id, processed_at, latency):
+        self._record((PROCESS, intent_id, processed_at, latency))
+
+    def record_postback(self, intent_id, status, received_at=None):
+        if intent_id:
+            self._record((POSTBACK, str(intent_id), status, received_at or utc_now(), time.monotonic()))
+
+    def _record(self, event):
+        if self._autostart:
+            self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+            self.stats["recorded"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _ensure_started(self):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="intent-ledger", daemon=True)
+                self._thread.start()
+
+    # --- Consumer side ---
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Intent ledger flush failed: {e}")
+
+    def flush(self):
+        """Apply everything queued, and retry unmatched postbacks. Returns events applied."""
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        events.extend(self._unmatched)
+        self._unmatched = []
+        if not events:
+            return 0
+
+        with self.app.app_context():
+            try:
+                applied = self._write_creates([e[1] for e in events if e[0] == CREATE])
+                applied += self._write_processes([e for e in events if e[0] == PROCESS])
+                applied += self._join_postbacks([e for e in events if e[0] == POSTBACK])
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                self.stats["failed"] += len(events)
+                logger.error(f"Dropping {len(events)} intent ledger events: {e}")
+                return 0
+            finally:
+                db.session.remove()
+        return applied
+
+    def _write_creates(self, rows):
+        if not rows:
+            return 0
+        fresh = {}
+        for row in rows:
+            fresh.setdefault(row["intent_id"], row)
+        # Idempotent replays return an intent that's already recorded, possibly
+        # by another worker in the same moment, so duplicates are skipped
+        # rather than failing the whole flush
+        statement = _insert_new_intents().returning(OutboundIntent.intent_id)
+        written = len(db.session.scalars(statement, list(fresh.values())).all())
+        self.stats["written"] += written
+        return written
+
+    def _write_processes(self, events):
+        if not events:
+            return 0
+        rows = {
+            row.intent_id: row
+            for row in db.session.scalars(
+                select(OutboundIntent).where(OutboundIntent.intent_id.in_({e[1] for e in events}))
+            )
+        }
+        for _, intent_id, processed_at, latency in events:
+            row = rows.get(intent_id)
+            if row is None:
+                continue
+            row.processed_at = processed_at
+            row.process_latency = latency
+            # A postback joined before this event (it beat the process response,
+            # or another worker's flush) was measured from creation
+            if row.postback_at is not None:
+                row.postback_latency = _postback_latency(processed_at, row.postback_at)
+        return len(events)
+
+    def _join_postbacks(self, events):
+        if not events:
+            return 0
+        rows = {
+            row.intent_id: row
+            for row in db.session.scalars(
+                select(OutboundIntent).where(OutboundIntent.intent_id.in_({e[1] for e in events}))
+            )
+        }
+        joined = 0
+        now = time.monotonic()
+        for event in events:
+            _, intent_id, status, received_at, recorded = event
+            row = rows.get(intent_id)
+            if row is None:
+                if now - recorded < self.match_window:
+                    self._unmatched.append(event)
+                else:
+                    self.stats["unmatched"] += 1
+                continue
+            if row.postback_at is not None:
+                continue
+            row.postback_at = received_at
+            row.postback_status = status
+            row.postback_latency = _postback_latency(row.processed_at or row.created_at, received_at)
+            row.end_to_end_latency = _seconds(row.requested_at, received_at)
+            joined += 1
+        self.stats["joined"] += joined
+        return joined
+
+    def shutdown(self, timeout=5.0):
+        """Stop the background thread and write what's queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Intent ledger shutdown flush failed: {e}")
+
+    # --- Maintenance and reporting ---
+
+    def sweep(self):
+        """Delete entries older than the retention period. Returns rows deleted."""
+        cutoff = utc_now() - timedelta(days=self.retention_days)
+        with self.app.app_context():
+            result = db.session.execute(delete(OutboundIntent).where(OutboundIntent.created_at < cutoff))
+            db.session.commit()
+            return result.rowcount
+
+    def snapshot(self):
+        """Counters for the admin metrics endpoint."""
+        return dict(self.stats, queued=self._queue.qsize(), awaiting_match=len(self._unmatched))
+
+
+def latency_report(hours=24, user_id=None, guest_key=None, environment=None, tid=None, limit=50000):
+    """Latency percentiles per environment and TID over the last `hours`.
+
+    Scoped to one user or guest when either is given (admins pass neither).
+    Only the most recent `limit` intents are read.
+    """
+    since = utc_now() - timedelta(hours=hours)
+    query = select(OutboundIntent).where(OutboundIntent.created_at >= since)
+    if user_id is not None:
+        query = query.where(OutboundIntent.user_id == user_id)
+    elif guest_key is not None:
+        query = query.where(OutboundIntent.guest_key == guest_key)
+    if environment:
+        query = query.where(OutboundIntent.environment == environment)
+    if tid:
+        query = query.where(OutboundIntent.tid == tid)
+    rows = db.session.scalars(query.order_by(OutboundIntent.created_at.desc()).limit(limit + 1)).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.environment or "", row.tid or ""), []).append(row)
+
+    report = []
+    for (env, group_tid), entries in sorted(groups.items()):
+        answered = [row for row in entries if row.postback_at is not None]
+        report.append(
+            {
+                "environment": env,
+                "tid": group_tid,
+                "count": len(entries),
+                "with_postback": len(answered),
+                "awaiting_postback": len(entries) - len(answered),
+                "statuses": dict(Counter(row.postback_status or "UNKNOWN" for row in answered)),
+                "latency_ms": {
+                    name: latency_summary(
+                        [getattr(row, f"{name}_latency") for row in entries if getattr(row, f"{name}_latency") is not None]
+                    )
+                    for name in LATENCIES
+                },
+            }
+        )
+    return {
+        "since": since.isoformat(),
+        "hours": hours,
+        "intents": len(rows),
+        "truncated": truncated,
+        "groups": report,
+    }
@@ -0,0 +1,136 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are keyed on (created_at, id) in descending order, so fetching any
+page is an index range scan of at most per_page + 1 rows instead of an
+OFFSET scan plus a COUNT(*). Cursors are opaque URL-safe tokens; a "next"
+cursor walks towards older rows and a "prev" cursor towards newer ones.
+
+Total counts are optional and served from a short-lived per-process cache
+(CountCache) that ingest invalidates for the affected user.
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, row_id, direction):
+    """Encode a row position and direction ("next" or "prev") as an opaque token."""
+    raw = json.dumps({"t": created_at.isoformat(), "i": row_id, "d": direction})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a cursor token. Returns (created_at, id, direction) or None if invalid."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = data["d"]
+        if direction not in ("next", "prev"):
+            return None
+        return datetime.fromisoformat(data["t"]), int(data["i"]), direction
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """One page of keyset-paginated rows with cursors to its neighbours."""
+
+    def __init__(self, items, per_page, has_next, has_prev, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.next_cursor = (
+            encode_cursor(items[-1].created_at, items[-1].id, "next") if has_next and items else None
+        )
+        self.prev_cursor = (
+            encode_cursor(items[0].created_at, items[0].id, "prev") if has_prev and items else None
+        )
+
+    @property
+    def next_params(self):
+        return {"cursor": self.next_cursor}
+
+    @property
+    def prev_params(self):
+        return {"cursor": self.prev_cursor}
+
+    def to_dict(self):
+        return {
+            "per_page": self.per_page,
+            "has_next": self.has_next,
+            "has_prev": self.has_prev,
+            "next_cursor": self.next_cursor,
+            "prev_cursor": self.prev_cursor,
+            "total": self.total,
+        }
+
+
+def keyset_paginate(query, model, per_page, cursor=None, total=None):
+    """Fetch one page of `query` ordered newest first by (created_at, id).
+
+    `cursor` is a token from a previous page; an invalid or missing cursor
+    starts from the newest row.
+    """
+    position = decode_cursor(cursor)
+    created_at, id_col = model.created_at, model.id
+
+    if position is None:
+        rows = query.order_by(created_at.desc(), id_col.desc()).limit(per_page + 1).all()
+        return KeysetPage(rows[:per_page], per_page, len(rows) > per_page, False, total)
+
+    cursor_time, cursor_id, direction = position
+    if direction == "next":
+        rows = (
+            query.filter(
+                or_(created_at < cursor_time, and_(created_at == cursor_time, id_col < cursor_id))
+            )
+            .order_by(created_at.desc(), id_col.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        return KeysetPage(rows[:per_page], per_page, len(rows) > per_page, True, total)
+
+    rows = (
+        query.filter(
+            or_(created_at > cursor_time, and_(created_at == cursor_time, id_col > cursor_id))
+        )
+        .order_by(created_at.asc(), id_col.asc())
+        .limit(per_page + 1)
+        .all()
+    )
+    items = list(reversed(rows[:per_page]))
+    return KeysetPage(items, per_page, True, len(rows) > per_page, total)
+
+
+class CountCache:
+    """Short-lived per-process cache of COUNT(*) results, grouped by owner."""
+
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_compute(self, owner, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(owner, {}).get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+        value = compute()
+        with self._lock:
+            self._entries.setdefault(owner, {})[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, owner):
+        with self._lock:
+            self._entries.pop(owner, None)
@@ -0,0 +1,243 @@
+"""
+Notification bus for newly ingested postbacks.
+
+Ingest publishes a small summary of every stored postback on a channel
+("user:<id>" for a user's postbacks, "guest:<key>" for a guest token's
+postbacks in the guest store),
+and consumers such as the /postbacks/stream SSE endpoint subscribe to the
+channels they care about. Each subscription has its own bounded queue; a
+subscriber that falls behind loses events rather than slowing ingest.
+
+Backends (POSTBACK_EVENTS_BACKEND):
+- "local": events are delivered to subscribers in the publishing process
+  only. Used with SQLite, where every gunicorn worker is its own island.
+- "postgres": events are sent with pg_notify and a listener thread per
+  worker LISTENs and delivers them, so a stream in one worker sees
+  postbacks ingested by any other worker.
+- "auto" (default): "postgres" for PostgreSQL databases, "local" otherwise.
+"""
+
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from ..models import db
+
+logger = logging.getLogger(__name__)
+
+PG_CHANNEL = "postback_events"
+# pg_notify payloads must stay below 8000 bytes
+PG_PAYLOAD_LIMIT = 7900
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def guest_channel(key):
+    """Channel for a guest store key (see guest_store.token_key())."""
+    return f"guest:{key}"
+
+
+def _format_time(value):
+    if hasattr(value, "isoformat"):
+        return value.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    return value
+
+
+def postback_event(row, postback_id=None):
+    """Summary of a stored UserPostback row, as published to subscribers."""
+    return {
+        "id": postback_id,
+        "received_at": _format_time(row.get("created_at")),
+        "transaction_type": row.get("transaction_type"),
+        "transaction_id": row.get("transaction_id"),
+        "intent_id": row.get("intent_id"),
+        "payload_status": row.get("payload_status"),
+        "terminal_id": row.get("terminal_id"),
+        "merchant_reference": row.get("merchant_reference"),
+    }
+
+
+def guest_postback_event(record):
+    """Event for a guest store record; guests have no detail endpoint, so the payload is included."""
+    payload = record.get("payload") or {}
+    return {
+        "id": None,
+        "received_at": record.get("received_at"),
+        "transaction_type": payload.get("transactionType"),
+        "transaction_id": payload.get("transactionId"),
+        "intent_id": payload.get("intentId", "unknown_intent"),
+        "payload_status": payload.get("status"),
+        "terminal_id": payload.get("terminalId"),
+        "merchant_reference": payload.get("merchantReference"),
+        "payload": payload,
+        "headers": record.get("headers"),
+    }
+
+
+class Subscription:
+    """A subscriber's bounded event queue."""
+
+    def __init__(self, channels, maxsize):
+        self.channels = frozenset(channels)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, channel, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout=None):
+        """Next event, or None if none arrived within timeout seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PostbackEventBus:
+    """Publishes ingest events to in-process subscribers, optionally via PostgreSQL."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = "local"
+        self.queue_size = 100
+        self.max_subscribers = 500
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listener = None
+        self._stop = threading.Event()
+        self.stats = {"published": 0, "delivered": 0, "publish_errors": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        backend = app.config.get("POSTBACK_EVENTS_BACKEND", "auto")
+        if backend == "auto":
+            uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
+            backend = "postgres" if uri.startswith("postgres") else "local"
+        self.backend = backend
+        self.queue_size = max(1, int(app.config.get("POSTBACK_EVENTS_QUEUE_SIZE", 100)))
+        self.max_subscribers = max(1, int(app.config.get("POSTBACK_EVENTS_MAX_SUBSCRIBERS", 500)))
+        app.extensions["postback_events"] = self
+
+    # --- Subscribers ---
+
+    def subscribe(self, *channels, subscription=None):
+        """Register a subscription. Returns None when the subscriber cap is reached."""
+        subscription = subscription or Subscription(channels, self.queue_size)
+        with self._lock:
+            if self.subscriber_count() >= self.max_subscribers:
+                return None
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        if self.backend == "postgres":
+            self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    # --- Publishers ---
+
+    def publish(self, channel, event):
+        self.publish_many([(channel, event)])
+
+    def publish_many(self, events):
+        """Publish (channel, event) pairs. Errors are logged, never raised to ingest."""
+        if not events:
+            return
+        self.stats["published"] += len(events)
+        if self.backend != "postgres":
+            for channel, event in events:
+                self._dispatch(channel, event)
+            return
+        try:
+            with db.engine.connect() as conn:
+                for channel, event in events:
+                    conn.execute(
+                        text("SELECT pg_notify(:name, :payload)"),
+                        {"name": PG_CHANNEL, "payload": self._encode(channel, event)},
+                    )
+                conn.commit()
+        except Exception as e:
+            self.stats["publish_errors"] += 1
+            logger.error(f"Failed to publish {len(events)} postback events: {e}")
+
+    def _encode(self, channel, event):
+        payload = json.dumps({"channel": channel, "event": event})
+        if len(payload.encode()) > PG_PAYLOAD_LIMIT:
+            # Too large for NOTIFY: send the summary and let the client reload
+            event = {k: v for k, v in event.items() if k not in ("payload", "headers")}
+            payload = json.dumps({"channel": channel, "event": dict(event, truncated=True)})
+        return payload
+
+    def _dispatch(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(channel, event)
+        self.stats["delivered"] += len(subscribers)
+
+    # --- PostgreSQL listener ---
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name="postback-events-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    raw = db.engine.raw_connection()
+                # The connection is switched to autocommit, keep it out of the pool
+                raw.detach()
+                try:
+                    conn = raw.driver_connection
+                    conn.autocommit = True
+                    conn.cursor().execute(f"LISTEN {PG_CHANNEL}")
+                    logger.info("Listening for postback events")
+                    while not self._stop.is_set():
+                        if select.select([conn], [], [], 5) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self._receive(conn.notifies.pop(0).payload)
+                finally:
+                    raw.close()
+            except Exception as e:
+                logger.error(f"Postback event listener failed, reconnecting: {e}")
+                time.sleep(1)
+
+    def _receive(self, payload):
+        try:
+            message = json.loads(payload)
+            self._dispatch(message["channel"], message["event"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed postback event: {e}")
+
+    def shutdown(self):
+        self._stop.set()
@@ -0,0 +1,338 @@
+"""
+Write-behind ingest pipeline for user postbacks.
+
+When POSTBACK_INGEST_MODE is "batched" the /postback route validates the
+payload, builds the row and hands it to a PostbackWriter. The writer keeps a
+bounded in-process queue and a background thread that inserts rows in
+multi-row batches, either when POSTBACK_BATCH_SIZE rows are waiting or when
+POSTBACK_FLUSH_INTERVAL seconds have passed since the first queued row.
+
+If the queue is full, rows are appended to an NDJSON spool file on disk
+(POSTBACK_SPOOL_FILE) so a burst never drops postbacks; the writer drains
+the spool once it has caught up. A drain claims the spool by renaming it
+while holding its flock, and appenders recheck the path after locking, so
+no append lands in a file that has already been read. If writing a claimed
+file fails, its unwritten rows stay on disk and the next drain (in any
+worker) picks them up. Only rows the database rejects are dropped; a batch
+that fails for any other reason (e.g. the database is unreachable) is
+spooled and retried by the drain. Pending rows are flushed on worker exit.
+"""
+
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+
+from ..models import db, UserPostback
+from .postback_events import postback_event, user_channel
+
+logger = logging.getLogger(__name__)
+
+# Errors that only concern the row being inserted; anything else is retried later
+ROW_ERRORS = (IntegrityError, DataError)
+# Suffix of spool files claimed by a drain (followed by pid and thread id)
+CLAIMED = ".claimed."
+
+
+class PostbackWriter:
+    """Batches UserPostback inserts on a background thread."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"enqueued": 0, "spooled": 0, "written": 0, "failed": 0, "batches": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = max(1, int(app.config.get("POSTBACK_BATCH_SIZE", 200)))
+        self.flush_interval = float(app.config.get("POSTBACK_FLUSH_INTERVAL", 0.5))
+        self.spool_file = app.config.get("POSTBACK_SPOOL_FILE", "/tmp/postbacks-spool.ndjson")
+        self._queue = queue.Queue(maxsize=max(1, int(app.config.get("POSTBACK_QUEUE_SIZE", 10000))))
+        # Tests drive the writer through flush() instead of a live thread
+        self._autostart = not app.testing
+        app.extensions["postback_writer"] = self
+        atexit.register(self.shutdown)
+
+    # --- Producer side ---
+
+    def enqueue(self, row):
+        """Queue a postback row for writing, spooling to disk if the queue is full."""
+        if self._autostart:
+            self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+            self.stats["enqueued"] += 1
+        except queue.Full:
+            self._spool([row])
+            self.stats["spooled"] += 1
+
+    def _ensure_started(self):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="postback-writer", daemon=True
+                )
+                self._thread.start()
+
+    # --- Consumer side ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # Nothing of the batch was stored; keep it on disk for the spool drain
+                    logger.error(f"Writing {len(batch)} postbacks failed ({e}); spooling them")
+                    self._spool(batch)
+                    self.stats["spooled"] += len(batch)
+                    self._stop.wait(self.flush_interval)
+            elif self._has_spooled():
+                try:
+                    self._drain_spool()
+                except Exception as e:
+                    # The claimed rows stay on disk and are retried on the next pass
+                    logger.error(f"Draining the postback spool failed: {e}")
+                    self._stop.wait(self.flush_interval)
+
+    def _collect_batch(self):
+        """Block for the first row, then gather more until size or time limit."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Synchronously write everything queued or spooled. Returns rows written."""
+        written = 0
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            try:
+                written += self._write_batch(batch)
+            except Exception:
+                self._spool(batch)
+                self.stats["spooled"] += len(batch)
+                raise
+        written += self._drain_spool()
+        return written
+
+    def shutdown(self, timeout=5.0):
+        """Stop the background thread and flush pending rows."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            # Last resort: keep the rows on disk for the next worker
+            logger.error(f"Postback writer shutdown flush failed: {e}")
+            pending = []
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if pending:
+                self._spool(pending)
+
+    def _write_batch(self, rows):
+        """Insert rows in one multi-row statement, isolating bad rows on failure.
+
+        Only rows the database rejects (IntegrityError, DataError) are
+        dropped. Any other database error, such as a lost connection, is
+        raised when nothing has been stored yet; once rows are being
+        retried one by one, the rest of the batch is spooled instead.
+        """
+        with self.app.app_context():
+            # Ids come back in row order so live events can link to the detail view
+            statement = insert(UserPostback).returning(UserPostback.id, sort_by_parameter_order=True)
+            try:
+                ids = db.session.execute(statement, rows).scalars().all()
+                db.session.commit()
+                stored = list(zip(rows, ids))
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                if not isinstance(e, ROW_ERRORS):
+                    raise
+                logger.warning(f"Batch insert of {len(rows)} postbacks failed ({e}); retrying row by row")
+                stored = []
+                for index, row in enumerate(rows):
+                    try:
+                        ids = db.session.execute(statement, [row]).scalars().all()
+                        db.session.commit()
+                        stored.append((row, ids[0]))
+                    except ROW_ERRORS as row_error:
+                        db.session.rollback()
+                        self.stats["failed"] += 1
+                        logger.error(
+                            f"Dropping postback {row.get('intent_id')} for user {row.get('user_id')}: {row_error}"
+                        )
+                    except SQLAlchemyError as row_error:
+                        db.session.rollback()
+                        remaining = rows[index:]
+                        logger.error(f"Writing postbacks failed ({row_error}); spooling {len(remaining)}")
+                        self._spool(remaining)
+                        self.stats["spooled"] += len(remaining)
+                        break
+            written = len(stored)
+            self.stats["written"] += written
+            self.stats["batches"] += 1
+            retention = self.app.extensions.get("postback_retention")
+            counts = self.app.extensions.get("postback_counts")
+            events = self.app.extensions.get("postback_events")
+            if written:
+                # The rows are stored, so a failing hook mustn't get them spooled again
+                try:
+                    for user_id, count in Counter(row["user_id"] for row, _ in stored).items():
+                        if retention is not None:
+                            retention.note_ingest(user_id, count)
+                        if counts is not None:
+                            counts.invalidate(user_id)
+                    if events is not None:
+                        events.publish_many(
+                            [(user_channel(row["user_id"]), postback_event(row, pk)) for row, pk in stored]
+                        )
+                except Exception as e:
+                    logger.error(f"Post-ingest updates for {written} postbacks failed: {e}")
+        return written
+
+    # --- Disk spool ---
+
+    def _claims(self):
+        return glob.glob(f"{self.spool_file}{CLAIMED}*")
+
+    def _has_spooled(self):
+        return os.path.exists(self.spool_file) or bool(self._claims())
+
+    def _is_spool(self, f):
+        """Whether the open file f is still the one at spool_file (not yet claimed by a drain)."""
+        try:
+            return os.stat(self.spool_file).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _spool(self, rows):
+        os.makedirs(os.path.dirname(self.spool_file) or ".", exist_ok=True)
+        while True:
+            with open(self.spool_file, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # A drain may have claimed the file while we waited for the lock
+                    if not self._is_spool(f):
+                        continue
+                    f.write("".join(_encode(row) for row in rows))
+                    f.flush()
+                    return
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _drain_spool(self):
+        """Claim the spool file and write its rows, after any claims a failed drain left. Returns rows written."""
+        written = 0
+        for path in self._claims():
+            written += self._drain_claim(path)
+        try:
+            f = open(self.spool_file, "r")
+        except FileNotFoundError:
+            return written
+        with f:
+            # Renamed under the lock, so appenders waiting on it see the new inode and reopen
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if not self._is_spool(f):
+                return written
+            claimed = f"{self.spool_file}{CLAIMED}{os.getpid()}.{threading.get_ident()}"
+            os.rename(self.spool_file, claimed)
+            written += self._write_claim(f, claimed)
+        return written
+
+    def _drain_claim(self, path):
+        """Write a claim left behind by a failed drain, unless another drain holds it."""
+        try:
+            f = open(path, "r")
+        except FileNotFoundError:
+            return 0
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            # Written and removed by its drain between our open and lock
+            if os.fstat(f.fileno()).st_nlink == 0:
+                return 0
+            return self._write_claim(f, path)
+
+    def _write_claim(self, f, path):
+        """Write the rows of a locked claim file and remove it.
+
+        If a batch fails, the rows not yet written are left in the file for
+        the next drain and the error is raised.
+        """
+        rows = []
+        for line in f.readlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                record["created_at"] = datetime.fromisoformat(record["created_at"])
+                rows.append(record)
+            except (ValueError, KeyError) as e:
+                logger.error(f"Skipping unreadable spooled postback: {e}")
+
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            try:
+                written += self._write_batch(rows[start:start + self.batch_size])
+            except Exception:
+                remaining = f"{self.spool_file}.remaining.{os.getpid()}.{threading.get_ident()}"
+                with open(remaining, "w") as out:
+                    out.write("".join(_encode(row) for row in rows[start:]))
+                os.replace(remaining, path)
+                raise
+        os.remove(path)
+        return written
+
+
+def _encode(row):
+    record = dict(row)
+    record["created_at"] = record["created_at"].isoformat()
+    return json.dumps(record) + "\n"
@@ -0,0 +1,113 @@
+"""
+Amortized per-user retention for stored postbacks.
+
+Ingest only bumps an in-memory per-user counter (note_ingest); it never
+counts or deletes rows itself. A background job (sweep) periodically
+reconciles the counters with the database and, once a user is more than
+POSTBACK_RETENTION_SLACK rows over POSTBACK_RETENTION_CAP, deletes the
+oldest overflow in a single bulk statement.
+
+Counters are per worker process, so every few sweeps all tracked users are
+recounted to pick up rows written by other workers.
+"""
+
+import logging
+import threading
+
+from sqlalchemy import delete, func, select
+
+from ..models import db, UserPostback
+
+logger = logging.getLogger(__name__)
+
+
+class PostbackRetention:
+    """Tracks per-user postback counts and trims overflow in bulk."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._unseeded = set()
+        self._dirty = set()
+        self._sweeps = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.cap = max(1, int(app.config.get("POSTBACK_RETENTION_CAP", 10000)))
+        self.slack = max(0, int(app.config.get("POSTBACK_RETENTION_SLACK", 500)))
+        self.recount_every = max(1, int(app.config.get("POSTBACK_RETENTION_RECOUNT_EVERY", 10)))
+        app.extensions["postback_retention"] = self
+
+    @property
+    def threshold(self):
+        """Row count above which a user is trimmed back to the cap."""
+        return self.cap + self.slack
+
+    def note_ingest(self, user_id, count=1):
+        """Record newly stored postbacks for a user. O(1), no database access."""
+        with self._lock:
+            if user_id in self._counts:
+                self._counts[user_id] += count
+                if self._counts[user_id] > self.threshold:
+                    self._dirty.add(user_id)
+            else:
+                self._unseeded.add(user_id)
+
+    def sweep(self):
+        """Reconcile counters with the database and trim users over the threshold.
+
+        Returns a dict of user_id -> rows deleted.
+        """
+        with self._lock:
+            self._sweeps += 1
+            to_count = self._unseeded | self._dirty
+            if self._sweeps % self.recount_every == 0:
+                to_count |= set(self._counts)
+            self._unseeded = set()
+            self._dirty = set()
+
+        if not to_count:
+            return {}
+
+        trimmed = {}
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(UserPostback.user_id, func.count(UserPostback.id))
+                .where(UserPostback.user_id.in_(to_count))
+                .group_by(UserPostback.user_id)
+            ).all()
+            counts = {user_id: count for user_id, count in rows}
+
+            for user_id in to_count:
+                count = counts.get(user_id, 0)
+                if count > self.threshold:
+                    trimmed[user_id] = self._trim(user_id, count - self.cap)
+                    count -= trimmed[user_id]
+                counts[user_id] = count
+
+        with self._lock:
+            # Drift from concurrent ingest is corrected by the periodic recount
+            self._counts.update(counts)
+
+        if trimmed:
+            logger.info(f"Postback retention trimmed {sum(trimmed.values())} rows for {len(trimmed)} users")
+        return trimmed
+
+    def _trim(self, user_id, excess):
+        """Delete the `excess` oldest postbacks for a user in one statement."""
+        oldest = (
+            select(UserPostback.id)
+            .where(UserPostback.user_id == user_id)
+            .order_by(UserPostback.created_at.asc(), UserPostback.id.asc())
+            .limit(excess)
+        )
+        result = db.session.execute(
+            delete(UserPostback)
+            .where(UserPostback.id.in_(oldest))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
@@ -0,0 +1,100 @@
+"""
+Indexed search over stored user postbacks.
+
+search_filter() turns the search box text into a filter on UserPostback
+that is served by an index on every supported database:
+
+- SQLite: an external-content FTS5 table (user_postbacks_fts) over the
+  intent, transaction, terminal and merchant reference columns, kept in
+  sync by triggers so every ingest path (inline, batched, backfill,
+  retention deletes) maintains it. Queries are token prefix matches, so
+  "intent-al" finds "intent-alpha-123" but, unlike the ILIKE filter, a
+  fragment from inside a token ("lpha") matches nothing.
+- PostgreSQL: pg_trgm GIN indexes on the same columns (created by the
+  migration when the extension can be installed) make the ILIKE '%...%'
+  substring filter index-assisted.
+
+The search migration keeps a frozen copy of the FTS DDL; a test checks
+that it matches the DDL here.
+
+Anything else, or a SQLite database whose FTS table hasn't been created
+yet, falls back to the plain ILIKE filter.
+"""
+
+import re
+import weakref
+
+from sqlalchemy import DDL, Integer, column, event, inspect, text
+
+from ..models import db, UserPostback
+
+FTS_TABLE = "user_postbacks_fts"
+SEARCH_COLUMNS = ("intent_id", "transaction_id", "terminal_id", "merchant_reference")
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new_values = ", ".join(f"new.{col}" for col in SEARCH_COLUMNS)
+_old_values = ", ".join(f"old.{col}" for col in SEARCH_COLUMNS)
+
+# One statement per DDL: sqlite3 executes a single statement at a time
+SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_columns}, content='user_postbacks', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+]
+
+# Keep the FTS index alongside the table when it is created with create_all()
+for _statement in SQLITE_FTS_DDL:
+    event.listen(
+        UserPostback.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    UserPostback.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"),
+)
+
+# Engines already known to have the FTS table
+_fts_engines = weakref.WeakSet()
+
+
+def _has_fts_table():
+    engine = db.engine
+    if engine not in _fts_engines:
+        if not inspect(engine).has_table(FTS_TABLE):
+            return False
+        _fts_engines.add(engine)
+    return True
+
+
+def fts_match_query(search_query):
+    """Build an FTS5 prefix phrase query, or None if the text has no word tokens."""
+    terms = re.findall(r"\w+", search_query.lower())
+    if not terms:
+        return None
+    return '"' + " ".join(terms) + '"*'
+
+
+def ilike_filter(search_query):
+    """Substring match over the searchable columns (trigram-indexed on PostgreSQL)."""
+    pattern = f"%{search_query}%"
+    return db.or_(*(getattr(UserPostback, col).ilike(pattern) for col in SEARCH_COLUMNS))
+
+
+def search_filter(search_query):
+    """Return a UserPostback filter clause for the search box text."""
+    if db.engine.dialect.name == "sqlite" and _has_fts_table():
+        match_query = fts_match_query(search_query)
+        if match_query is not None:
+            matches = (
+                text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+                .bindparams(match=match_query)
+                .columns(column("rowid", Integer))
+            )
+            return UserPostback.id.in_(matches)
+    return ilike_filter(search_query)
@@ -0,0 +1,115 @@
+"""
+Helpers for GET /api/postbacks/wait, which long-polls until postbacks for
+one or more intents have been stored.
+
+A waiter subscribes to the user's channel on the postback event bus and is
+woken when a postback for one of its intents is ingested; it then re-checks
+the database. It also re-checks every POSTBACK_WAIT_POLL_INTERVAL seconds,
+since a notification can miss it (another worker's postback on the local
+bus, a dropped NOTIFY), and simply polls when the bus's subscriber cap is
+reached. Under the WSGI app the route waits in its request
+thread (IntentWaiter). Under the ASGI entry point (app/asgi.py) the route is
+only ever asked for an immediate answer and the wait itself happens on the
+event loop (AsyncIntentWaiter), so waiting clients don't occupy threads.
+"""
+
+import asyncio
+import threading
+
+from ..models import UserPostback
+
+# Most intents a single wait call may ask for
+MAX_WAIT_INTENTS = 100
+DEFAULT_WAIT_TIMEOUT = 30
+WAIT_CHANNEL_HEADER = "X-Postback-Wait-Channel"
+
+
+def parse_intent_ids(args):
+    """Intent IDs from repeated and/or comma-separated intent_id parameters, de-duplicated."""
+    intent_ids = []
+    for value in args.getlist("intent_id"):
+        for intent_id in value.split(","):
+            intent_id = intent_id.strip()
+            if intent_id and intent_id not in intent_ids:
+                intent_ids.append(intent_id)
+    return intent_ids
+
+
+def parse_wait_timeout(value, max_timeout):
+    """Timeout in seconds, clamped to 0..max_timeout. Invalid values use the default."""
+    try:
+        timeout = float(value) if value not in (None, "") else DEFAULT_WAIT_TIMEOUT
+    except ValueError:
+        timeout = DEFAULT_WAIT_TIMEOUT
+    return min(max(timeout, 0.0), float(max_timeout))
+
+
+def find_intent_postbacks(user_id, intent_ids):
+    """Latest stored postback for each of the intents that has one."""
+    rows = (
+        UserPostback.query.filter(
+            UserPostback.user_id == user_id, UserPostback.intent_id.in_(intent_ids)
+        )
+        .order_by(UserPostback.created_at.desc(), UserPostback.id.desc())
+        .all()
+    )
+    found = {}
+    for row in rows:
+        found.setdefault(row.intent_id, row)
+    return found
+
+
+def wait_result(found, intent_ids, mode):
+    """Response body for a wait call; "complete" is whether the wait condition is met."""
+    pending = [intent_id for intent_id in intent_ids if intent_id not in found]
+    complete = bool(found) if mode == "any" else not pending
+    return {
+        "postbacks": {intent_id: found[intent_id].to_dict() for intent_id in intent_ids if intent_id in found},
+        "pending": pending,
+        "complete": complete,
+        "timed_out": not complete,
+    }
+
+
+class IntentWaiter:
+    """Event bus subscription that wakes a thread when one of its intents is ingested."""
+
+    def __init__(self, channel, intent_ids):
+        self.channels = frozenset([channel])
+        self.intent_ids = frozenset(intent_ids)
+        self._event = threading.Event()
+
+    def deliver(self, channel, event):
+        if event.get("intent_id") in self.intent_ids:
+            self._signal()
+
+    def _signal(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        """Block until a matching postback arrives or timeout passes. Returns whether one arrived."""
+        woke = self._event.wait(timeout)
+        # Callers re-check the database after waking, so coalescing signals is safe
+        self._event.clear()
+        return woke
+
+
+class AsyncIntentWaiter(IntentWaiter):
+    """IntentWaiter for coroutines on an event loop; deliver() may run on any thread."""
+
+    def __init__(self, channel, intent_ids, loop):
+        super().__init__(channel, intent_ids)
+        self._loop = loop
+        self._async_event = asyncio.Event()
+
+    def _signal(self):
+        self._loop.call_soon_threadsafe(self._async_event.set)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+            woke = True
+        except asyncio.TimeoutError:
+            woke = False
+        self._async_event.clear()
+        return woke
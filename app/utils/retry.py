@@ -0,0 +1,182 @@
+"""
+Retry policy for Terminal Connect API calls.
+
+Both outbound clients (utils/api.py and utils/async_client.py) retry
+failed calls through ApiRetryPolicy (app.extensions["api_retries"]):
+
+- Only failures that are safe to repeat are retried. A call whose
+  connection could not be opened never reached the gateway and is always
+  retried. Timeouts, connection resets and 429/502/503/504 responses leave
+  the outcome unknown, so they are retried only for idempotent calls: GETs,
+  and POSTs carrying an Idempotency-Key header (create-intent calls with a
+  merchant reference; see idempotency_key()). Process calls get no key:
+  the gateway isn't known to de-duplicate them, and sending one twice could
+  start a second payment on the terminal, so they are only retried when the
+  connection failed.
+- Attempts are spaced by exponential backoff with full jitter:
+  a random delay up to API_RETRY_BACKOFF * 2^(attempt - 1), capped at
+  API_RETRY_MAX_BACKOFF, for at most API_RETRY_MAX_ATTEMPTS attempts.
+- Each environment (gateway host) has a retry budget, so a failing gateway
+  isn't hit with several times its normal load: within a sliding
+  RETRY_BUDGET_WINDOW, retries may not exceed API_RETRY_BUDGET_MIN plus
+  API_RETRY_BUDGET_RATIO of the calls made.
+
+Counters per environment are reported by stats() for the admin metrics.
+"""
+
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+# Outcomes of a single attempt, besides an HTTP status code
+CONNECT_FAILED = "connect"
+TIMED_OUT = "timeout"
+CONNECTION_RESET = "reset"
+FAILED = "error"
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Seconds of history the retry budgets look at
+RETRY_BUDGET_WINDOW = 10.0
+
+
+def idempotency_key(mid, endpoint, payload):
+    """Idempotency key for a create-intent call, or None.
+
+    Create calls are keyed on the merchant reference together with the
+    amount and parent intent, so a repeated submission of the same
+    transaction maps to the same intent. Process calls are never keyed.
+    """
+    if endpoint.endswith("/process"):
+        return None
+    if payload and payload.get("merchantReference"):
+        parts = [
+            mid,
+            endpoint,
+            payload["merchantReference"],
+            payload.get("subTotal", payload.get("amount")),
+            payload.get("parentIntentId"),
+        ]
+    else:
+        return None
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+class RetryBudget:
+    """Sliding-window cap on retries relative to calls for one environment."""
+
+    def __init__(self, ratio, minimum, window=RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._calls = deque()
+        self._retries = deque()
+
+    def _trim(self, now):
+        for events in (self._calls, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def note_call(self, now):
+        self._trim(now)
+        self._calls.append(now)
+
+    def try_spend(self, now):
+        """Reserve one retry. Returns False when the budget is used up."""
+        self._trim(now)
+        if len(self._retries) >= self.minimum + self.ratio * len(self._calls):
+            return False
+        self._retries.append(now)
+        return True
+
+
+class ApiRetryPolicy:
+    """Decides which failed API calls are retried, when, and keeps retry counters."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._stats = {}
+        self._environments = {}
+        self.max_attempts = 3
+        self.backoff = 0.25
+        self.max_backoff = 4.0
+        self.budget_ratio = 0.2
+        self.budget_min = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_attempts = max(1, int(app.config.get("API_RETRY_MAX_ATTEMPTS", 3)))
+        self.backoff = max(0.0, float(app.config.get("API_RETRY_BACKOFF", 0.25)))
+        self.max_backoff = max(self.backoff, float(app.config.get("API_RETRY_MAX_BACKOFF", 4.0)))
+        self.budget_ratio = max(0.0, float(app.config.get("API_RETRY_BUDGET_RATIO", 0.2)))
+        self.budget_min = max(0, int(app.config.get("API_RETRY_BUDGET_MIN", 10)))
+        # Imported here because api.py imports this module
+        from .api import ENVIRONMENT_URLS
+
+        self._environments = {urlsplit(url).netloc.lower(): name for name, url in ENVIRONMENT_URLS.items()}
+        app.extensions["api_retries"] = self
+
+    def environment_for(self, url):
+        """Environment name of a gateway URL, or its host for other URLs."""
+        host = urlsplit(url).netloc.lower()
+        return self._environments.get(host, host)
+
+    def _counters(self, environment):
+        return self._stats.setdefault(
+            environment,
+            {"calls": 0, "retries": 0, "recovered": 0, "failed_after_retries": 0, "budget_exhausted": 0},
+        )
+
+    def _budget(self, environment):
+        budget = self._budgets.get(environment)
+        if budget is None:
+            budget = self._budgets[environment] = RetryBudget(self.budget_ratio, self.budget_min)
+        return budget
+
+    def start(self, call):
+        """Count a new call (not a retry) towards its environment's budget."""
+        environment = self.environment_for(call["url"])
+        with self._lock:
+            self._counters(environment)["calls"] += 1
+            self._budget(environment).note_call(time.monotonic())
+
+    def is_retryable(self, call, outcome):
+        """Whether a failed attempt with this outcome can safely be repeated."""
+        if outcome == CONNECT_FAILED:
+            return True
+        if outcome in (TIMED_OUT, CONNECTION_RESET) or outcome in RETRY_STATUSES:
+            return call["method"].upper() == "GET" or IDEMPOTENCY_HEADER in call["headers"]
+        return False
+
+    def next_delay(self, call, outcome, attempt):
+        """Seconds to wait before retrying after `attempt` failed attempts, or None to give up."""
+        if outcome is None or attempt >= self.max_attempts or not self.is_retryable(call, outcome):
+            return None
+        environment = self.environment_for(call["url"])
+        with self._lock:
+            counters = self._counters(environment)
+            if not self._budget(environment).try_spend(time.monotonic()):
+                counters["budget_exhausted"] += 1
+                return None
+            counters["retries"] += 1
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def finish(self, call, attempts, succeeded):
+        """Record how a call that needed retries ended."""
+        if attempts <= 1:
+            return
+        with self._lock:
+            counters = self._counters(self.environment_for(call["url"]))
+            counters["recovered" if succeeded else "failed_after_retries"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_attempts": self.max_attempts,
+                "environments": {env: dict(counters) for env, counters in self._stats.items()},
+            }
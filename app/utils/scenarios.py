@@ -0,0 +1,333 @@
+"""
+Scripted multi-step transaction scenarios.
+
+A scenario is a YAML or JSON document listing steps that run in order,
+e.g. a sale, a linked refund of that sale and then a reversal:
+
+    name: sale-refund-reversal
+    instances: 20          # copies of the scenario to run
+    concurrency: 5         # copies running at once
+    postback_timeout: 60   # default seconds to wait for an expected postback
+    steps:
+      - name: sale
+        type: sale
+        amount: "10.00"
+        expect: {postback_status: APPROVED}
+      - name: refund
+        type: linked_refund
+        parent: sale       # uses the intent ID created by the "sale" step
+        amount: "5.00"
+        merchant_reference: "{run}-{instance}-refund"
+        expect: {postback_status: [APPROVED, PENDING], timeout: 30}
+
+Each step goes through the same flow as the forms (utils/transactions.py).
+A step with `expect` then waits for a postback for its intent in the local
+store (the user's postbacks, or the guest session's store) via the postback
+event bus, and fails if none arrives in time or its status isn't one of
+the expected ones. An instance stops at its first failed step.
+
+ScenarioRun has the same interface as BatchRun, so the batch runner runs
+it in the background for the web UI and `flask run-scenario` runs it in
+the foreground. The report has latency percentiles per step (API calls,
+postback wait and total) and end to end per instance.
+"""
+
+import re
+import time
+from collections import Counter
+from decimal import Decimal
+
+import yaml
+from flask import current_app, session
+
+from ..models import db
+from .batch import BatchRun, latency_summary
+from .guest_store import token_key
+from .postback_events import guest_channel, user_channel
+from .postback_wait import IntentWaiter, find_intent_postbacks
+from .transactions import LINKED_TYPES, REVERSAL, TRANSACTION_TYPES, run_transaction
+from .validation import is_valid_uuid, validate_amount
+
+MAX_STEPS = 20
+DEFAULT_POSTBACK_TIMEOUT = 60
+# Seconds between postback store checks, whether or not the wait is subscribed to the event bus
+POLL_INTERVAL = 0.5
+STEP_NAME = re.compile(r"^[A-Za-z0-9_-]{1,40}$")
+
+
+def _as_list(value):
+    return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+
+
+def parse_scenario(text, max_instances, max_concurrency):
+    """Parse and validate a YAML or JSON scenario. Returns (scenario, error)."""
+    try:
+        document = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        return None, f"Scenario is not valid YAML or JSON: {e}"
+    if not isinstance(document, dict):
+        return None, "Scenario must be a mapping with a list of steps"
+
+    try:
+        instances = int(document.get("instances", 1))
+        concurrency = int(document.get("concurrency", 1))
+        postback_timeout = float(document.get("postback_timeout", DEFAULT_POSTBACK_TIMEOUT))
+    except (TypeError, ValueError):
+        return None, "instances, concurrency and postback_timeout must be numbers"
+    if not 1 <= instances <= max_instances:
+        return None, f"instances must be between 1 and {max_instances}"
+    if not 1 <= concurrency <= max_concurrency:
+        return None, f"concurrency must be between 1 and {max_concurrency}"
+    if postback_timeout <= 0:
+        return None, "postback_timeout must be greater than zero"
+
+    raw_steps = document.get("steps")
+    if not isinstance(raw_steps, list) or not raw_steps:
+        return None, "Scenario needs a non-empty list of steps"
+    if len(raw_steps) > MAX_STEPS:
+        return None, f"Scenarios can have at most {MAX_STEPS} steps"
+
+    steps = []
+    for index, raw in enumerate(raw_steps, 1):
+        if not isinstance(raw, dict):
+            return None, f"Step {index} must be a mapping"
+        name = str(raw.get("name") or f"step{index}")
+        if not STEP_NAME.match(name) or any(step["name"] == name for step in steps):
+            return None, f"Step {index}: names must be unique letters, digits, '-' or '_'"
+        kind = raw.get("type")
+        if kind not in TRANSACTION_TYPES:
+            return None, f"Step {name}: type must be one of {', '.join(TRANSACTION_TYPES)}"
+
+        step = {
+            "name": name,
+            "type": kind,
+            "amount": None,
+            "parent": None,
+            "parent_intent_id": None,
+            "merchant_reference": str(raw.get("merchant_reference") or "{run}-{instance}-{step}"),
+            "via_pinpad": bool(raw.get("via_pinpad", False)),
+            "expect_statuses": None,
+            "postback_timeout": postback_timeout,
+        }
+
+        if kind != REVERSAL:
+            amount = str(raw.get("amount", ""))
+            is_valid, error = validate_amount(amount)
+            if not is_valid:
+                return None, f"Step {name}: {error}"
+            step["amount"] = Decimal(amount)
+
+        if kind in LINKED_TYPES:
+            if raw.get("parent"):
+                if not any(previous["name"] == raw["parent"] for previous in steps):
+                    return None, f"Step {name}: parent must name an earlier step"
+                step["parent"] = raw["parent"]
+            elif is_valid_uuid(raw.get("parent_intent_id")):
+                step["parent_intent_id"] = raw["parent_intent_id"]
+            else:
+                return None, f"Step {name}: needs a parent step or a parent_intent_id UUID"
+
+        expect = raw.get("expect")
+        if expect is not None:
+            if not isinstance(expect, dict) or not expect.get("postback_status"):
+                return None, f"Step {name}: expect needs a postback_status"
+            step["expect_statuses"] = _as_list(expect["postback_status"])
+            try:
+                step["postback_timeout"] = float(expect.get("timeout", postback_timeout))
+            except (TypeError, ValueError):
+                return None, f"Step {name}: expect timeout must be a number"
+
+        try:
+            step["merchant_reference"].format(run="", instance=0, step="")
+        except (KeyError, IndexError, ValueError):
+            return None, f"Step {name}: merchant_reference may only use {{run}}, {{instance}} and {{step}}"
+        steps.append(step)
+
+    return {
+        "name": str(document.get("name") or "scenario"),
+        "instances": instances,
+        "concurrency": concurrency,
+        "steps": steps,
+    }, None
+
+
+def postback_owner():
+    """Config entries naming whose stored postbacks steps wait on: the user's or the guest session's."""
+    if session.get("user_id"):
+        return {"postback_user_id": session["user_id"]}
+    return {"postback_guest_token": session.get("guest_token")}
+
+
+def _stored_status(config, intent_id):
+    """Status of the latest stored postback for an intent, or None if there isn't one."""
+    if config.get("postback_user_id"):
+        row = find_intent_postbacks(config["postback_user_id"], [intent_id]).get(intent_id)
+        status = (row.payload_status or "") if row is not None else None
+        # Don't hold a database connection while waiting
+        db.session.remove()
+        return status
+    records = current_app.extensions["guest_postbacks"].recent(config.get("postback_guest_token"))
+    for record in reversed(records):
+        payload = record.get("payload") or {}
+        if payload.get("intentId") == intent_id:
+            return str(payload.get("status") or "")
+    return None
+
+
+def wait_for_postback(config, intent_id, timeout):
+    """Wait for a stored postback for intent_id. Returns its status, or None on timeout."""
+    if config.get("postback_user_id"):
+        channel = user_channel(config["postback_user_id"])
+    else:
+        channel = guest_channel(token_key(config.get("postback_guest_token")))
+    bus = current_app.extensions["postback_events"]
+    # None when the bus's subscriber cap is reached; the store is then polled instead
+    waiter = bus.subscribe(subscription=IntentWaiter(channel, [intent_id]))
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            status = _stored_status(config, intent_id)
+            remaining = deadline - time.monotonic()
+            if status is not None or remaining <= 0:
+                return status
+            # Re-checked every POLL_INTERVAL too: postbacks stored by another
+            # worker may never notify this process's bus
+            if waiter is not None:
+                waiter.wait(min(remaining, POLL_INTERVAL))
+            else:
+                time.sleep(min(remaining, POLL_INTERVAL))
+    finally:
+        if waiter is not None:
+            bus.unsubscribe(waiter)
+
+
+class ScenarioRun(BatchRun):
+    """Many concurrent instances of a multi-step scenario."""
+
+    def __init__(self, scenario, reference_prefix=None, owner=None):
+        super().__init__(
+            "scenario",
+            scenario["instances"],
+            concurrency=scenario["concurrency"],
+            reference_prefix=reference_prefix,
+            owner=owner,
+        )
+        self.scenario = scenario
+
+    def _run_one(self, app, config, n):
+        if self._cancel.is_set():
+            return
+        result = {"n": n, "steps": {}, "error": None, "failed_step": None, "timings": {}}
+        intent_ids = {}
+        started = time.perf_counter()
+        with app.test_request_context():
+            session.update(config)
+            for step in self.scenario["steps"]:
+                outcome = self._run_step(config, step, n, intent_ids)
+                result["steps"][step["name"]] = outcome
+                if outcome["error"]:
+                    result.update(error=outcome["error"], failed_step=step["name"])
+                    break
+                intent_ids[step["name"]] = outcome["intent_id"]
+        result["timings"]["end_to_end"] = time.perf_counter() - started
+        with self._lock:
+            self.results.append(result)
+
+    def _run_step(self, config, step, n, intent_ids):
+        merchant_reference = step["merchant_reference"].format(run=self.reference_prefix, instance=n, step=step["name"])
+        parent_intent_id = intent_ids.get(step["parent"]) if step["parent"] else step["parent_intent_id"]
+        started = time.perf_counter()
+        try:
+            outcome = run_transaction(
+                step["type"],
+                merchant_reference,
+                amount=step["amount"],
+                parent_intent_id=parent_intent_id,
+                via_pinpad=step["via_pinpad"],
+            )
+        except Exception as e:
+            outcome = {"intent_id": None, "error": str(e) or type(e).__name__, "stage": "exception", "timings": {}}
+        timings = outcome["timings"]
+        timings["api"] = time.perf_counter() - started
+
+        if not outcome["error"] and step["expect_statuses"]:
+            waited = time.perf_counter()
+            try:
+                status = wait_for_postback(config, outcome["intent_id"], step["postback_timeout"])
+            except Exception as e:
+                timings["postback"] = time.perf_counter() - waited
+                outcome.update(error=f"Error waiting for postback: {str(e) or type(e).__name__}", stage="postback")
+                timings["step"] = time.perf_counter() - started
+                return outcome
+            timings["postback"] = time.perf_counter() - waited
+            outcome["postback_status"] = status
+            if status is None:
+                outcome.update(error=f"No postback within {step['postback_timeout']:g}s", stage="postback")
+            elif status not in step["expect_statuses"]:
+                expected = " or ".join(step["expect_statuses"])
+                outcome.update(error=f"Expected postback status {expected}, got {status or 'none'}", stage="postback")
+        timings["step"] = time.perf_counter() - started
+        return outcome
+
+    def report(self):
+        with self._lock:
+            results = list(self.results)
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        failed = [r for r in results if r["error"]]
+
+        steps = []
+        for step in self.scenario["steps"]:
+            outcomes = [r["steps"][step["name"]] for r in results if step["name"] in r["steps"]]
+            errors = Counter((o["stage"], o["error"]) for o in outcomes if o["error"])
+            steps.append(
+                {
+                    "name": step["name"],
+                    "type": step["type"],
+                    "passed": sum(1 for o in outcomes if not o["error"]),
+                    "failed": sum(errors.values()),
+                    "skipped": len(results) - len(outcomes),
+                    "latency_ms": {
+                        timing: summary
+                        for timing in ("step", "api", "postback")
+                        if (summary := latency_summary([o["timings"][timing] for o in outcomes if timing in o["timings"]]))
+                    },
+                    "errors": [
+                        {"stage": stage, "error": error, "count": count}
+                        for (stage, error), count in errors.most_common()
+                    ],
+                }
+            )
+
+        return {
+            "id": self.id,
+            "type": "scenario",
+            "name": self.scenario["name"],
+            "status": self.status,
+            "count": self.count,
+            "concurrency": self.concurrency,
+            "completed": len(results),
+            "succeeded": len(results) - len(failed),
+            "failed": len(failed),
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(results) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "end_to_end": latency_summary([r["timings"]["end_to_end"] for r in results if not r["error"]])
+            },
+            "steps": steps,
+            "failures": [
+                {
+                    "instance": r["n"],
+                    "step": r["failed_step"],
+                    "intent_id": r["steps"][r["failed_step"]]["intent_id"],
+                    "error": r["error"],
+                }
+                for r in sorted(failed, key=lambda r: r["n"])[:50]
+            ],
+        }
+
+
+def load_scenario_file(path, max_instances, max_concurrency):
+    """parse_scenario() for a file path."""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_scenario(f.read(), max_instances, max_concurrency)
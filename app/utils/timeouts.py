@@ -0,0 +1,180 @@
+"""
+Adaptive timeouts for outbound gateway calls.
+
+Instead of one API_REQUEST_TIMEOUT for every call, each call gets a timeout
+derived from how long its endpoint has recently taken to answer
+(app.extensions["api_timeouts"]). Per environment, endpoint template and
+method (the labels of utils/call_metrics.py) the durations of the last
+API_TIMEOUT_WINDOW attempts that got a response are kept, and the timeout
+is their API_TIMEOUT_PERCENTILE multiplied by API_TIMEOUT_MULTIPLIER,
+clamped to [API_TIMEOUT_FLOOR, API_TIMEOUT_CEILING]. Until an endpoint has
+API_TIMEOUT_MIN_SAMPLES durations it gets the ceiling (API_REQUEST_TIMEOUT
+by default), so a fresh worker behaves as before.
+
+Attempts that time out are kept at the timeout they were given, so when a
+gateway gets slower its timeouts grow after a few timeouts instead of every
+call failing at the old limit.
+
+Only GETs get adaptive timeouts. Create and process POSTs aren't retried
+after a read timeout (utils/retry.py), so a timeout that followed a fast
+window down would turn a brief gateway slowdown into a failed transaction
+the gateway may well have carried out; they keep the ceiling.
+
+A transaction's calls also share a total deadline: run_transaction() runs
+inside request_deadline(API_REQUEST_DEADLINE, by default three times the
+ceiling, so a linked refund's three calls keep their old budgets), and every attempt's timeout
+is capped at the time left. A linked refund's details, create and process
+calls (and their retries) therefore fail once the budget is spent rather
+than each waiting out its own timeout. The deadline travels in the prepared
+call, so it holds on the async client's loop thread too.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g
+
+from .retry import TIMED_OUT
+
+# Error returned for calls not attempted because the request deadline passed
+DEADLINE_EXCEEDED = "Request deadline exceeded"
+# Attempts with less time than this left aren't started
+MIN_ATTEMPT_SECONDS = 0.1
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Give the API calls made inside the block a shared budget of seconds.
+
+    Nested deadlines can only shorten the outer one.
+    """
+    previous = g.get("api_deadline")
+    deadline = time.monotonic() + seconds
+    g.api_deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        g.api_deadline = previous
+
+
+def current_deadline():
+    """Monotonic deadline of the enclosing request_deadline() block, or None."""
+    return g.get("api_deadline")
+
+
+def attempt_timeout(call):
+    """Timeout for the next attempt at a prepared call, or None if its deadline has passed."""
+    deadline = call.get("deadline")
+    if deadline is None:
+        return call["timeout"]
+    remaining = deadline - time.monotonic()
+    if remaining < MIN_ATTEMPT_SECONDS:
+        return None
+    return min(call["timeout"], round(remaining, 1))
+
+
+def deadline_allows(call, delay):
+    """Whether a retry after delay seconds could still start before the call's deadline."""
+    deadline = call.get("deadline")
+    return deadline is None or time.monotonic() + delay + MIN_ATTEMPT_SECONDS <= deadline
+
+
+class AdaptiveTimeouts:
+    """Per-endpoint timeouts from rolling latency percentiles, per worker."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._labels = None
+        self.enabled = True
+        self.floor = 2.0
+        self.ceiling = 60.0
+        self.percentile = 99.0
+        self.multiplier = 3.0
+        self.window = 200
+        self.min_samples = 20
+        self.deadline = 180.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("API_TIMEOUT_ADAPTIVE", True))
+        # Defaults to API_REQUEST_TIMEOUT, within the same 1-300s bounds
+        ceiling = app.config.get("API_TIMEOUT_CEILING") or app.config.get("API_REQUEST_TIMEOUT", 60)
+        self.ceiling = min(300.0, max(1.0, float(ceiling)))
+        self.floor = min(self.ceiling, max(MIN_ATTEMPT_SECONDS, float(app.config.get("API_TIMEOUT_FLOOR", 2))))
+        self.percentile = min(100.0, max(50.0, float(app.config.get("API_TIMEOUT_PERCENTILE", 99))))
+        self.multiplier = max(1.0, float(app.config.get("API_TIMEOUT_MULTIPLIER", 3)))
+        self.window = max(1, int(app.config.get("API_TIMEOUT_WINDOW", 200)))
+        self.min_samples = min(self.window, max(1, int(app.config.get("API_TIMEOUT_MIN_SAMPLES", 20))))
+        # Defaults to a ceiling each for a linked refund's details, create and process calls
+        deadline = app.config.get("API_REQUEST_DEADLINE") or 3 * self.ceiling
+        self.deadline = max(1.0, float(deadline))
+        self._labels = app.extensions["outbound_metrics"].labels
+        app.extensions["api_timeouts"] = self
+
+    def _key(self, method, url):
+        return self._labels(method, url)
+
+    def _adapts(self, method):
+        # POSTs aren't retried after a timeout, so they always get the ceiling
+        return self.enabled and method.upper() == "GET"
+
+    def _ceiling(self):
+        # Whole seconds stay ints, so messages read "after 60 seconds" as before
+        return int(self.ceiling) if self.ceiling == int(self.ceiling) else self.ceiling
+
+    def _from_samples(self, samples):
+        ordered = sorted(samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+        return round(min(self.ceiling, max(self.floor, value * self.multiplier)), 1)
+
+    def timeout_for(self, method, url):
+        """Timeout in seconds for a call to url."""
+        if not self._adapts(method):
+            return self._ceiling()
+        with self._lock:
+            samples = self._windows.get(self._key(method, url))
+            samples = list(samples) if samples is not None and len(samples) >= self.min_samples else None
+        if samples is None:
+            return self._ceiling()
+        return self._from_samples(samples)
+
+    def record(self, method, url, outcome, seconds):
+        """Record an attempt. Only responses and timeouts say how long the endpoint takes."""
+        if outcome is not None and not isinstance(outcome, int) and outcome != TIMED_OUT:
+            return
+        key = self._key(method, url)
+        with self._lock:
+            samples = self._windows.get(key)
+            if samples is None:
+                samples = self._windows[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def snapshot(self):
+        """Current timeout and sample count per endpoint, for the admin endpoints."""
+        with self._lock:
+            windows = [(key, list(samples)) for key, samples in sorted(self._windows.items())]
+        endpoints = []
+        for (environment, endpoint, method), samples in windows:
+            ready = self._adapts(method) and len(samples) >= self.min_samples
+            endpoints.append(
+                {
+                    "environment": environment,
+                    "endpoint": endpoint,
+                    "method": method,
+                    "samples": len(samples),
+                    "timeout": self._from_samples(samples) if ready else self._ceiling(),
+                }
+            )
+        return {
+            "adaptive": self.enabled,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "percentile": self.percentile,
+            "multiplier": self.multiplier,
+            "deadline": self.deadline,
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,194 @@
+"""
+Background jobs for form-submitted transactions (TRANSACTION_MODE=jobs).
+
+In job mode a /sale POST doesn't wait for the gateway: the create and
+process calls are queued to a bounded thread pool (TRANSACTION_JOB_WORKERS
+per worker process) and the browser is redirected straight away to a page
+that polls the job's status until it has an intent ID or an error. A
+request thread is then only held for the form validation, so a few gunicorn
+threads can serve many testers whose transactions are in flight at once.
+At most TRANSACTION_JOB_MAX_PENDING jobs are queued or running per worker;
+beyond that submissions are refused rather than queued indefinitely.
+
+Jobs run in a request context carrying a snapshot of the submitting
+session's configuration, like batch workers (utils/batch.py). Job records
+are JSON files in TRANSACTION_JOB_DIR, so a status poll can be answered
+by any worker, and are removed TRANSACTION_JOB_TTL seconds after their last
+update. Records name their owner by user ID or guest token digest and
+are only returned to that owner.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import session
+
+from .guest_store import token_key
+from .transactions import run_transaction, transaction_message
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+# Expired job records are looked for at most this often, in seconds
+EXPIRE_EVERY = 60
+
+
+def job_owner():
+    """Owner of jobs submitted from the current session."""
+    if session.get("user_id"):
+        return f"user:{session['user_id']}"
+    return f"guest:{token_key(session.get('guest_token'))}"
+
+
+class TransactionJobs:
+    """Runs transactions on a bounded thread pool and tracks them in job files."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = 0
+        self._last_expiry = 0.0
+        self.stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = max(1, int(app.config.get("TRANSACTION_JOB_WORKERS", 8)))
+        self.max_pending = max(1, int(app.config.get("TRANSACTION_JOB_MAX_PENDING", 100)))
+        self.ttl = float(app.config.get("TRANSACTION_JOB_TTL", 600))
+        self.directory = app.config.get("TRANSACTION_JOB_DIR", "/tmp/transaction-jobs")
+        os.makedirs(self.directory, exist_ok=True)
+        app.extensions["transaction_jobs"] = self
+
+    def _executor(self):
+        # Created lazily so each forked gunicorn worker gets its own threads
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transaction-job")
+            return self._pool
+
+    def submit(self, kind, config, **kwargs):
+        """Queue run_transaction(kind, **kwargs) for the current session.
+
+        config is the session snapshot the job runs with. Returns the job ID,
+        or None when too many jobs are already pending.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                return None
+            self._pending += 1
+            self.stats["submitted"] += 1
+        job = {
+            "id": uuid.uuid4().hex,
+            "owner": job_owner(),
+            "kind": kind,
+            "status": QUEUED,
+            "submitted": time.time(),
+        }
+        try:
+            self._write(job)
+            self._executor().submit(self._run, job, config, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._maybe_expire()
+        return job["id"]
+
+    def _run(self, job, config, kwargs):
+        try:
+            job.update(status=RUNNING, started=time.time())
+            self._write(job)
+            with self.app.test_request_context():
+                session.update(config)
+                result = run_transaction(job["kind"], **kwargs)
+            message, category = transaction_message(job["kind"], result)
+            job.update(
+                status=FAILED if result["error"] else SUCCEEDED,
+                intent_id=result["intent_id"],
+                error=result["error"],
+                stage=result["stage"],
+                processed=result["processed"],
+                message=message,
+                category=category,
+            )
+        except Exception:
+            logger.exception(f"Transaction job {job['id']} failed")
+            job.update(
+                status=FAILED,
+                error="Unexpected error",
+                message="Unexpected error processing the transaction",
+                category="danger",
+            )
+        finally:
+            job["finished"] = time.time()
+            try:
+                self._write(job)
+            finally:
+                with self._lock:
+                    self.stats[job["status"]] += 1
+                    self._pending -= 1
+
+    def get(self, job_id, owner):
+        """The job's record without its owner, or None if it isn't the owner's (or has expired)."""
+        if not JOB_ID.match(job_id or ""):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job.pop("owner", None) != owner:
+            return None
+        return job
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job):
+        # Written atomically so a poll never reads a partial record
+        path = self._path(job["id"])
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def _maybe_expire(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_expiry < EXPIRE_EVERY:
+                return
+            self._last_expiry = now
+        self.expire(now)
+
+    def expire(self, now=None):
+        """Remove job records older than the TTL. Returns how many were removed."""
+        cutoff = (now or time.time()) - self.ttl
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def snapshot(self):
+        """Counters for the admin metrics endpoint."""
+        with self._lock:
+            return dict(self.stats, pending=self._pending, max_pending=self.max_pending, workers=self.workers)
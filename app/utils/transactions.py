@@ -0,0 +1,164 @@
+"""
+Terminal Connect transaction flows shared by the forms and the batch runner.
+
+Each transaction type creates an intent and then processes it on the
+configured TID. Linked refunds and reversals on Charge Anywhere (WP) TIDs
+that don't go via the pinpad instead send the parent sale's host details
+and are left for the gateway to complete, so they're created but not
+processed.
+
+run_transaction() works from the session configuration like the rest of
+utils/api.py and returns a plain dict, so the same flow can back a form
+POST or run on a batch worker thread. Created and processed intents are
+recorded in the intent ledger (utils/intent_ledger.py), and a transaction's
+calls share one deadline (utils/timeouts.py), so a linked refund's details,
+create and process calls can't each wait out a full timeout.
+"""
+
+import json
+import time
+
+from flask import current_app, flash, session
+
+from ..models import utc_now
+from .api import get_intent_details, make_api_request, process_intent
+from .helpers import get_postback_url, is_charge_anywhere_tid
+from .timeouts import request_deadline
+
+SALE = "sale"
+UNLINKED_REFUND = "unlinked_refund"
+LINKED_REFUND = "linked_refund"
+REVERSAL = "reversal"
+TRANSACTION_TYPES = (SALE, UNLINKED_REFUND, LINKED_REFUND, REVERSAL)
+LINKED_TYPES = (LINKED_REFUND, REVERSAL)
+
+# Intent type created by each transaction type
+INTENT_TYPES = {
+    SALE: "payment",
+    UNLINKED_REFUND: "refund",
+    LINKED_REFUND: "refund",
+    REVERSAL: "reversal",
+}
+
+
+def build_payload(kind, merchant_reference, amount=None, parent_intent_id=None):
+    """Create-intent payload for a transaction type. amount is a Decimal in dollars."""
+    if kind == SALE:
+        return {"subTotal": int(amount * 100), "merchantReference": merchant_reference}
+    payload = {"merchantReference": merchant_reference}
+    if kind != REVERSAL:
+        payload["amount"] = int(amount * 100)
+    if kind in LINKED_TYPES:
+        payload["parentIntentId"] = parent_intent_id
+    payload["postbackUrl"] = get_postback_url()
+    return payload
+
+
+def non_pinpad_details(parent_intent_id):
+    """The parent sale's host details for a non-pinpad refund or reversal.
+
+    Returns (transaction_details, error) where error is a user-facing message.
+    """
+    details_data, details_error = get_intent_details(parent_intent_id)
+    if details_error:
+        return None, f"Error getting transaction details: {details_error}"
+
+    external_data_str = details_data.get("transactionDetails", {}).get("externalData")
+    if not external_data_str:
+        return None, "Could not find externalData in transaction details"
+    try:
+        external_data = json.loads(external_data_str)
+    except (TypeError, ValueError):
+        return None, "Error parsing transaction details"
+
+    return {
+        "gatewayReferenceNumber": external_data["gatewayReferenceNumber"],
+        "originalAmount": external_data["originalAmount"],
+        "originalApprovalCode": external_data["originalApprovalCode"],
+        "originalTransactionType": external_data["originalTransactionType"],
+        "mid": external_data["hostMerchantId"],
+        "tid": external_data["hostTerminalId"],
+    }, None
+
+
+def run_transaction(kind, merchant_reference, amount=None, parent_intent_id=None, via_pinpad=False):
+    """Create (and usually process) one transaction with the session's configuration.
+
+    Returns a dict with intent_id, error, the stage that failed ("details",
+    "create" or "process"), whether the intent was processed, and the
+    seconds spent in each stage under "timings". All of the transaction's
+    API calls share one API_REQUEST_DEADLINE.
+    """
+    with request_deadline(current_app.extensions["api_timeouts"].deadline):
+        return _run_transaction(kind, merchant_reference, amount, parent_intent_id, via_pinpad)
+
+
+def _run_transaction(kind, merchant_reference, amount, parent_intent_id, via_pinpad):
+    result = {"intent_id": None, "error": None, "stage": None, "processed": False, "timings": {}}
+    timings = result["timings"]
+
+    def timed(stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[stage] = time.perf_counter() - started
+
+    endpoint = f"/merchant/{session['MID']}/intent/{INTENT_TYPES[kind]}"
+    payload = build_payload(kind, merchant_reference, amount, parent_intent_id)
+
+    non_pinpad = kind in LINKED_TYPES and is_charge_anywhere_tid(session.get("TID", "")) and not via_pinpad
+    if non_pinpad:
+        details, error = timed("details", non_pinpad_details, parent_intent_id)
+        if error:
+            result.update(error=error, stage="details")
+            return result
+        payload["transactionDetails"] = details
+        payload["isNonPinpadRefund" if kind == LINKED_REFUND else "isNonPinpad"] = True
+
+    requested_at = utc_now()
+    response_data, error = timed("create", make_api_request, endpoint, payload=payload)
+    if error:
+        result.update(error=error, stage="create")
+        return result
+    result["intent_id"] = response_data["intentId"]
+    ledger = current_app.extensions["intent_ledger"]
+    ledger.record_create(
+        result["intent_id"],
+        kind,
+        requested_at,
+        utc_now(),
+        amount=payload.get("subTotal", payload.get("amount")),
+        merchant_reference=merchant_reference,
+    )
+
+    if non_pinpad:
+        return result
+
+    _, error = timed("process", process_intent, result["intent_id"])
+    if error:
+        result.update(error=error, stage="process")
+    else:
+        result["processed"] = True
+        ledger.record_process(result["intent_id"], utc_now(), timings["process"])
+    return result
+
+
+def transaction_message(kind, result):
+    """User-facing (message, category) for the outcome of a transaction."""
+    noun = INTENT_TYPES[kind]
+    intent_id, error = result["intent_id"], result["error"]
+    if result["stage"] == "details":
+        return error, "danger"
+    if result["stage"] == "create":
+        return f"Error creating {noun} intent: {error}", "danger"
+    if result["stage"] == "process":
+        return f"Process failed for Intent ID {intent_id}: {error}", "danger"
+    if result["processed"]:
+        return f"Successfully processed Intent ID: {intent_id}", "success"
+    return f"Successfully created {noun} Intent ID: {intent_id}", "success"
+
+
+def flash_transaction_result(kind, result):
+    """Flash the outcome of a form-submitted transaction."""
+    flash(*transaction_message(kind, result))
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+ASGI Application Entry Point
+
+Serves the Flask app through an ASGI wrapper so delayed postback responses
+are parked on the event loop instead of holding a worker thread.
+Run with: gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+
+from app import create_app
+from app.asgi import create_asgi_app
+
+# Create the ASGI application instance
+app = create_asgi_app(create_app())
@@ -90,10 +90,17 @@ main() {
     TIMEOUT=${GUNICORN_TIMEOUT:-30}
     MAX_REQUESTS=${GUNICORN_MAX_REQUESTS:-1000}
 
+    # ASGI workers serve asgi:app so delayed postbacks don't hold a thread
+    APP_MODULE="wsgi:app"
+    case "$WORKER_CLASS" in
+        uvicorn*) APP_MODULE="asgi:app" ;;
+    esac
+
     echo "=== Gunicorn Configuration ==="
     echo "CPU cores detected: $CPU_COUNT"
     echo "Workers: $WORKERS"
     echo "Worker class: $WORKER_CLASS"
+    echo "Application: $APP_MODULE"
     if [ "$WORKER_CLASS" = "gthread" ]; then
         echo "Threads per worker: $THREADS"
         echo "Total capacity: $((WORKERS * THREADS)) concurrent requests"
@@ -121,7 +128,7 @@ main() {
             --log-level info \
             --access-logfile - \
             --error-logfile - \
-            wsgi:app
+            "$APP_MODULE"
     else
         # Original configuration for other worker classes
         exec gunicorn \
@@ -137,7 +144,7 @@ main() {
             --log-level info \
             --access-logfile - \
             --error-logfile - \
-            wsgi:app
+            "$APP_MODULE"
     fi
 }
 
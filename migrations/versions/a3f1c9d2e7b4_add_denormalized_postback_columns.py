@@ -0,0 +1,39 @@
+"""Add denormalized, indexed postback payload columns
+
+Revision ID: a3f1c9d2e7b4
+Revises: 779bcb803de7
+Create Date: 2026-10-17 09:12:04.518233
+
+Existing rows are populated with `flask backfill-postbacks`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2e7b4'
+down_revision = '779bcb803de7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user_postbacks', sa.Column('terminal_id', sa.String(length=100), nullable=True))
+    op.add_column('user_postbacks', sa.Column('payload_status', sa.String(length=50), nullable=True))
+    op.add_column('user_postbacks', sa.Column('merchant_reference', sa.String(length=255), nullable=True))
+    op.create_index('ix_user_postbacks_terminal_id', 'user_postbacks', ['terminal_id'])
+    op.create_index('ix_user_postbacks_payload_status', 'user_postbacks', ['payload_status'])
+    op.create_index('ix_user_postbacks_merchant_reference', 'user_postbacks', ['merchant_reference'])
+    op.create_index('ix_user_postbacks_amount', 'user_postbacks', ['amount'])
+    op.create_index('ix_user_postbacks_currency', 'user_postbacks', ['currency'])
+
+
+def downgrade():
+    op.drop_index('ix_user_postbacks_currency', table_name='user_postbacks')
+    op.drop_index('ix_user_postbacks_amount', table_name='user_postbacks')
+    op.drop_index('ix_user_postbacks_merchant_reference', table_name='user_postbacks')
+    op.drop_index('ix_user_postbacks_payload_status', table_name='user_postbacks')
+    op.drop_index('ix_user_postbacks_terminal_id', table_name='user_postbacks')
+    op.drop_column('user_postbacks', 'merchant_reference')
+    op.drop_column('user_postbacks', 'payload_status')
+    op.drop_column('user_postbacks', 'terminal_id')
@@ -0,0 +1,28 @@
+"""Add composite (user_id, created_at DESC, id) index for keyset pagination
+
+Revision ID: c72e5b8a4f19
+Revises: a3f1c9d2e7b4
+Create Date: 2026-10-17 11:40:27.904611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c72e5b8a4f19'
+down_revision = 'a3f1c9d2e7b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_user_postbacks_user_created',
+        'user_postbacks',
+        ['user_id', sa.text('created_at DESC'), 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_user_postbacks_user_created', table_name='user_postbacks')
@@ -0,0 +1,86 @@
+"""Add search indexes for user postbacks (FTS5 on SQLite, pg_trgm on PostgreSQL)
+
+Revision ID: d4b8e61f0a23
+Revises: c72e5b8a4f19
+Create Date: 2026-10-17 13:05:51.226940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b8e61f0a23'
+down_revision = 'c72e5b8a4f19'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of app/utils/postback_search.py's DDL as of this revision
+# (tests/test_postback_search.py checks that they still match)
+SEARCH_COLUMNS = ('intent_id', 'transaction_id', 'terminal_id', 'merchant_reference')
+FTS_TABLE = 'user_postbacks_fts'
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{col}' for col in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{col}' for col in SEARCH_COLUMNS)
+
+SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_columns}, content='user_postbacks', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON user_postbacks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+]
+
+
+def _enable_pg_trgm(bind):
+    """Create the pg_trgm extension if possible. Returns whether it is installed."""
+    installed = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+    if bind.execute(sa.text(installed)).first():
+        return True
+    available = "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    if not bind.execute(sa.text(available)).first():
+        return False
+    try:
+        # In a savepoint, so a refused CREATE EXTENSION doesn't abort the migration
+        with bind.begin_nested():
+            bind.execute(sa.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    except sa.exc.DBAPIError:
+        return False
+    return True
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        # Index the rows that existed before the triggers
+        op.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        if not _enable_pg_trgm(bind):
+            print("pg_trgm is not available (or this role can't create it); "
+                  "skipping trigram indexes, postback search will not be index-assisted. "
+                  "Run CREATE EXTENSION pg_trgm as a superuser, then downgrade to c72e5b8a4f19 "
+                  "and upgrade again to add them.")
+            return
+        for col in SEARCH_COLUMNS:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_user_postbacks_{col}_trgm '
+                f'ON user_postbacks USING gin ({col} gin_trgm_ops)'
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        op.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif bind.dialect.name == 'postgresql':
+        for col in SEARCH_COLUMNS:
+            op.execute(f'DROP INDEX IF EXISTS ix_user_postbacks_{col}_trgm')
@@ -0,0 +1,59 @@
+"""Add outbound_intents ledger for create -> postback latency
+
+Revision ID: e7c3a9b5d1f2
+Revises: d4b8e61f0a23
+Create Date: 2026-10-17 15:22:10.481305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a9b5d1f2'
+down_revision = 'd4b8e61f0a23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'outbound_intents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('intent_id', sa.String(length=100), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('guest_key', sa.String(length=16), nullable=True),
+        sa.Column('environment', sa.String(length=50), nullable=True),
+        sa.Column('mid', sa.String(length=100), nullable=True),
+        sa.Column('tid', sa.String(length=100), nullable=True),
+        sa.Column('transaction_type', sa.String(length=50), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=True),
+        sa.Column('merchant_reference', sa.String(length=255), nullable=True),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('postback_at', sa.DateTime(), nullable=True),
+        sa.Column('postback_status', sa.String(length=50), nullable=True),
+        sa.Column('create_latency', sa.Float(), nullable=True),
+        sa.Column('process_latency', sa.Float(), nullable=True),
+        sa.Column('postback_latency', sa.Float(), nullable=True),
+        sa.Column('end_to_end_latency', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('intent_id'),
+    )
+    op.create_index('ix_outbound_intents_user_id', 'outbound_intents', ['user_id'])
+    op.create_index('ix_outbound_intents_guest_key', 'outbound_intents', ['guest_key'])
+    op.create_index('ix_outbound_intents_created_at', 'outbound_intents', ['created_at'])
+    op.create_index(
+        'ix_outbound_intents_env_tid_created',
+        'outbound_intents',
+        ['environment', 'tid', 'created_at'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_outbound_intents_env_tid_created', table_name='outbound_intents')
+    op.drop_index('ix_outbound_intents_created_at', table_name='outbound_intents')
+    op.drop_index('ix_outbound_intents_guest_key', table_name='outbound_intents')
+    op.drop_index('ix_outbound_intents_user_id', table_name='outbound_intents')
+    op.drop_table('outbound_intents')
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import tempfile
+import time
+
+import httpx
+import pytest
+from flask import session
+
+from app import create_app
+from app.utils.api import make_api_request, make_api_requests, process_intent
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+
+
+@pytest.fixture
+def async_app():
+    """App configured to send API calls with the asyncio client."""
+    app = create_app(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-key",
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SESSION_FILE_DIR": tempfile.mkdtemp(),
+            "OUTBOUND_CLIENT": "async",
+            "DEFAULT_CONFIG": {
+                "ENVIRONMENT": "sandbox",
+                "BASE_URL": BASE_URL,
+                "MID": "test-mid",
+                "TID": "test-tid",
+                "API_KEY": "test-api-key",
+            },
+        }
+    )
+    yield app
+    app.extensions["async_http_client"].shutdown()
+
+
+def use_transport(app, handler):
+    app.extensions["async_http_client"].transport = httpx.MockTransport(handler)
+
+
+class TestAsyncOutboundClient:
+    """Tests for OUTBOUND_CLIENT=async"""
+
+    def test_intent_calls_keep_the_contract(self, async_app):
+        seen = []
+
+        def handler(request):
+            seen.append((request.method, request.url.path, json.loads(request.content)))
+            if request.url.path.endswith("/process"):
+                return httpx.Response(200, json={"status": "processing"})
+            return httpx.Response(200, json={"intentId": "intent-1"})
+
+        use_transport(async_app, handler)
+        with async_app.test_request_context():
+            session["guest_token"] = "token-1"
+            data, error = make_api_request("/merchant/test-mid/intent/payment", payload={"subTotal": 100})
+            assert (data, error) == ({"intentId": "intent-1"}, None)
+            data, error = process_intent("intent-1")
+            assert (data, error) == ({"status": "processing"}, None)
+
+        assert seen[0][1] == "/devices/merchant/test-mid/intent/payment"
+        assert seen[0][2]["postbackUrl"].endswith("/postback/guest/token-1")
+        assert seen[1] == ("POST", "/devices/merchant/test-mid/intent/intent-1/process", {"tid": "test-tid"})
+
+    def test_error_message_from_gateway(self, async_app):
+        use_transport(async_app, lambda request: httpx.Response(400, json={"message": "Invalid TID"}))
+        with async_app.test_request_context():
+            assert make_api_request("/merchant/test-mid/intent/payment", payload={}) == (None, "Invalid TID")
+
+    def test_timeout(self, async_app):
+        def handler(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        use_transport(async_app, handler)
+        with async_app.test_request_context():
+            data, error = make_api_request("/merchant/test-mid/intent/abc", method="GET")
+
+        assert data is None
+        assert error == f"Request timed out after {async_app.config['API_REQUEST_TIMEOUT']} seconds"
+
+    def test_independent_calls_overlap(self, async_app):
+        async def handler(request):
+            await asyncio.sleep(0.3)
+            return httpx.Response(200, json={"path": request.url.path})
+
+        use_transport(async_app, handler)
+        calls = [(f"/merchant/test-mid/intent/intent-{n}", "GET", None) for n in range(5)]
+        with async_app.test_request_context():
+            started = time.monotonic()
+            results = make_api_requests(calls)
+            elapsed = time.monotonic() - started
+
+        assert [data["path"] for data, _ in results] == [f"/devices{endpoint}" for endpoint, _, _ in calls]
+        assert elapsed < 1.0
+        assert async_app.extensions["async_http_client"].stats["peak_in_flight"] == 5
+
+    def test_gateway_errors_are_retried(self, async_app):
+        async_app.extensions["api_retries"].backoff = 0
+        responses = [httpx.Response(502), httpx.Response(200, json={"intentId": "intent-1"})]
+        keys = []
+
+        def handler(request):
+            keys.append(request.headers.get("Idempotency-Key"))
+            return responses.pop(0)
+
+        use_transport(async_app, handler)
+        with async_app.test_request_context():
+            data, error = make_api_request(
+                "/merchant/test-mid/intent/payment", payload={"subTotal": 100, "merchantReference": "ref-1"}
+            )
+
+        assert (data, error) == ({"intentId": "intent-1"}, None)
+        assert len(keys) == 2 and keys[0] is not None and keys[0] == keys[1]
@@ -0,0 +1,134 @@
+import json
+import re
+import threading
+import time
+
+import requests_mock
+
+from app.utils.batch import BatchRun, percentile
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+PAYMENT_URL = f"{BASE_URL}/merchant/test-mid/intent/payment"
+PROCESS_URL = re.compile(rf"{re.escape(BASE_URL)}/merchant/test-mid/intent/[^/]+/process")
+CONFIG = {"MID": "test-mid", "TID": "test-tid", "API_KEY": "test-api-key", "BASE_URL": BASE_URL}
+
+
+def mock_gateway(m, process_status=200):
+    def create(request, context):
+        return {"intentId": f"intent-{request.json()['merchantReference']}"}
+
+    m.post(PAYMENT_URL, json=create)
+    m.post(PROCESS_URL, status_code=process_status, json={"message": "Terminal busy"})
+
+
+def wait_for(client, run_id):
+    for _ in range(100):
+        report = client.get(f"/batch/{run_id}/report").get_json()
+        if report["status"] == "finished":
+            return report
+        time.sleep(0.05)
+    raise AssertionError("batch did not finish")
+
+
+class TestBatchRunner:
+    """Tests for the batch transaction runner"""
+
+    def test_concurrent_sales(self, app):
+        run = BatchRun("sale", 8, concurrency=4, amount=1, reference_prefix="load")
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            report = run.run(app, CONFIG)
+
+        assert (report["completed"], report["succeeded"], report["failed"]) == (8, 8, 0)
+        assert set(report["latency_ms"]) == {"transaction", "create", "process"}
+        assert report["latency_ms"]["create"]["count"] == 8
+        creates = [r.json() for r in m.request_history if r.url == PAYMENT_URL]
+        assert sorted(c["merchantReference"] for c in creates) == sorted(f"load-{n}" for n in range(1, 9))
+        assert all(c["subTotal"] == 100 for c in creates)
+
+    def test_error_breakdown(self, app):
+        app.extensions["api_retries"].max_attempts = 1
+        run = BatchRun("sale", 3, concurrency=3, amount=1)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m, process_status=409)
+            report = run.run(app, CONFIG)
+
+        assert report["failed"] == 3
+        assert report["errors"] == [{"stage": "process", "error": "Terminal busy", "count": 3}]
+
+    def test_rate_limit(self, app):
+        run = BatchRun("sale", 5, concurrency=5, rate=20, amount=1)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            report = run.run(app, CONFIG)
+
+        assert report["elapsed"] >= 0.2
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert [percentile(values, pct) for pct in (50, 95, 99, 100)] == [50, 95, 99, 100]
+        assert percentile([7], 99) == 7
+
+    def test_batch_page_runs_in_background(self, client):
+        client.get("/user/guest-login", follow_redirects=True)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            response = client.post("/batch", data={"type": "sale", "count": "4", "concurrency": "2", "amount": "2.50"})
+            run_id = response.headers["Location"].rsplit("/", 1)[-1]
+            report = wait_for(client, run_id)
+
+        assert report["succeeded"] == 4
+        assert client.get(f"/batch/{run_id}").status_code == 200
+        assert run_id.encode() in client.get("/batch").data
+
+        # Another session can't see the batch
+        other = client.application.test_client()
+        other.get("/user/guest-login", follow_redirects=True)
+        assert other.get(f"/batch/{run_id}/report").status_code == 404
+
+    def test_running_batches_are_capped(self, client, app):
+        runner = app.extensions["batch_runner"]
+        runner.max_running = 1
+        release = threading.Event()
+
+        def slow_create(request, context):
+            release.wait(5)
+            return {"intentId": f"intent-{request.json()['merchantReference']}"}
+
+        client.get("/user/guest-login", follow_redirects=True)
+        data = {"type": "sale", "count": "1", "concurrency": "1", "amount": "2.50"}
+        with requests_mock.Mocker() as m:
+            m.post(PAYMENT_URL, json=slow_create)
+            m.post(PROCESS_URL, json={"status": "processing"})
+            run_id = client.post("/batch", data=data).headers["Location"].rsplit("/", 1)[-1]
+            response = client.post("/batch", data=data, follow_redirects=True)
+            assert b"Too many batches are running" in response.data
+            release.set()
+            wait_for(client, run_id)
+
+            # The slot is free again once the batch has finished
+            for _ in range(100):
+                if runner._running == 0:
+                    break
+                time.sleep(0.01)
+            location = client.post("/batch", data=data).headers["Location"]
+            assert wait_for(client, location.rsplit("/", 1)[-1])["succeeded"] == 1
+
+    def test_linked_batch_requires_parent_intents(self, client):
+        client.get("/user/guest-login", follow_redirects=True)
+        response = client.post(
+            "/batch", data={"type": "linked_refund", "count": "2", "concurrency": "1", "amount": "1"}, follow_redirects=True
+        )
+        assert b"At least one Original Sale Reference is required" in response.data
+
+    def test_cli(self, app, runner):
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            result = runner.invoke(
+                args=["batch-run", "--count", "3", "--concurrency", "3", "--postback-url", "https://example.test/pb", "--json"]
+            )
+
+        assert result.exit_code == 0, result.output
+        report = json.loads(result.stdout)
+        assert report["succeeded"] == 3
+        assert all(r.json()["postbackUrl"] == "https://example.test/pb" for r in m.request_history if r.url == PAYMENT_URL)
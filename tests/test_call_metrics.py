@@ -0,0 +1,90 @@
+import pytest
+import requests
+import requests_mock
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import make_api_request
+from app.utils.call_metrics import Histogram, endpoint_template
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+
+
+@pytest.fixture
+def metrics(app):
+    return app.extensions["outbound_metrics"]
+
+
+def series(metrics, endpoint, outcome="ok"):
+    return next(s for s in metrics.snapshot()["series"] if s["endpoint"] == endpoint and s["outcome"] == outcome)
+
+
+class TestOutboundCallMetrics:
+    """Tests for outbound call latency histograms"""
+
+    def test_endpoint_templates(self):
+        assert endpoint_template("/merchant/123/intent/payment") == "/merchant/{mid}/intent/payment"
+        assert endpoint_template("/merchant/123/intent/abc-1/process") == "/merchant/{mid}/intent/{intent_id}/process"
+        assert endpoint_template("/merchant/123/intent/abc-1") == "/merchant/{mid}/intent/{intent_id}"
+        assert endpoint_template("/merchant/123/terminals/") == "/merchant/{mid}/terminals"
+        assert endpoint_template("/devices/merchant/123/terminals") == "/devices/merchant/{mid}/terminals"
+
+    def test_percentiles_are_interpolated_within_buckets(self):
+        histogram = Histogram()
+        for ms in range(1, 1001):
+            histogram.observe(ms / 1000)
+        summary = histogram.summary()
+
+        assert summary["count"] == 1000
+        assert summary["max"] == 1000.0
+        # Bucket bounds grow by 1.5x, so estimates are within a bucket's width
+        assert 400 <= summary["p50"] <= 600
+        assert 900 <= summary["p95"] <= 1000
+        assert summary["p50"] < summary["p95"] <= summary["p99"] <= summary["max"]
+
+    def test_api_calls_are_recorded_per_endpoint_and_outcome(self, app, metrics):
+        app.extensions["api_retries"].max_attempts = 2
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(
+                f"{BASE_URL}/merchant/test-mid/intent/payment",
+                [{"status_code": 503, "json": {"message": "busy"}}, {"json": {"intentId": "i-1"}}],
+            )
+            m.post(f"{BASE_URL}/merchant/test-mid/intent/i-1/process", json={"status": "processing"})
+            m.get(f"{BASE_URL}/merchant/test-mid/intent/i-1", exc=requests.exceptions.ReadTimeout)
+            make_api_request("/merchant/test-mid/intent/payment", payload={"amount": 100, "merchantReference": "r-1"})
+            make_api_request("/merchant/test-mid/intent/i-1/process")
+            make_api_request("/merchant/test-mid/intent/i-1", method="GET")
+
+        create = series(metrics, "/merchant/{mid}/intent/payment")
+        assert (create["environment"], create["method"], create["latency_ms"]["count"]) == ("sandbox", "POST", 1)
+        # A retried call records each attempt under its own outcome
+        assert series(metrics, "/merchant/{mid}/intent/payment", "503")["latency_ms"]["count"] == 1
+        assert series(metrics, "/merchant/{mid}/intent/{intent_id}/process")["latency_ms"]["count"] == 1
+        assert series(metrics, "/merchant/{mid}/intent/{intent_id}", "timeout")["latency_ms"]["count"] == 2
+
+    def test_admin_metrics_and_page(self, client, app, metrics):
+        metrics.record("POST", f"{BASE_URL}/merchant/m/intent/payment", None, 0.2)
+        metrics.record("POST", f"{BASE_URL}/merchant/m/intent/payment", None, 0.4)
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            admin_id = admin.id
+            token = create_access_token(identity=str(admin_id))
+        headers = {"Authorization": f"Bearer {token}"}
+
+        data = client.get("/api/admin/metrics/outbound-calls", headers=headers).get_json()
+        assert data["outbound_calls"]["series"][0]["latency_ms"]["count"] == 2
+
+        text = client.get("/api/admin/metrics/outbound-calls?format=prometheus", headers=headers).get_data(as_text=True)
+        labels = 'environment="sandbox",endpoint="/merchant/{mid}/intent/payment",method="POST",outcome="ok"'
+        assert f"terminal_connect_call_duration_seconds_count{{{labels}}} 2" in text
+        assert f'terminal_connect_call_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = admin_id
+            sess["user_role"] = "admin"
+        page = client.get("/user/admin/outbound-calls")
+        assert page.status_code == 200
+        assert b"/merchant/{mid}/intent/payment" in page.data
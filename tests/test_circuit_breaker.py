@@ -0,0 +1,116 @@
+import time
+
+import pytest
+import requests
+import requests_mock
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import make_api_request
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+DETAILS_URL = f"{BASE_URL}/merchant/test-mid/intent/abc"
+
+
+@pytest.fixture
+def breakers(app):
+    """Breakers that open after two failures; retries are turned off."""
+    app.extensions["api_retries"].max_attempts = 1
+    breakers = app.extensions["circuit_breakers"]
+    breakers.min_calls = 2
+    breakers.open_seconds = 0.2
+    return breakers
+
+
+def get_details(app):
+    with app.test_request_context():
+        return make_api_request("/merchant/test-mid/intent/abc", method="GET")
+
+
+def admin_token(app):
+    with app.app_context():
+        admin = User(email="admin@test.com", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+        return create_access_token(identity=str(admin.id))
+
+
+class TestCircuitBreaker:
+    """Tests for the per-gateway circuit breakers"""
+
+    def test_state_transitions(self):
+        breaker = CircuitBreaker(window=4, failure_rate=0.5, min_calls=4, open_seconds=10)
+        for failed in (False, True, False):
+            assert breaker.allow(0)
+            breaker.record(failed, 0)
+        assert breaker.state == CLOSED
+
+        breaker.record(True, 1)
+        assert breaker.state == OPEN
+        assert not breaker.allow(5)
+        assert breaker.retry_after(5) == 6
+
+        # One probe at a time once the open period is over
+        assert breaker.allow(11)
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow(11)
+        breaker.record(True, 12)
+        assert breaker.state == OPEN
+
+        assert breaker.allow(22)
+        breaker.record(False, 22)
+        assert breaker.state == CLOSED
+        assert breaker.rejected == 2
+
+    def test_open_circuit_fails_fast(self, app, breakers):
+        with requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, exc=requests.exceptions.ConnectTimeout)
+            get_details(app)
+            get_details(app)
+            data, error = get_details(app)
+
+        assert m.call_count == 2
+        assert data is None
+        assert f"Gateway {BASE_URL} is unavailable" in error
+
+    def test_client_errors_keep_the_circuit_closed(self, app, breakers):
+        with requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, status_code=404, json={"message": "Intent not found"})
+            for _ in range(3):
+                assert get_details(app) == (None, "Intent not found")
+
+        assert m.call_count == 3
+        assert breakers.snapshot()[0]["state"] == CLOSED
+
+    def test_probe_closes_the_circuit(self, app, breakers):
+        with requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, [{"status_code": 503}, {"status_code": 503}, {"json": {"intentId": "abc"}}])
+            get_details(app)
+            get_details(app)
+            assert breakers.snapshot()[0]["state"] == OPEN
+
+            time.sleep(0.25)
+            assert get_details(app) == ({"intentId": "abc"}, None)
+
+        assert breakers.snapshot()[0]["state"] == CLOSED
+
+    def test_admin_endpoints(self, client, app, breakers):
+        token = admin_token(app)
+        headers = {"Authorization": f"Bearer {token}"}
+        with requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, status_code=502)
+            get_details(app)
+            get_details(app)
+
+        response = client.get("/api/admin/circuit-breakers", headers=headers)
+        assert response.status_code == 200
+        (state,) = response.get_json()["circuit_breakers"]
+        assert state["environment"] == "sandbox"
+        assert state["state"] == OPEN
+        assert state["times_opened"] == 1
+
+        response = client.post("/api/admin/circuit-breakers/reset", json={"base_url": BASE_URL}, headers=headers)
+        assert response.get_json()["reset"] == 1
+        assert breakers.snapshot() == []
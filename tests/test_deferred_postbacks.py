@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app.asgi import create_asgi_app, _split_delay
+from app.models import User
+from app import db
+
+
+def run_asgi(asgi_app, path, query_string=b"", body=None):
+    """Drive one POST request through the ASGI app and collect the response."""
+    payload = json.dumps(body or {}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+            (b"host", b"localhost"),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 80),
+    }
+    received = []
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        received.append(message)
+
+    async def call():
+        await asgi_app(scope, receive, send)
+        return received
+
+    return call
+
+
+def response_status(messages):
+    return next(m["status"] for m in messages if m["type"] == "http.response.start")
+
+
+class TestDeferredPostbacks:
+    """Tests for parking delayed postback responses on the event loop"""
+
+    def test_split_delay_strips_parameter(self):
+        assert _split_delay(b"delay=5&foo=bar") == (5, b"foo=bar")
+        assert _split_delay(b"delay=700") == (0, b"")
+        assert _split_delay(b"foo=1") == (0, b"foo=1")
+
+    def test_concurrent_delays_share_event_loop(self, app):
+        asgi_app = create_asgi_app(app)
+        engine = app.extensions["deferred_responses"]
+
+        async def main():
+            calls = [
+                run_asgi(asgi_app, "/postback", b"delay=1", {"intentId": f"parked-{i}"})()
+                for i in range(20)
+            ]
+            return await asyncio.gather(*calls)
+
+        start = time.time()
+        results = asyncio.run(main())
+        elapsed = time.time() - start
+
+        assert all(response_status(messages) == 200 for messages in results)
+        assert elapsed < 3
+        snapshot = engine.snapshot()
+        assert snapshot["total"] == 20
+        assert snapshot["peak"] == 20
+        assert snapshot["in_flight"] == 0
+
+    def test_flask_requests_run_concurrently(self, app):
+        # Each request waits for the other, so this only finishes if they overlap
+        barrier = threading.Barrier(2, timeout=5)
+
+        @app.route("/test-barrier", methods=["POST"])
+        def wait_at_barrier():
+            barrier.wait()
+            return "ok"
+
+        asgi_app = create_asgi_app(app)
+
+        async def main():
+            return await asyncio.gather(*(run_asgi(asgi_app, "/test-barrier")() for _ in range(2)))
+
+        results = asyncio.run(main())
+
+        assert [response_status(messages) for messages in results] == [200, 200]
+
+    def test_cap_responds_immediately_when_full(self, app):
+        engine = app.extensions["deferred_responses"]
+        engine.max_parked = 1
+        asgi_app = create_asgi_app(app)
+
+        async def main():
+            return await asyncio.gather(
+                run_asgi(asgi_app, "/postback", b"delay=1", {"intentId": "a"})(),
+                run_asgi(asgi_app, "/postback", b"delay=1", {"intentId": "b"})(),
+            )
+
+        results = asyncio.run(main())
+
+        assert all(response_status(messages) == 200 for messages in results)
+        assert engine.snapshot()["rejected"] == 1
+
+    def test_wsgi_delay_respects_cap(self, client, app):
+        app.extensions["deferred_responses"].max_parked = 1
+        app.extensions["deferred_responses"].in_flight = 1
+
+        start = time.time()
+        response = client.post("/postback?delay=2", json={"intentId": "capped"})
+
+        assert response.status_code == 200
+        assert time.time() - start < 0.5
+        assert app.extensions["deferred_responses"].snapshot()["rejected"] == 1
+
+    def test_admin_metrics_endpoint(self, client, app):
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get(
+            "/api/admin/metrics/postback-delays",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        assert response.status_code == 200
+        assert response.get_json()["postback_delays"]["in_flight"] == 0
@@ -0,0 +1,219 @@
+import datetime
+import os
+import tempfile
+import threading
+
+import pytest
+
+from app.utils.guest_store import HEADER, SLOT, GuestPostbackStore, current_hour, token_key
+
+
+class FakeApp:
+    def __init__(self, **config):
+        self.config = config
+        self.extensions = {}
+
+
+@pytest.fixture
+def store_config():
+    base = os.path.join(tempfile.mkdtemp(), "postbacks.json")
+    return {
+        "POSTBACKS_FILE": base,
+        "GUEST_POSTBACK_LIMIT": 5,
+        "GUEST_POSTBACK_SLOT_SIZE": 1024,
+        "GUEST_SHARD_COUNT": 8,
+    }
+
+
+def record(n, **payload):
+    return {
+        "payload": {"intentId": f"guest-{n}", **payload},
+        "received_at": f"2025-01-01T00:00:{n:02d}Z",
+        "headers": {},
+    }
+
+
+def hours_ago(hours):
+    return current_hour(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours))
+
+
+def shard(store, token=None):
+    return store._shard(store.shard_for(token_key(token)))
+
+
+def tokens_on_distinct_shards(store, count):
+    tokens, shards = [], set()
+    for n in range(1000):
+        shard_id = store.shard_for(token_key(f"token-{n}"))
+        if shard_id not in shards:
+            shards.add(shard_id)
+            tokens.append(f"token-{n}")
+            if len(tokens) == count:
+                return tokens
+
+
+def _move_segment(store, hour, token=None):
+    """Rename the current hour's segment to hour and stamp its header to match."""
+    guest_shard = shard(store, token)
+    path = guest_shard.segment_path(hour)
+    os.rename(guest_shard.segment_path(current_hour()), path)
+    guest_shard._segments.clear()
+    with open(path, "r+b") as f:
+        header = list(HEADER.unpack(f.read(HEADER.size)))
+        header[5] = hour.encode()
+        f.seek(0)
+        f.write(HEADER.pack(*header))
+
+
+def intents(records):
+    return [r["payload"]["intentId"] for r in records]
+
+
+class TestGuestPostbackStore:
+    """Tests for the memory-mapped guest postback segments"""
+
+    def test_keeps_newest_records(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        for n in range(8):
+            store.append(record(n))
+
+        assert intents(store.recent()) == [f"guest-{n}" for n in range(3, 8)]
+        assert os.path.getsize(shard(store).segment_path(current_hour())) == store.size
+
+    def test_workers_share_the_ring(self, store_config):
+        worker_a = GuestPostbackStore(FakeApp(**store_config))
+        worker_b = GuestPostbackStore(FakeApp(**store_config))
+
+        worker_a.append(record(1))
+        worker_b.append(record(2))
+
+        assert intents(worker_a.recent()) == ["guest-1", "guest-2"]
+        assert intents(worker_b.recent()) == ["guest-1", "guest-2"]
+
+    def test_concurrent_appends_are_not_lost(self, store_config):
+        store_config["GUEST_POSTBACK_LIMIT"] = 200
+        stores = [GuestPostbackStore(FakeApp(**store_config)) for _ in range(4)]
+
+        def append_many(store, worker):
+            for n in range(25):
+                store.append(record(worker * 25 + n))
+
+        threads = [threading.Thread(target=append_many, args=(s, i)) for i, s in enumerate(stores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(stores[0].recent()) == 100
+
+    def test_reads_span_hourly_segments(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1))
+        store.append(record(2))
+        _move_segment(store, hours_ago(1))
+
+        for n in range(3, 7):
+            store.append(record(n))
+
+        assert intents(store.recent()) == [f"guest-{n}" for n in range(2, 7)]
+
+    def test_expire_unlinks_old_segments(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1))
+        _move_segment(store, hours_ago(30))
+
+        # Segments past the TTL are ignored by reads even before they are removed
+        assert store.recent() == []
+        assert store.expire() == 1
+        assert store.shard_ids() == []
+
+    def test_clear_removes_segments(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        other_worker = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1))
+        other_worker.recent()
+
+        store.clear()
+        assert other_worker.recent() == []
+        other_worker.append(record(2))
+        assert intents(store.recent()) == ["guest-2"]
+
+    def test_oversized_record_is_summarized(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1, rawReceipt="x" * 5000, status="success"))
+
+        stored = store.recent()[0]
+        assert stored["truncated"] is True
+        assert stored["payload"] == {"intentId": "guest-1", "status": "success"}
+
+    def test_slot_being_written_is_skipped(self, store_config):
+        store = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1))
+        store.append(record(2))
+        guest_shard = shard(store)
+        SLOT.pack_into(guest_shard._segment(current_hour()).mm, guest_shard._slot_offset(1), 0, 0)
+
+        assert intents(GuestPostbackStore(FakeApp(**store_config)).recent()) == ["guest-1"]
+
+    def test_geometry_change_resets_ring(self, store_config):
+        GuestPostbackStore(FakeApp(**store_config)).append(record(1))
+        store_config["GUEST_POSTBACK_LIMIT"] = 10
+
+        assert GuestPostbackStore(FakeApp(**store_config)).recent() == []
+
+    def test_guests_only_see_their_own_postbacks(self, store_config):
+        # One shard, so both guests share the same rings
+        store_config["GUEST_SHARD_COUNT"] = 1
+        store = GuestPostbackStore(FakeApp(**store_config))
+        store.append(record(1), "guest-a")
+        store.append(record(2), "guest-b")
+        store.append(record(3))
+
+        assert intents(store.recent("guest-a")) == ["guest-1"]
+        assert intents(store.recent("guest-b")) == ["guest-2"]
+        assert intents(store.recent()) == ["guest-3"]
+        with open(shard(store).segment_path(current_hour()), "rb") as f:
+            assert b"guest-a" not in f.read()
+
+    def test_shards_cap_postbacks_separately(self, store_config):
+        store_config["GUEST_SHARD_COUNT"] = 64
+        store = GuestPostbackStore(FakeApp(**store_config))
+        first, other = tokens_on_distinct_shards(store, 2)
+        store.append(record(1), first)
+        for n in range(10):
+            store.append(record(10 + n), other)
+
+        assert intents(store.recent(first)) == ["guest-1"]
+        assert len(store.recent(other)) == 5
+
+    def test_idle_shards_are_evicted(self, store_config):
+        store_config.update(GUEST_SHARD_COUNT=1000, GUEST_MAX_ACTIVE_SHARDS=2)
+        store = GuestPostbackStore(FakeApp(**store_config))
+        oldest, recent, newest = tokens_on_distinct_shards(store, 3)
+        store.append(record(1), oldest)
+        store.append(record(2), recent)
+        # The oldest shard is written to again, so the other one is the least recently used
+        store.append(record(3), oldest)
+        store.append(record(4), newest)
+
+        assert len(store.shard_ids()) == 2
+        assert intents(store.recent(oldest)) == ["guest-1", "guest-3"]
+        assert store.recent(recent) == []
+        assert intents(store.recent(newest)) == ["guest-4"]
+        # Only the two most recently used shards stay mapped in this process
+        assert len(store._shards) == 2
+
+    def test_mapped_segments_are_capped(self, store_config):
+        store_config.update(GUEST_SHARD_COUNT=1000, GUEST_MAX_MAPPED_SEGMENTS=2)
+        store = GuestPostbackStore(FakeApp(**store_config))
+        tokens = tokens_on_distinct_shards(store, 4)
+        fds_before = len(os.listdir("/proc/self/fd"))
+        for n, token in enumerate(tokens):
+            store.append(record(n), token)
+
+        # Only the two newest mappings hold descriptors (two each); the others can be remapped
+        assert len(store._mapped_segments) == 2
+        assert sum(len(store._shard(store.shard_for(token_key(t)))._segments) for t in tokens[:2]) == 0
+        assert len(os.listdir("/proc/self/fd")) - fds_before <= 4
+        assert [intents(store.recent(token)) for token in tokens] == [[f"guest-{n}"] for n in range(4)]
+        assert len(store._mapped_segments) == 2
@@ -0,0 +1,100 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import session
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import make_api_request, process_intent
+from app.utils.http_client import HttpClient, host_key
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET(body=b'{"intentId": "intent-1"}')
+
+    def do_GET(self, body=b'{"ok": true}'):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "tracking=1; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClient:
+    """Tests for the pooled outbound HTTP client"""
+
+    def test_connections_are_reused(self, local_server):
+        client = HttpClient()
+        for _ in range(3):
+            assert client.get(f"{local_server}/ping", timeout=5).json() == {"ok": True}
+
+        stats = client.stats()["hosts"][host_key(local_server)]
+        assert stats["requests"] == 3
+        assert stats["connections_opened"] == 1
+        assert stats["reused"] == 2
+        assert stats["idle_connections"] == 1
+        client.close()
+
+    def test_cookies_are_not_shared(self, local_server):
+        client = HttpClient()
+        client.get(f"{local_server}/ping", timeout=5)
+
+        assert len(client.session_for(local_server).cookies) == 0
+        client.close()
+
+    def test_one_session_per_host(self, app):
+        client = app.extensions["http_client"]
+        sandbox = client.session_for("https://api-terminal-gateway.tillvision.show/devices/merchant/1")
+
+        assert client.session_for("https://API-terminal-gateway.tillvision.show/other") is sandbox
+        assert client.session_for("https://api-terminal-gateway.tillpayments.com/devices") is not sandbox
+        # Terminal Connect hosts are set up when the app starts
+        assert "https://api-terminal-gateway.tillpayments.dev" in client.stats()["hosts"]
+
+    def test_intent_calls_share_a_connection(self, app, local_server):
+        with app.test_request_context():
+            session["BASE_URL"] = local_server
+            response_data, error = make_api_request("/merchant/m1/intent/payment", payload={"subTotal": 100})
+            assert error is None
+            _, error = process_intent(response_data["intentId"])
+            assert error is None
+
+        stats = app.extensions["http_client"].stats()["hosts"][host_key(local_server)]
+        assert stats["requests"] == 2
+        assert stats["connections_opened"] == 1
+
+    def test_admin_pool_metrics(self, client, app):
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get(
+            "/api/admin/metrics/http-pool", headers={"Authorization": f"Bearer {token}"}
+        )
+
+        assert response.status_code == 200
+        metrics = response.get_json()["http_pool"]
+        assert metrics["pool_size"] == app.config["HTTP_POOL_SIZE"]
+        assert "https://api-terminal-gateway.tillvision.show" in metrics["hosts"]
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+import requests_mock
+from flask import session
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import get_intent_details
+from app.utils.intent_cache import IntentDetailsCache
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+DETAILS_URL = f"{BASE_URL}/merchant/test-mid/intent/parent-1"
+
+
+@pytest.fixture
+def cache(app):
+    return app.extensions["intent_details_cache"]
+
+
+class TestIntentDetailsCache:
+    """Tests for the parent intent details cache"""
+
+    def test_repeat_lookups_are_served_from_cache(self, app, cache):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, json={"intentId": "parent-1", "amount": 100})
+            first = get_intent_details("parent-1")
+            second = get_intent_details("parent-1")
+
+        assert first == second == ({"intentId": "parent-1", "amount": 100}, None)
+        assert m.call_count == 1
+        assert cache.snapshot()["hits"] == 1
+        assert cache.snapshot()["misses"] == 1
+
+    def test_errors_are_not_cached(self, app, cache):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, [{"status_code": 404, "json": {"message": "Intent not found"}}, {"json": {"intentId": "parent-1"}}])
+            assert get_intent_details("parent-1") == (None, "Intent not found")
+            assert get_intent_details("parent-1") == ({"intentId": "parent-1"}, None)
+
+        assert m.call_count == 2
+
+    def test_entries_are_keyed_by_mid(self, app, cache):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, json={"intentId": "parent-1"})
+            m.get(f"{BASE_URL}/merchant/other-mid/intent/parent-1", json={"intentId": "parent-1", "mid": "other"})
+            get_intent_details("parent-1")
+            session["MID"] = "other-mid"
+            data, _ = get_intent_details("parent-1")
+
+        assert data["mid"] == "other"
+        assert m.call_count == 2
+
+    def test_concurrent_lookups_share_one_fetch(self):
+        cache = IntentDetailsCache()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(1)
+            return {"intentId": "parent-1"}, None
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("k", fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [({"intentId": "parent-1"}, None)] * 8
+        assert cache.snapshot()["coalesced"] == 7
+
+    def test_interrupted_fetch_releases_followers(self):
+        cache = IntentDetailsCache()
+        started = threading.Event()
+        results = []
+
+        def fetch():
+            started.set()
+            time.sleep(0.1)
+            raise KeyboardInterrupt
+
+        def follower():
+            started.wait(1)
+            results.append(cache.get_or_fetch("k", lambda: ({"refetched": True}, None)))
+
+        thread = threading.Thread(target=follower)
+        thread.start()
+        with pytest.raises(KeyboardInterrupt):
+            cache.get_or_fetch("k", fetch)
+        thread.join(1)
+
+        assert results == [(None, "Intent details lookup was interrupted")]
+        assert cache.get_or_fetch("k", lambda: ({"refetched": True}, None)) == ({"refetched": True}, None)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = IntentDetailsCache()
+        cache.max_size = 2
+        for key in ("a", "b", "a", "c"):
+            cache.get_or_fetch(key, lambda: ({"key": key}, None))
+
+        assert cache.snapshot()["evictions"] == 1
+        assert cache.get_or_fetch("b", lambda: (None, "refetched")) == (None, "refetched")
+        assert cache.get_or_fetch("a", lambda: (None, "refetched")) == ({"key": "a"}, None)
+
+        cache.ttl = 0.05
+        cache.get_or_fetch("d", lambda: ({"key": "d"}, None))
+        time.sleep(0.1)
+        assert cache.get_or_fetch("d", lambda: ({"key": "d2"}, None)) == ({"key": "d2"}, None)
+
+    def test_admin_cache_metrics(self, client, app):
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get("/api/admin/metrics/intent-cache", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        assert response.get_json()["intent_cache"]["max_size"] == app.config["INTENT_CACHE_SIZE"]
@@ -0,0 +1,152 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+import requests_mock
+from flask import session
+from flask_jwt_extended import create_access_token
+
+from app.models import OutboundIntent, User, db, utc_now
+from app.utils.transactions import REVERSAL, SALE, run_transaction
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+CONFIG = {
+    "ENVIRONMENT": "sandbox",
+    "BASE_URL": BASE_URL,
+    "MID": "test-mid",
+    "TID": "test-tid",
+    "API_KEY": "test-api-key",
+    "guest_token": "guest-token",
+}
+
+
+def create_intents(app, intent_ids, kind=SALE):
+    """Run transactions against a mocked gateway, returning their intent IDs in turn."""
+    ids = iter(intent_ids)
+    with requests_mock.Mocker() as m, app.test_request_context():
+        session.update(CONFIG)
+        m.post(re.compile(r".*/intent/(payment|reversal)$"), json=lambda request, context: {"intentId": next(ids)})
+        m.post(re.compile(r".*/process$"), json={"status": "processing"})
+        for n, _ in enumerate(intent_ids):
+            result = run_transaction(kind, f"ref-{n}", amount=Decimal("12.34"), parent_intent_id="parent")
+            assert result["error"] is None
+
+
+class TestIntentLedger:
+    """Tests for the outbound intent ledger and latency report"""
+
+    def test_postback_joins_created_intent(self, app, client):
+        ledger = app.extensions["intent_ledger"]
+        create_intents(app, ["intent-1", "intent-2"])
+        assert ledger.flush() == 4
+
+        client.post("/postback/guest/guest-token", json={"intentId": "intent-1", "status": "APPROVED"})
+        client.post("/postback/guest/guest-token", json={"intentId": "intent-1", "status": "DECLINED"})
+        ledger.flush()
+
+        with app.app_context():
+            row = db.session.scalar(db.select(OutboundIntent).filter_by(intent_id="intent-1"))
+            assert (row.environment, row.tid, row.amount, row.transaction_type) == ("sandbox", "test-tid", 1234, SALE)
+            assert row.postback_status == "APPROVED"  # only the first postback counts
+            assert row.process_latency is not None and row.postback_latency >= 0
+            assert row.end_to_end_latency >= row.create_latency
+            assert row.guest_key is not None and row.user_id is None
+        assert ledger.snapshot()["joined"] == 1
+
+    def test_unmatched_postbacks_are_retried_then_dropped(self, app, client):
+        ledger = app.extensions["intent_ledger"]
+        client.post("/postback/guest/guest-token", json={"intentId": "later", "status": "APPROVED"})
+        client.post("/postback/guest/guest-token", json={"intentId": "unknown", "status": "APPROVED"})
+        ledger.flush()
+        assert ledger.snapshot()["awaiting_match"] == 2
+
+        # The intent's row arrives after its postback (e.g. created in another worker)
+        create_intents(app, ["later"])
+        ledger.match_window = 0
+        ledger.flush()
+        with app.app_context():
+            assert db.session.scalar(db.select(OutboundIntent).filter_by(intent_id="later")).postback_status == "APPROVED"
+        assert ledger.snapshot()["unmatched"] == 1
+
+    def test_replayed_create_is_recorded_once(self, app):
+        create_intents(app, ["same", "same"], kind=REVERSAL)
+        app.extensions["intent_ledger"].flush()
+        with app.app_context():
+            (row,) = db.session.scalars(db.select(OutboundIntent)).all()
+            assert row.amount is None and row.transaction_type == REVERSAL
+
+    def test_postback_before_process_is_measured_from_processing(self, app):
+        ledger = app.extensions["intent_ledger"]
+        now = utc_now()
+        with app.test_request_context():
+            session.update(CONFIG)
+            ledger.record_create("early", SALE, now - timedelta(seconds=10), now - timedelta(seconds=9))
+        ledger.record_postback("early", "APPROVED", received_at=now)
+        ledger.flush()
+        # The process response (or another worker's flush) comes after the postback was joined
+        ledger.record_process("early", now - timedelta(seconds=2), 7.0)
+        ledger.flush()
+
+        with app.app_context():
+            row = db.session.scalar(db.select(OutboundIntent).filter_by(intent_id="early"))
+            assert (row.process_latency, row.postback_latency, row.end_to_end_latency) == (7.0, 2.0, 10.0)
+
+    def test_create_recorded_elsewhere_keeps_the_flush(self, app, client):
+        ledger = app.extensions["intent_ledger"]
+        create_intents(app, ["shared"])
+        ledger.flush()
+        # Another worker's replay of the same intent, flushed with this worker's events
+        with app.test_request_context():
+            session.update(CONFIG)
+            ledger.record_create("shared", SALE, utc_now(), utc_now())
+        create_intents(app, ["other"])
+        client.post("/postback/guest/guest-token", json={"intentId": "shared", "status": "APPROVED"})
+
+        assert ledger.flush() == 3
+        with app.app_context():
+            rows = {row.intent_id: row for row in db.session.scalars(db.select(OutboundIntent))}
+        assert set(rows) == {"shared", "other"}
+        assert rows["shared"].postback_status == "APPROVED"
+        assert rows["other"].processed_at is not None
+        assert ledger.snapshot()["failed"] == 0
+
+    def test_latency_report(self, app, client):
+        ledger = app.extensions["intent_ledger"]
+        create_intents(app, ["a", "b", "c"])
+        ledger.flush()
+        for intent_id in ("a", "b"):
+            client.post("/postback/guest/guest-token", json={"intentId": intent_id, "status": "APPROVED"})
+        ledger.flush()
+
+        # Reports only cover the session's own intents
+        assert client.get("/api/latency").status_code == 401
+        with client.session_transaction() as sess:
+            sess.update(is_guest=True, guest_token="guest-token")
+        report = client.get("/api/latency?hours=1").get_json()
+        (group,) = report["groups"]
+        assert (group["environment"], group["tid"], group["count"]) == ("sandbox", "test-tid", 3)
+        assert (group["with_postback"], group["statuses"]) == (2, {"APPROVED": 2})
+        assert group["latency_ms"]["end_to_end"]["count"] == 2
+        assert group["latency_ms"]["create"]["count"] == 3
+        assert client.get("/api/latency?tid=other").get_json()["groups"] == []
+        assert b"sandbox / test-tid" in client.get("/latency").data
+
+        with client.session_transaction() as sess:
+            sess["guest_token"] = "someone-else"
+        assert client.get("/api/latency").get_json()["groups"] == []
+
+    def test_admin_report_covers_everyone(self, app, client):
+        create_intents(app, ["x"])
+        app.extensions["intent_ledger"].flush()
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get("/api/admin/metrics/intent-latency", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["intent_latency"]["groups"][0]["count"] == 1
+        assert data["ledger"]["written"] == 1
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+from flask import session
+from werkzeug.serving import make_server
+
+from app.mock_gateway import MockGateway, create_asgi_app, create_wsgi_app, parse_distribution
+from app.utils.transactions import LINKED_REFUND, SALE, run_transaction
+
+HEADERS = {"x-api-key": "key"}
+
+
+class RecordingSender:
+    """Collects postbacks instead of sending them."""
+
+    def __init__(self):
+        self.sent = []
+        self.stats = {}
+
+    def schedule(self, url, payload, delay):
+        self.sent.append((url, payload, delay))
+
+
+def call(gateway, method, path, body=None, headers=HEADERS):
+    status, response, _ = gateway.handle(method, f"/devices{path}", headers, json.dumps(body) if body else b"")
+    return status, response
+
+
+@pytest.fixture
+def postback_server():
+    """Local HTTP server whose received postbacks land on a queue."""
+    received = queue.Queue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.put((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+
+
+class TestMockGateway:
+    """Tests for the mock Terminal Connect gateway"""
+
+    def test_distributions(self):
+        rng = random.Random(1)
+        assert parse_distribution("80")(rng) == 0.08
+        assert parse_distribution("fixed:5")(rng) == 0.005
+        assert parse_distribution(None)(rng) == 0
+        assert all(0.02 <= parse_distribution("uniform:20-40")(rng) <= 0.04 for _ in range(50))
+        assert parse_distribution("normal:50,500")(rng) >= 0
+        samples = sorted(parse_distribution("lognormal:100,0.5")(rng) for _ in range(1001))
+        assert 0.08 < samples[500] < 0.12
+        assert parse_distribution("exp:10")(rng) >= 0
+        for spec in ("gamma:1", "uniform:5", "abc"):
+            with pytest.raises(ValueError):
+                parse_distribution(spec)
+
+    def test_intent_flow(self):
+        sender = RecordingSender()
+        gateway = MockGateway(latency="15", postback_delay="30", seed=1, sender=sender)
+        status, sale = call(gateway, "POST", "/merchant/m1/intent/payment",
+                            {"subTotal": 1000, "merchantReference": "r1", "postbackUrl": "http://pb/1"})
+        assert status == 200 and sale["status"] == "CREATED"
+        assert gateway.handle("POST", "/devices/merchant/m1/intent/payment", HEADERS, b"{}")[2] == 0.015
+
+        assert call(gateway, "POST", f"/merchant/m1/intent/{sale['intentId']}/process", {"tid": "t1"})[0] == 200
+        ((url, postback, delay),) = sender.sent
+        assert (url, delay) == ("http://pb/1", 0.03)
+        assert postback["intentId"] == sale["intentId"]
+        assert (postback["status"], postback["terminalId"], postback["amount"]) == ("APPROVED", "t1", 1000)
+
+        status, details = call(gateway, "GET", f"/merchant/m1/intent/{sale['intentId']}")
+        external = json.loads(details["transactionDetails"]["externalData"])
+        assert (external["hostTerminalId"], external["originalAmount"]) == ("t1", 1000)
+
+        assert call(gateway, "POST", "/merchant/m1/intent/nope/process", {"tid": "t1"})[0] == 404
+        assert call(gateway, "GET", f"/merchant/m2/intent/{sale['intentId']}")[0] == 404
+        assert call(gateway, "GET", "/merchant/m1/terminals")[1]["terminals"]
+        assert call(gateway, "GET", "/merchant/m1/terminals", headers={})[0] == 401
+        assert gateway.snapshot()["process"] == 2
+
+    def test_concurrent_process_calls_send_one_postback(self):
+        sender = RecordingSender()
+        gateway = MockGateway(decline_rate=0.5, sender=sender)
+        sale = call(gateway, "POST", "/merchant/m1/intent/payment", {"subTotal": 1, "postbackUrl": "http://pb"})[1]
+        path = f"/merchant/m1/intent/{sale['intentId']}/process"
+
+        def slow_chance(rate):
+            # Widens the window between claiming the intent and settling it
+            time.sleep(0.05)
+            return False
+
+        # A retried process call racing the first attempt
+        with patch.object(gateway, "_chance", slow_chance):
+            threads = [threading.Thread(target=call, args=(gateway, "POST", path, {"tid": "t1"})) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert len(sender.sent) == 1
+        assert call(gateway, "GET", f"/merchant/m1/intent/{sale['intentId']}")[1]["status"] == "APPROVED"
+
+    def test_idempotency_errors_and_declines(self):
+        sender = RecordingSender()
+        gateway = MockGateway(decline_rate=1, sender=sender)
+        headers = dict(HEADERS, **{"idempotency-key": "k1"})
+        first = call(gateway, "POST", "/merchant/m1/intent/refund", {"amount": 5}, headers)[1]
+        assert call(gateway, "POST", "/merchant/m1/intent/refund", {"amount": 5}, headers)[1] == first
+
+        # Non-pinpad refunds are completed, and their postback sent, at create time
+        call(gateway, "POST", "/merchant/m1/intent/refund",
+             {"amount": 5, "isNonPinpadRefund": True, "postbackUrl": "http://pb", "transactionDetails": {"tid": "t9"}})
+        assert sender.sent[0][1]["status"] == "DECLINED"
+
+        # Keys are evicted along with their intents; a replay after that creates a new intent
+        gateway = MockGateway(sender=sender)
+        with patch("app.mock_gateway.MAX_INTENTS", 1):
+            keyed = call(gateway, "POST", "/merchant/m1/intent/payment", {"subTotal": 1}, headers)[1]
+            call(gateway, "POST", "/merchant/m1/intent/payment", {"subTotal": 2})
+            assert gateway._idempotent == {}
+            replay = call(gateway, "POST", "/merchant/m1/intent/payment", {"subTotal": 1}, headers)
+            assert replay[0] == 200 and replay[1]["intentId"] != keyed["intentId"]
+
+        failing = MockGateway(error_rate=1, sender=sender)
+        assert call(failing, "POST", "/merchant/m1/intent/payment", {"subTotal": 1})[0] == 503
+        assert failing.snapshot()["errors_injected"] == 1
+
+    def test_app_against_wsgi_server(self, app, postback_server):
+        postback_url, received = postback_server
+        server = make_server("127.0.0.1", 0, create_wsgi_app(MockGateway(postback_delay="10")), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with app.test_request_context():
+                session.update(
+                    BASE_URL=f"http://127.0.0.1:{server.server_port}/devices",
+                    MID="test-mid",
+                    TID="WP123456",
+                    API_KEY="test-api-key",
+                    POSTBACK_URL=f"{postback_url}/postback",
+                )
+                sale = run_transaction(SALE, "mock-sale", amount=Decimal("10.00"))
+                assert sale["error"] is None and sale["processed"]
+                path, postback = received.get(timeout=5)
+                assert (path, postback["intentId"], postback["status"]) == ("/postback", sale["intent_id"], "APPROVED")
+
+                # A non-pinpad refund on a Charge Anywhere TID reads the sale's details first
+                refund = run_transaction(LINKED_REFUND, "mock-refund", amount=Decimal("4.00"),
+                                         parent_intent_id=sale["intent_id"])
+                assert refund["error"] is None and not refund["processed"]
+                assert received.get(timeout=5)[1]["transactionType"] == "refund"
+        finally:
+            server.shutdown()
+
+    def test_asgi_app(self):
+        application = create_asgi_app(MockGateway(latency="5"))
+        sent = []
+
+        async def request(method, path, body=b""):
+            messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+            async def receive():
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": method, "path": path, "headers": [(b"x-api-key", b"key")]}
+            await application(scope, receive, send)
+
+        asyncio.run(request("POST", "/devices/merchant/m1/intent/payment", b'{"subTotal": 100}'))
+        start, body = sent
+        assert start["status"] == 200
+        assert json.loads(body["body"])["amount"] == 100
+        assert application.gateway.snapshot()["create"] == 1
@@ -82,6 +82,28 @@ class TestPostbackEnhancements:
         assert b"test-intent-123" in response.data
         assert b"test-terminal-789" in response.data
 
+    def test_guest_sessions_are_isolated(self, app):
+        """Test that each guest only sees postbacks sent to their own postback URL"""
+        first, second = app.test_client(), app.test_client()
+        guest_login(first)
+        guest_login(second)
+        with first.session_transaction() as sess:
+            first_token = sess["guest_token"]
+        with second.session_transaction() as sess:
+            assert sess["guest_token"] != first_token
+
+        # Terminal Connect posts without the guest's session cookie
+        response = app.test_client().post(
+            f"/postback/guest/{first_token}", json={"intentId": "first-guest-intent"}
+        )
+        assert response.status_code == 200
+
+        assert b"first-guest-intent" in first.get("/postbacks").data
+        assert b"first-guest-intent" not in second.get("/postbacks").data
+
+        # The config page offers the guest-specific URL
+        assert f"/postback/guest/{first_token}".encode() in first.get("/config").data
+
     def test_intent_id_required_for_authenticated_users(self, client):
         """Test that intent_id is required and has a default fallback"""
         create_test_user(client)
@@ -939,4 +961,155 @@ class TestNonBlockingDelay:
         # Check that logs mention non-blocking delay
         log_messages = [record.message for record in caplog.records]
         assert any("non-blocking delay" in msg.lower() for msg in log_messages)
-        assert any("non-blocking delay completed" in msg.lower() for msg in log_messages)
\ No newline at end of file
+        assert any("non-blocking delay completed" in msg.lower() for msg in log_messages)
+
+class TestDenormalizedPostbackColumns:
+    """Tests for payload fields extracted into indexed columns at ingest"""
+
+    def test_columns_populated_at_ingest(self, client):
+        create_test_user(client)
+        login(client, "user@test.com", "userpass")
+
+        client.post("/postback", json={**create_test_postback_data(), "currency": "AUD"})
+
+        with client.application.app_context():
+            postback = UserPostback.query.first()
+            assert postback.terminal_id == "test-terminal-789"
+            assert postback.payload_status == "success"
+            assert postback.merchant_reference == "ref-123"
+            assert postback.amount == "10.00"
+            assert postback.currency == "AUD"
+
+    def test_search_by_merchant_reference(self, client):
+        create_test_user(client)
+        login(client, "user@test.com", "userpass")
+        client.post("/postback", json=create_test_postback_data())
+
+        response = client.get("/postbacks?search=ref-123")
+        assert b"test-intent-123" in response.data
+
+    def test_backfill_command_populates_existing_rows(self, client, runner):
+        create_test_user(client)
+        with client.application.app_context():
+            user = User.query.filter_by(email="user@test.com").first()
+            db.session.add(
+                UserPostback(
+                    user_id=user.id,
+                    transaction_type="sale",
+                    intent_id="legacy-intent",
+                    status="received",
+                    postback_data=json.dumps({"payload": create_test_postback_data(), "headers": {}}),
+                )
+            )
+            db.session.add(
+                UserPostback(
+                    user_id=user.id,
+                    transaction_type="sale",
+                    intent_id="broken-intent",
+                    status="received",
+                    postback_data="not json",
+                )
+            )
+            db.session.commit()
+
+        result = runner.invoke(args=["backfill-postbacks", "--batch-size", "1"])
+
+        assert "Backfill complete: 2 postbacks updated" in result.output
+        with client.application.app_context():
+            legacy = UserPostback.query.filter_by(intent_id="legacy-intent").first()
+            assert legacy.terminal_id == "test-terminal-789"
+            assert legacy.merchant_reference == "ref-123"
+            broken = UserPostback.query.filter_by(intent_id="broken-intent").first()
+            assert broken.terminal_id is None
+
+
+class TestCursorPagination:
+    """Tests for keyset (cursor) pagination of stored postbacks"""
+
+    def create_postbacks(self, client, count):
+        create_test_user(client)
+        login(client, "user@test.com", "userpass")
+        for i in range(count):
+            client.post("/postback", json={"intentId": f"page-intent-{i:02d}"})
+
+    def test_api_walks_forward_and_back(self, client):
+        self.create_postbacks(client, 5)
+
+        first = client.get("/api/postbacks?per_page=2").get_json()
+        assert [pb["intent_id"] for pb in first["postbacks"]] == ["page-intent-04", "page-intent-03"]
+        assert first["pagination"]["has_prev"] is False
+        assert first["pagination"]["total"] is None
+
+        second = client.get(f"/api/postbacks?per_page=2&cursor={first['pagination']['next_cursor']}").get_json()
+        assert [pb["intent_id"] for pb in second["postbacks"]] == ["page-intent-02", "page-intent-01"]
+
+        last = client.get(f"/api/postbacks?per_page=2&cursor={second['pagination']['next_cursor']}").get_json()
+        assert [pb["intent_id"] for pb in last["postbacks"]] == ["page-intent-00"]
+        assert last["pagination"]["has_next"] is False
+
+        back = client.get(f"/api/postbacks?per_page=2&cursor={last['pagination']['prev_cursor']}").get_json()
+        assert [pb["intent_id"] for pb in back["postbacks"]] == ["page-intent-02", "page-intent-01"]
+        assert back["pagination"]["has_prev"] is True
+
+    def test_api_optional_total_and_auth(self, client):
+        assert client.get("/api/postbacks").status_code == 401
+
+        self.create_postbacks(client, 3)
+        data = client.get("/api/postbacks?include_total=true").get_json()
+        assert data["pagination"]["total"] == 3
+
+    def test_invalid_cursor_starts_from_newest(self, client):
+        self.create_postbacks(client, 2)
+
+        data = client.get("/api/postbacks?cursor=not-a-cursor").get_json()
+        assert data["postbacks"][0]["intent_id"] == "page-intent-01"
+
+    def test_page_links_use_cursor(self, client):
+        self.create_postbacks(client, 21)
+
+        response = client.get("/postbacks?per_page=20")
+        assert b"page-intent-20" in response.data
+        assert b"page-intent-00" not in response.data
+        assert b"cursor=" in response.data
+        assert b"21 total" in response.data
+
+
+class TestLazyPostbackDetail:
+    """Tests for loading postback payloads on demand"""
+
+    def test_list_page_does_not_embed_payload(self, client):
+        create_test_user(client)
+        login(client, "user@test.com", "userpass")
+        client.post("/postback", json={"intentId": "lazy-intent", "secretField": "only-in-detail"})
+
+        response = client.get("/postbacks")
+        assert b"lazy-intent" in response.data
+        assert b"only-in-detail" not in response.data
+        assert b"data-detail-url" in response.data
+
+    def test_detail_returns_payload_and_headers(self, client):
+        create_test_user(client)
+        login(client, "user@test.com", "userpass")
+        client.post("/postback", json={"intentId": "lazy-intent", "secretField": "only-in-detail"})
+        with client.application.app_context():
+            postback_id = UserPostback.query.filter_by(intent_id="lazy-intent").first().id
+
+        response = client.get(f"/postbacks/{postback_id}/detail")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["payload"]["secretField"] == "only-in-detail"
+        assert "Content-Type" in data["headers"]
+
+    def test_detail_is_owner_only(self, client):
+        create_test_user(client)
+        create_test_user(client, email="other@test.com", password="otherpass")
+        login(client, "user@test.com", "userpass")
+        client.post("/postback", json={"intentId": "lazy-intent"})
+        with client.application.app_context():
+            postback_id = UserPostback.query.filter_by(intent_id="lazy-intent").first().id
+        client.get("/user/logout", follow_redirects=True)
+
+        assert client.get(f"/postbacks/{postback_id}/detail").status_code == 401
+
+        login(client, "other@test.com", "otherpass")
+        assert client.get(f"/postbacks/{postback_id}/detail").status_code == 404
@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from app.utils.postback_events import PostbackEventBus, guest_channel, user_channel
+
+
+def login(client, email, password):
+    return client.post("/user/login", data={"email": email, "password": password}, follow_redirects=True)
+
+
+def create_user(app, email="stream@test.com", password="userpass"):
+    with app.app_context():
+        user = User(email=email, role="user")
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def read_event(body):
+    """Return the next postback event from an SSE body iterator."""
+    for _, chunk in zip(range(5), body):
+        chunk = chunk.decode()
+        if "event: postback\n" in chunk:
+            return json.loads(chunk.split("data: ", 1)[1])
+    return None
+
+
+class TestPostbackEventBus:
+    """Tests for the in-process postback notification bus"""
+
+    def test_auto_backend_is_local_for_sqlite(self, app):
+        assert app.extensions["postback_events"].backend == "local"
+
+    def test_events_reach_channel_subscribers_only(self, app):
+        bus = app.extensions["postback_events"]
+        mine = bus.subscribe(user_channel(1))
+        other = bus.subscribe(user_channel(2))
+
+        bus.publish(user_channel(1), {"intent_id": "a"})
+
+        assert mine.get(timeout=0) == {"intent_id": "a"}
+        assert other.get(timeout=0) is None
+        bus.unsubscribe(mine)
+        bus.unsubscribe(other)
+        assert bus.subscriber_count() == 0
+
+    def test_slow_subscriber_drops_events(self, app):
+        bus = PostbackEventBus()
+        bus.queue_size = 2
+        subscription = bus.subscribe(guest_channel("guest-key"))
+
+        for i in range(3):
+            bus.publish(guest_channel("guest-key"), {"n": i})
+
+        assert subscription.dropped == 1
+        assert [subscription.get(timeout=0)["n"] for _ in range(2)] == [0, 1]
+
+    def test_subscriber_cap(self, app):
+        bus = app.extensions["postback_events"]
+        bus.max_subscribers = 1
+        first = bus.subscribe(guest_channel("guest-key"))
+        assert bus.subscribe(guest_channel("guest-key")) is None
+
+        client = app.test_client()
+        assert client.get("/postbacks/stream").status_code == 503
+        bus.unsubscribe(first)
+
+
+class TestPostbackStream:
+    """Tests for the /postbacks/stream SSE endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def short_heartbeat(self, app):
+        app.config["POSTBACK_STREAM_HEARTBEAT"] = 0.01
+
+    def test_user_stream_receives_new_postbacks(self, app):
+        create_user(app)
+        client = app.test_client()
+        login(client, "stream@test.com", "userpass")
+
+        response = client.get("/postbacks/stream")
+        assert response.mimetype == "text/event-stream"
+        body = iter(response.response)
+        try:
+            client.post("/postback", json={"intentId": "live-intent", "status": "success"})
+            event = read_event(body)
+        finally:
+            response.close()
+
+        assert event["intent_id"] == "live-intent"
+        assert event["payload_status"] == "success"
+        assert event["id"] is not None
+        assert "payload" not in event
+        assert app.extensions["postback_events"].subscriber_count() == 0
+
+    def test_guest_stream_includes_payload(self, app):
+        client = app.test_client()
+        client.get("/user/guest-login", follow_redirects=True)
+
+        response = client.get("/postbacks/stream")
+        body = iter(response.response)
+        try:
+            client.post("/postback", json={"intentId": "guest-live", "terminalId": "T1"})
+            event = read_event(body)
+        finally:
+            response.close()
+
+        assert event["intent_id"] == "guest-live"
+        assert event["id"] is None
+        assert event["payload"]["terminalId"] == "T1"
+
+    def test_heartbeat_when_idle(self, app):
+        response = app.test_client().get("/postbacks/stream")
+        body = iter(response.response)
+        try:
+            assert next(body).startswith(b"retry:")
+            assert next(body) == b": keep-alive\n\n"
+        finally:
+            response.close()
+
+    def test_open_streams_are_capped(self, app):
+        client = app.test_client()
+        open_streams = [client.get("/postbacks/stream") for _ in range(app.config["POSTBACK_STREAM_MAX_OPEN"])]
+
+        assert client.get("/postbacks/stream").status_code == 503
+        # A stream closed before it was read still frees its slot
+        open_streams.pop().close()
+        response = client.get("/postbacks/stream")
+        assert response.status_code == 200
+        for stream in open_streams + [response]:
+            stream.close()
+        assert app.extensions["postback_events"].subscriber_count() == 0
+
+    def test_first_page_enables_live_updates(self, app):
+        create_user(app)
+        client = app.test_client()
+        login(client, "stream@test.com", "userpass")
+
+        page = client.get("/postbacks").data
+        # The stream is only opened from the Go live button
+        assert b"/postbacks/stream" in page and b'id="live-toggle"' in page
+        assert b"/postbacks/stream" not in client.get("/postbacks?search=abc").data
+
+
+class TestBatchedIngestEvents:
+    """Events published by the write-behind writer"""
+
+    @pytest.fixture
+    def batched_app(self):
+        app = create_app(
+            {
+                "TESTING": True,
+                "SECRET_KEY": "test-key",
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SESSION_FILE_DIR": tempfile.mkdtemp(),
+                "POSTBACK_INGEST_MODE": "batched",
+                "POSTBACK_SPOOL_FILE": os.path.join(tempfile.mkdtemp(), "spool.ndjson"),
+            }
+        )
+        with app.app_context():
+            db.create_all()
+        yield app
+        with app.app_context():
+            db.drop_all()
+
+    def test_flush_publishes_events_with_ids(self, batched_app):
+        user_id = create_user(batched_app)
+        bus = batched_app.extensions["postback_events"]
+        subscription = bus.subscribe(user_channel(user_id))
+        client = batched_app.test_client()
+
+        for i in range(2):
+            client.post(f"/postback/{user_id}", json={"intentId": f"batch-{i}"})
+        assert subscription.get(timeout=0) is None
+
+        with batched_app.app_context():
+            batched_app.extensions["postback_writer"].flush()
+
+        events = [subscription.get(timeout=0) for _ in range(2)]
+        assert [event["intent_id"] for event in events] == ["batch-0", "batch-1"]
+        assert all(event["id"] for event in events)
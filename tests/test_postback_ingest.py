@@ -0,0 +1,149 @@
+import glob
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.models import User, UserPostback
+
+
+@pytest.fixture
+def batched_app():
+    """App configured for write-behind (batched) postback ingest."""
+    spool_dir = tempfile.mkdtemp()
+    app = create_app(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-key",
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SESSION_FILE_DIR": tempfile.mkdtemp(),
+            "POSTBACK_INGEST_MODE": "batched",
+            "POSTBACK_QUEUE_SIZE": 3,
+            "POSTBACK_BATCH_SIZE": 2,
+            "POSTBACK_SPOOL_FILE": os.path.join(spool_dir, "spool.ndjson"),
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        user = User(email="batch@test.com", role="user")
+        user.set_password("userpass")
+        db.session.add(user)
+        db.session.commit()
+        app.config["TEST_USER_ID"] = user.id
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+def post_many(client, user_id, count, prefix="intent"):
+    for i in range(count):
+        response = client.post(
+            f"/postback/{user_id}", json={"intentId": f"{prefix}-{i}", "status": "success"}
+        )
+        assert response.status_code == 200
+
+
+class TestBatchedIngest:
+    """Tests for the write-behind postback writer"""
+
+    def test_rows_written_on_flush(self, batched_app):
+        client = batched_app.test_client()
+        user_id = batched_app.config["TEST_USER_ID"]
+        writer = batched_app.extensions["postback_writer"]
+
+        post_many(client, user_id, 3)
+
+        with batched_app.app_context():
+            assert UserPostback.query.filter_by(user_id=user_id).count() == 0
+            assert writer.flush() == 3
+            intents = {pb.intent_id for pb in UserPostback.query.filter_by(user_id=user_id)}
+            assert intents == {"intent-0", "intent-1", "intent-2"}
+
+    def test_queue_overflow_spools_to_disk(self, batched_app):
+        client = batched_app.test_client()
+        user_id = batched_app.config["TEST_USER_ID"]
+        writer = batched_app.extensions["postback_writer"]
+
+        post_many(client, user_id, 5)
+
+        assert writer.stats["spooled"] == 2
+        assert os.path.exists(writer.spool_file)
+        with batched_app.app_context():
+            assert writer.flush() == 5
+            assert UserPostback.query.filter_by(user_id=user_id).count() == 5
+        assert not os.path.exists(writer.spool_file)
+
+    def test_failed_drain_keeps_unwritten_rows(self, batched_app):
+        client = batched_app.test_client()
+        user_id = batched_app.config["TEST_USER_ID"]
+        writer = batched_app.extensions["postback_writer"]
+        post_many(client, user_id, 7)
+        write_batch = writer._write_batch
+        calls = []
+
+        def failing_second_batch(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return write_batch(rows)
+
+        with batched_app.app_context(), patch.object(writer, "_write_batch", failing_second_batch):
+            with pytest.raises(RuntimeError):
+                writer._drain_spool()
+
+        # The first spooled batch was written; the second is left in the claim
+        claims = glob.glob(f"{writer.spool_file}.claimed.*")
+        assert len(claims) == 1
+        with open(claims[0]) as f:
+            assert [json.loads(line)["intent_id"] for line in f] == ["intent-5", "intent-6"]
+
+        post_many(client, user_id, 1, prefix="late")
+        with batched_app.app_context():
+            assert writer.flush() == 6
+            intents = {pb.intent_id for pb in UserPostback.query.filter_by(user_id=user_id)}
+        assert intents == {f"intent-{i}" for i in range(7)} | {"late-0"}
+        assert writer._claims() == [] and not os.path.exists(writer.spool_file)
+
+    def test_database_outage_spools_the_batch(self, batched_app):
+        client = batched_app.test_client()
+        user_id = batched_app.config["TEST_USER_ID"]
+        writer = batched_app.extensions["postback_writer"]
+        post_many(client, user_id, 2)
+        outage = OperationalError("INSERT INTO user_postbacks", {}, Exception("server closed the connection"))
+
+        with batched_app.app_context():
+            with patch.object(db.session, "execute", side_effect=outage):
+                with pytest.raises(OperationalError):
+                    writer.flush()
+
+            # Nothing was dropped: the batch waits in the spool until the database is back
+            assert writer.stats["failed"] == 0
+            assert writer.stats["spooled"] == 2
+            assert writer.flush() == 2
+            assert UserPostback.query.filter_by(user_id=user_id).count() == 2
+
+    def test_batch_updates_retention_counters(self, batched_app):
+        client = batched_app.test_client()
+        user_id = batched_app.config["TEST_USER_ID"]
+        writer = batched_app.extensions["postback_writer"]
+        retention = batched_app.extensions["postback_retention"]
+
+        post_many(client, user_id, 2)
+        with batched_app.app_context():
+            writer.flush()
+        retention.sweep()
+        post_many(client, user_id, 2, prefix="later")
+        with batched_app.app_context():
+            writer.flush()
+
+        assert retention._counts[user_id] == 4
+
+    def test_sync_mode_has_no_writer(self, app):
+        assert "postback_writer" not in app.extensions
@@ -0,0 +1,93 @@
+import tempfile
+
+import pytest
+
+from app import create_app, db
+from app.models import User, UserPostback
+
+
+@pytest.fixture
+def retention_app():
+    """App with a tiny retention cap so trimming is cheap to exercise."""
+    app = create_app(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-key",
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SESSION_FILE_DIR": tempfile.mkdtemp(),
+            "POSTBACK_RETENTION_CAP": 3,
+            "POSTBACK_RETENTION_SLACK": 2,
+            "POSTBACK_RETENTION_RECOUNT_EVERY": 1,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        user = User(email="retention@test.com", role="user")
+        user.set_password("userpass")
+        db.session.add(user)
+        db.session.commit()
+        app.config["TEST_USER_ID"] = user.id
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+def post_many(client, user_id, count):
+    for i in range(count):
+        client.post(f"/postback/{user_id}", json={"intentId": f"intent-{i}"})
+
+
+def stored_intents(app, user_id):
+    with app.app_context():
+        return [
+            pb.intent_id
+            for pb in UserPostback.query.filter_by(user_id=user_id).order_by(UserPostback.id)
+        ]
+
+
+class TestPostbackRetention:
+    """Tests for amortized per-user postback retention"""
+
+    def test_ingest_does_not_trim(self, retention_app):
+        client = retention_app.test_client()
+        user_id = retention_app.config["TEST_USER_ID"]
+
+        post_many(client, user_id, 7)
+
+        assert len(stored_intents(retention_app, user_id)) == 7
+
+    def test_sweep_trims_oldest_back_to_cap(self, retention_app):
+        client = retention_app.test_client()
+        user_id = retention_app.config["TEST_USER_ID"]
+        retention = retention_app.extensions["postback_retention"]
+
+        post_many(client, user_id, 6)
+        trimmed = retention.sweep()
+
+        assert trimmed == {user_id: 3}
+        assert stored_intents(retention_app, user_id) == ["intent-3", "intent-4", "intent-5"]
+
+    def test_sweep_leaves_users_within_slack(self, retention_app):
+        client = retention_app.test_client()
+        user_id = retention_app.config["TEST_USER_ID"]
+        retention = retention_app.extensions["postback_retention"]
+
+        post_many(client, user_id, 5)
+
+        assert retention.sweep() == {}
+        assert len(stored_intents(retention_app, user_id)) == 5
+
+    def test_counters_mark_user_dirty_after_seeding(self, retention_app):
+        client = retention_app.test_client()
+        user_id = retention_app.config["TEST_USER_ID"]
+        retention = retention_app.extensions["postback_retention"]
+
+        post_many(client, user_id, 1)
+        retention.sweep()
+        assert retention._counts[user_id] == 1
+
+        post_many(client, user_id, 5)
+        assert user_id in retention._dirty
+        assert retention.sweep() == {user_id: 3}
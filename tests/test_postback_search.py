@@ -0,0 +1,90 @@
+import importlib.util
+import pathlib
+
+import pytest
+from sqlalchemy import inspect
+
+from app import db
+from app.models import User, UserPostback
+from app.utils import postback_search
+from app.utils.postback_search import FTS_TABLE, fts_match_query, search_filter
+
+MIGRATIONS = pathlib.Path(__file__).resolve().parent.parent / "migrations" / "versions"
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(email="search@test.com", role="user")
+        user.set_password("userpass")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_postback(user_id, intent_id, **fields):
+    postback = UserPostback(
+        user_id=user_id,
+        transaction_type="sale",
+        intent_id=intent_id,
+        status="received",
+        postback_data="{}",
+        **fields,
+    )
+    db.session.add(postback)
+    db.session.commit()
+    return postback
+
+
+def search(query):
+    return sorted(pb.intent_id for pb in UserPostback.query.filter(search_filter(query)))
+
+
+class TestPostbackSearch:
+    """Tests for the FTS-backed postback search"""
+
+    def test_fts_table_created_with_schema(self, app):
+        with app.app_context():
+            assert inspect(db.engine).has_table(FTS_TABLE)
+
+    def test_migration_ddl_matches_create_all(self):
+        (path,) = MIGRATIONS.glob("d4b8e61f0a23_*.py")
+        spec = importlib.util.spec_from_file_location("search_migration", path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        # Databases built by migrations and by create_all() get the same index
+        assert migration.FTS_TABLE == postback_search.FTS_TABLE
+        assert migration.SEARCH_COLUMNS == postback_search.SEARCH_COLUMNS
+        assert migration.SQLITE_FTS_DDL == postback_search.SQLITE_FTS_DDL
+
+    def test_match_query_builder(self):
+        assert fts_match_query("Intent-Al") == '"intent al"*'
+        assert fts_match_query("--") is None
+
+    def test_prefix_search_across_columns(self, app, user_id):
+        with app.app_context():
+            add_postback(user_id, "123e4567-e89b-42d3-a456-426614174000", terminal_id="WP0001")
+            add_postback(user_id, "other-intent", merchant_reference="order-778")
+
+            assert search("123e4567-e8") == ["123e4567-e89b-42d3-a456-426614174000"]
+            assert search("wp00") == ["123e4567-e89b-42d3-a456-426614174000"]
+            assert search("order") == ["other-intent"]
+            assert search("nothing") == []
+
+    def test_index_follows_updates_and_deletes(self, app, user_id):
+        with app.app_context():
+            postback = add_postback(user_id, "intent-one", terminal_id="term-a")
+            postback.terminal_id = "term-b"
+            db.session.commit()
+            assert search("term-a") == []
+            assert search("term-b") == ["intent-one"]
+
+            db.session.delete(postback)
+            db.session.commit()
+            assert search("intent-one") == []
+
+    def test_punctuation_only_falls_back_to_substring(self, app, user_id):
+        with app.app_context():
+            add_postback(user_id, "intent-two", merchant_reference="a--b")
+            assert search("--") == ["intent-two"]
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.asgi import create_asgi_app, _split_timeout
+from app.models import User, UserPostback
+
+
+@pytest.fixture
+def app():
+    """App on a file-backed SQLite database, so waiter and ingest threads get their own connections."""
+    db_dir = tempfile.mkdtemp()
+    app = create_app(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-key",
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(db_dir, 'wait.db')}",
+            "SESSION_FILE_DIR": tempfile.mkdtemp(),
+            "POSTBACKS_FILE": os.path.join(db_dir, "postbacks.json"),
+        }
+    )
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def user_token(app):
+    with app.app_context():
+        user = User(email="waiter@test.com", role="user")
+        user.set_password("userpass")
+        db.session.add(user)
+        db.session.commit()
+        return user.id, create_access_token(identity=str(user.id))
+
+
+def post_later(app, user_id, intent_id, delay=0.2):
+    """Deliver a postback for intent_id from another thread after a short delay."""
+
+    def deliver():
+        time.sleep(delay)
+        app.test_client().post(f"/postback/{user_id}", json={"intentId": intent_id, "status": "success"})
+
+    thread = threading.Thread(target=deliver)
+    thread.start()
+    return thread
+
+
+def store_later(app, user_id, intent_id, delay=0.2):
+    """Store a postback without a bus notification, as another worker on the local bus would."""
+
+    def store():
+        time.sleep(delay)
+        with app.app_context():
+            postback = UserPostback(
+                user_id=user_id, transaction_type="N/A", intent_id=intent_id, status="received", postback_data="{}"
+            )
+            db.session.add(postback)
+            db.session.commit()
+
+    thread = threading.Thread(target=store)
+    thread.start()
+    return thread
+
+
+def run_wait(asgi_app, query_string, token):
+    """Drive one GET /api/postbacks/wait through the ASGI app."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/postbacks/wait",
+        "raw_path": b"/api/postbacks/wait",
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 80),
+    }
+    received = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        received.append(message)
+
+    async def call():
+        await asgi_app(scope, receive, send)
+        return received
+
+    return call
+
+
+class TestWaitForPostbacks:
+    """Tests for the GET /api/postbacks/wait long-poll (WSGI)"""
+
+    def test_requires_auth_and_intents(self, client, user_token):
+        assert client.get("/api/postbacks/wait?intent_id=a").status_code == 401
+
+        headers = {"Authorization": f"Bearer {user_token[1]}"}
+        assert client.get("/api/postbacks/wait", headers=headers).status_code == 400
+        assert client.get("/api/postbacks/wait?intent_id=a&mode=some", headers=headers).status_code == 400
+
+    def test_returns_stored_postbacks_immediately(self, client, user_token):
+        user_id, token = user_token
+        client.post(f"/postback/{user_id}", json={"intentId": "done-1", "status": "success"})
+
+        response = client.get(
+            "/api/postbacks/wait?intent_id=done-1&timeout=5",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        data = response.get_json()
+        assert data["complete"] is True
+        assert data["postbacks"]["done-1"]["payload_status"] == "success"
+        assert data["pending"] == []
+
+    def test_times_out_with_pending_intents(self, client, user_token):
+        response = client.get(
+            "/api/postbacks/wait?intent_id=never&timeout=0.1",
+            headers={"Authorization": f"Bearer {user_token[1]}"},
+        )
+        data = response.get_json()
+        assert data == {"postbacks": {}, "pending": ["never"], "complete": False, "timed_out": True}
+
+    def test_wakes_on_ingest(self, app, client, user_token):
+        user_id, token = user_token
+        thread = post_later(app, user_id, "late-intent")
+
+        start = time.time()
+        response = client.get(
+            "/api/postbacks/wait?intent_id=late-intent&timeout=10",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        thread.join()
+
+        assert response.get_json()["complete"] is True
+        assert time.time() - start < 5
+        assert app.extensions["postback_events"].subscriber_count() == 0
+
+    def test_rechecks_without_notification(self, app, client, user_token):
+        user_id, token = user_token
+        app.config["POSTBACK_WAIT_POLL_INTERVAL"] = 0.2
+        thread = store_later(app, user_id, "other-worker")
+
+        start = time.time()
+        response = client.get(
+            "/api/postbacks/wait?intent_id=other-worker&timeout=10",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        thread.join()
+
+        assert response.get_json()["complete"] is True
+        assert time.time() - start < 5
+
+    def test_many_intents_all_and_any(self, client, user_token):
+        user_id, token = user_token
+        headers = {"Authorization": f"Bearer {token}"}
+        client.post(f"/postback/{user_id}", json={"intentId": "multi-1"})
+
+        all_mode = client.get("/api/postbacks/wait?intent_id=multi-1,multi-2&timeout=0", headers=headers)
+        assert all_mode.get_json()["pending"] == ["multi-2"]
+        assert all_mode.get_json()["complete"] is False
+
+        any_mode = client.get(
+            "/api/postbacks/wait?intent_id=multi-1&intent_id=multi-2&mode=any&timeout=0", headers=headers
+        )
+        assert any_mode.get_json()["complete"] is True
+
+
+class TestAsgiWaitForPostbacks:
+    """Tests for long-polls parked on the ASGI event loop"""
+
+    def test_split_timeout_forces_immediate_check(self):
+        assert _split_timeout(b"intent_id=a&timeout=30") == ("30", b"intent_id=a&timeout=0")
+        assert _split_timeout(b"intent_id=a") == (None, b"intent_id=a&timeout=0")
+
+    def test_waiters_share_event_loop(self, app, user_token):
+        user_id, token = user_token
+        asgi_app = create_asgi_app(app)
+
+        async def main():
+            waits = [run_wait(asgi_app, f"intent_id=async-{i}&timeout=10".encode(), token)() for i in range(10)]
+            return await asyncio.gather(*waits)
+
+        threads = [post_later(app, user_id, f"async-{i}", delay=0.5) for i in range(10)]
+        start = time.time()
+        results = asyncio.run(main())
+        for thread in threads:
+            thread.join()
+
+        assert time.time() - start < 5
+        for i, messages in enumerate(results):
+            start_message = messages[0]
+            assert start_message["status"] == 200
+            assert all(name.lower() != b"x-postback-wait-channel" for name, _ in start_message["headers"])
+            data = json.loads(messages[1]["body"])
+            assert data["complete"] is True
+            assert f"async-{i}" in data["postbacks"]
+        assert app.extensions["postback_events"].subscriber_count() == 0
+
+    def test_timeout_returns_pending(self, app, user_token):
+        asgi_app = create_asgi_app(app)
+        messages = asyncio.run(run_wait(asgi_app, b"intent_id=missing&timeout=0.2", user_token[1])())
+
+        data = json.loads(messages[1]["body"])
+        assert data["timed_out"] is True
+        assert data["pending"] == ["missing"]
+
+    def test_polls_without_notification_or_subscription(self, app, user_token):
+        user_id, token = user_token
+        app.config["POSTBACK_WAIT_POLL_INTERVAL"] = 0.2
+        asgi_app = create_asgi_app(app)
+        bus = app.extensions["postback_events"]
+
+        for intent_id, max_subscribers in (("unnotified", bus.max_subscribers), ("over-cap", 0)):
+            bus.max_subscribers = max_subscribers
+            thread = store_later(app, user_id, intent_id)
+            start = time.time()
+            messages = asyncio.run(run_wait(asgi_app, f"intent_id={intent_id}&timeout=10".encode(), token)())
+            thread.join()
+
+            assert json.loads(messages[1]["body"])["complete"] is True
+            assert time.time() - start < 5
@@ -0,0 +1,119 @@
+import pytest
+import requests
+import requests_mock
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import make_api_request, process_intent
+from app.utils.retry import IDEMPOTENCY_HEADER, idempotency_key
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+PAYMENT_URL = f"{BASE_URL}/merchant/test-mid/intent/payment"
+
+
+@pytest.fixture
+def retries(app):
+    policy = app.extensions["api_retries"]
+    policy.backoff = 0
+    return policy
+
+
+class TestApiRetries:
+    """Tests for retrying failed API calls"""
+
+    def test_transient_error_is_retried_with_the_same_key(self, app, retries):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(PAYMENT_URL, [{"status_code": 503}, {"json": {"intentId": "intent-1"}}])
+            data, error = make_api_request(
+                "/merchant/test-mid/intent/payment", payload={"subTotal": 100, "merchantReference": "ref-1"}
+            )
+
+        assert (data, error) == ({"intentId": "intent-1"}, None)
+        keys = {r.headers[IDEMPOTENCY_HEADER] for r in m.request_history}
+        assert len(m.request_history) == 2 and len(keys) == 1
+        counters = retries.stats()["environments"]["sandbox"]
+        assert counters["retries"] == 1
+        assert counters["recovered"] == 1
+
+    def test_gives_up_after_max_attempts(self, app, retries):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(f"{BASE_URL}/merchant/test-mid/intent/intent-1", exc=requests.exceptions.ReadTimeout)
+            data, error = make_api_request("/merchant/test-mid/intent/intent-1", method="GET")
+
+        assert data is None
+        assert "timed out" in error
+        assert m.call_count == retries.max_attempts
+        assert retries.stats()["environments"]["sandbox"]["failed_after_retries"] == 1
+
+    def test_unkeyed_post_is_not_retried_after_timeout(self, app, retries):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(PAYMENT_URL, exc=requests.exceptions.ReadTimeout)
+            make_api_request("/merchant/test-mid/intent/payment", payload={"subTotal": 100})
+
+        assert m.call_count == 1
+        assert IDEMPOTENCY_HEADER not in m.request_history[0].headers
+
+    def test_process_is_not_resent_after_timeout(self, app, retries):
+        process_url = f"{BASE_URL}/merchant/test-mid/intent/intent-1/process"
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(process_url, [{"exc": requests.exceptions.ReadTimeout}, {"json": {"status": "processing"}}])
+            data, error = process_intent("intent-1")
+
+        # The terminal may already be taking the payment, so the call isn't repeated
+        assert data is None and "timed out" in error
+        assert m.call_count == 1
+        assert IDEMPOTENCY_HEADER not in m.request_history[0].headers
+
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(process_url, [{"exc": requests.exceptions.ConnectTimeout}, {"json": {"status": "processing"}}])
+            data, error = process_intent("intent-1")
+
+        assert (data, error) == ({"status": "processing"}, None)
+        assert m.call_count == 2
+
+    def test_connection_failure_is_always_retried(self, app, retries):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.post(PAYMENT_URL, [{"exc": requests.exceptions.ConnectTimeout}, {"json": {"intentId": "intent-2"}}])
+            data, _ = make_api_request("/merchant/test-mid/intent/payment", payload={"subTotal": 100})
+
+        assert data == {"intentId": "intent-2"}
+        assert m.call_count == 2
+
+    def test_client_errors_are_not_retried(self, app, retries):
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(f"{BASE_URL}/merchant/test-mid/intent/abc", status_code=400, json={"message": "Bad intent"})
+            assert make_api_request("/merchant/test-mid/intent/abc", method="GET") == (None, "Bad intent")
+
+        assert m.call_count == 1
+
+    def test_budget_limits_retries(self, app, retries):
+        retries.budget_min = 0
+        retries.budget_ratio = 0
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(f"{BASE_URL}/merchant/test-mid/intent/abc", status_code=502)
+            make_api_request("/merchant/test-mid/intent/abc", method="GET")
+
+        assert m.call_count == 1
+        assert retries.stats()["environments"]["sandbox"]["budget_exhausted"] == 1
+
+    def test_idempotency_keys(self):
+        payload = {"subTotal": 100, "merchantReference": "ref-1"}
+        key = idempotency_key("mid", "/merchant/mid/intent/payment", payload)
+
+        assert key == idempotency_key("mid", "/merchant/mid/intent/payment", dict(payload))
+        assert key != idempotency_key("mid", "/merchant/mid/intent/payment", dict(payload, subTotal=200))
+        assert idempotency_key("mid", "/merchant/mid/intent/payment", {"subTotal": 100}) is None
+        assert idempotency_key("mid", "/merchant/mid/intent/i-1/process", {"tid": "t"}) is None
+
+    def test_admin_retry_metrics(self, client, app):
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get("/api/admin/metrics/api-retries", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        assert response.get_json()["api_retries"]["max_attempts"] == app.config["API_RETRY_MAX_ATTEMPTS"]
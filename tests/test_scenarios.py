@@ -0,0 +1,235 @@
+import json
+import re
+import threading
+import time
+
+import requests_mock
+
+from app.utils.scenarios import ScenarioRun, parse_scenario
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+INTENT_URL = re.compile(rf"{re.escape(BASE_URL)}/merchant/test-mid/intent/(payment|refund|reversal)$")
+PROCESS_URL = re.compile(rf"{re.escape(BASE_URL)}/merchant/test-mid/intent/[^/]+/process")
+CONFIG = {
+    "MID": "test-mid",
+    "TID": "test-tid",
+    "API_KEY": "test-api-key",
+    "BASE_URL": BASE_URL,
+    "postback_guest_token": "guest-token",
+}
+
+SCENARIO = """
+name: sale-refund-reversal
+instances: 4
+concurrency: 4
+steps:
+  - name: sale
+    type: sale
+    amount: "10.00"
+  - name: refund
+    type: linked_refund
+    parent: sale
+    amount: "4.00"
+  - name: reversal
+    type: reversal
+    parent: sale
+"""
+
+
+def parse(text):
+    return parse_scenario(text, max_instances=100, max_concurrency=10)
+
+
+def mock_gateway(m, on_process=None):
+    """Intent IDs are derived from the merchant reference; creates are recorded with their payload."""
+    created = []
+
+    def create(request, context):
+        payload = request.json()
+        intent_id = f"{request.path.rsplit('/', 1)[-1]}-{payload['merchantReference']}"
+        created.append((intent_id, payload))
+        return {"intentId": intent_id}
+
+    def process(request, context):
+        if on_process:
+            on_process(request.path.split("/")[-2])
+        return {"status": "processing"}
+
+    m.post(INTENT_URL, json=create)
+    m.post(PROCESS_URL, json=process)
+    return created
+
+
+class TestScenarios:
+    """Tests for scripted transaction scenarios"""
+
+    def test_parse_validation(self):
+        scenario, error = parse(SCENARIO)
+        assert error is None
+        assert [step["parent"] for step in scenario["steps"]] == [None, "sale", "sale"]
+
+        scenario, error = parse(json.dumps({"steps": [{"type": "sale", "amount": "1.00"}]}))
+        assert error is None and scenario["steps"][0]["name"] == "step1"
+
+        assert parse("steps: []")[1] == "Scenario needs a non-empty list of steps"
+        assert "parent must name an earlier step" in parse(
+            "steps: [{type: linked_refund, amount: '1', parent: sale}]"
+        )[1]
+        assert "Amount must be greater than zero" in parse("steps: [{type: sale, amount: '0'}]")[1]
+        assert "instances must be between 1 and 100" in parse("instances: 500\nsteps: [{type: sale, amount: '1'}]")[1]
+        assert "not valid YAML" in parse("steps: [")[1]
+
+    def test_intent_ids_are_chained(self, app):
+        scenario, _ = parse(SCENARIO)
+        run = ScenarioRun(scenario, reference_prefix="run")
+        with requests_mock.Mocker() as m:
+            created = mock_gateway(m)
+            report = run.run(app, CONFIG)
+
+        assert (report["completed"], report["succeeded"]) == (4, 4)
+        payloads = dict(created)
+        for n in range(1, 5):
+            sale_id = f"payment-run-{n}-sale"
+            assert payloads[f"refund-run-{n}-refund"]["parentIntentId"] == sale_id
+            assert payloads[f"reversal-run-{n}-reversal"]["parentIntentId"] == sale_id
+        assert [step["passed"] for step in report["steps"]] == [4, 4, 4]
+        assert report["latency_ms"]["end_to_end"]["count"] == 4
+        assert "api" in report["steps"][0]["latency_ms"]
+
+    def test_failed_step_skips_the_rest(self, app):
+        app.extensions["api_retries"].max_attempts = 1
+        scenario, _ = parse(SCENARIO)
+        run = ScenarioRun(scenario)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            m.post(re.compile(r".*/intent/refund$"), status_code=400, json={"message": "Refund exceeds sale"})
+            report = run.run(app, CONFIG)
+
+        refund, reversal = report["steps"][1:]
+        assert refund["errors"] == [{"stage": "create", "error": "Refund exceeds sale", "count": 4}]
+        assert reversal["skipped"] == 4
+        assert report["failures"][0]["step"] == "refund"
+
+    def test_waits_for_expected_postback(self, app):
+        scenario, _ = parse(
+            "instances: 2\nconcurrency: 2\n"
+            "steps: [{name: sale, type: sale, amount: '1', expect: {postback_status: APPROVED, timeout: 5}}]"
+        )
+
+        def send_postback(intent_id):
+            status = "APPROVED" if intent_id.endswith("-1-sale") else "DECLINED"
+            threading.Timer(
+                0.2,
+                lambda: app.test_client().post(
+                    "/postback/guest/guest-token", json={"intentId": intent_id, "status": status}
+                ),
+            ).start()
+
+        with requests_mock.Mocker() as m:
+            mock_gateway(m, on_process=send_postback)
+            report = ScenarioRun(scenario, reference_prefix="pb").run(app, CONFIG)
+
+        (step,) = report["steps"]
+        assert step["passed"] == 1
+        assert step["errors"] == [
+            {"stage": "postback", "error": "Expected postback status APPROVED, got DECLINED", "count": 1}
+        ]
+        assert step["latency_ms"]["postback"]["max"] >= 200
+
+    def test_postback_wait_without_a_bus_subscription(self, app):
+        scenario, _ = parse(
+            "instances: 2\nconcurrency: 2\n"
+            "steps: [{name: sale, type: sale, amount: '1', expect: {postback_status: APPROVED, timeout: 5}}]"
+        )
+        # No room on the event bus: the waits poll the postback store instead
+        app.extensions["postback_events"].max_subscribers = 0
+
+        def send_postback(intent_id):
+            threading.Timer(
+                0.2,
+                lambda: app.test_client().post(
+                    "/postback/guest/guest-token", json={"intentId": intent_id, "status": "APPROVED"}
+                ),
+            ).start()
+
+        with requests_mock.Mocker() as m:
+            mock_gateway(m, on_process=send_postback)
+            report = ScenarioRun(scenario).run(app, CONFIG)
+
+        assert (report["completed"], report["succeeded"]) == (2, 2)
+
+    def test_postback_wait_sees_unnotified_postbacks(self, app):
+        scenario, _ = parse(
+            "steps: [{name: sale, type: sale, amount: '1', expect: {postback_status: APPROVED, timeout: 10}}]"
+        )
+
+        def store_postback(intent_id):
+            # Stored without a bus notification, as by another worker on the local bus
+            record = {"payload": {"intentId": intent_id, "status": "APPROVED"}, "received_at": "", "headers": {}}
+            threading.Timer(0.2, lambda: app.extensions["guest_postbacks"].append(record, "guest-token")).start()
+
+        start = time.monotonic()
+        with requests_mock.Mocker() as m:
+            mock_gateway(m, on_process=store_postback)
+            report = ScenarioRun(scenario).run(app, CONFIG)
+
+        assert report["succeeded"] == 1
+        assert time.monotonic() - start < 5
+
+    def test_postback_wait_errors_are_reported(self, app, monkeypatch):
+        scenario, _ = parse(
+            "instances: 2\nconcurrency: 2\n"
+            "steps: [{name: sale, type: sale, amount: '1', expect: {postback_status: APPROVED, timeout: 1}}]"
+        )
+
+        def broken_store(config, intent_id):
+            raise RuntimeError("store unavailable")
+
+        monkeypatch.setattr("app.utils.scenarios._stored_status", broken_store)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            report = ScenarioRun(scenario).run(app, CONFIG)
+
+        assert (report["completed"], report["failed"]) == (2, 2)
+        assert report["steps"][0]["errors"] == [
+            {"stage": "postback", "error": "Error waiting for postback: store unavailable", "count": 2}
+        ]
+
+    def test_postback_timeout(self, app):
+        scenario, _ = parse(
+            "steps: [{name: sale, type: sale, amount: '1', expect: {postback_status: APPROVED, timeout: 0.2}}]"
+        )
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            report = ScenarioRun(scenario).run(app, CONFIG)
+
+        assert report["steps"][0]["errors"][0]["error"] == "No postback within 0.2s"
+
+    def test_scenario_page(self, client):
+        client.get("/user/guest-login", follow_redirects=True)
+        response = client.post("/batch/scenario", data={"scenario": "steps: [{type: refund}]"})
+        assert b"type must be one of" in response.data
+
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            response = client.post("/batch/scenario", data={"scenario": SCENARIO})
+            run_id = response.headers["Location"].rsplit("/", 1)[-1]
+            for _ in range(100):
+                report = client.get(f"/batch/{run_id}/report").get_json()
+                if report["status"] == "finished":
+                    break
+                time.sleep(0.05)
+
+        assert report["succeeded"] == 4
+        assert b"sale-refund-reversal" in client.get(f"/batch/{run_id}").data
+
+    def test_cli(self, app, runner, tmp_path):
+        path = tmp_path / "scenario.yaml"
+        path.write_text(SCENARIO)
+        with requests_mock.Mocker() as m:
+            mock_gateway(m)
+            result = runner.invoke(args=["run-scenario", str(path), "--instances", "2", "--json"])
+
+        assert result.exit_code == 0, result.output
+        report = json.loads(result.stdout)
+        assert (report["count"], report["succeeded"]) == (2, 2)
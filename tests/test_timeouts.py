@@ -0,0 +1,138 @@
+import time
+from decimal import Decimal
+
+import pytest
+import requests
+import requests_mock
+from flask import session
+from flask_jwt_extended import create_access_token
+
+from app.models import User, db
+from app.utils.api import make_api_request
+from app.utils.retry import TIMED_OUT
+from app.utils.timeouts import DEADLINE_EXCEEDED
+from app.utils.transactions import LINKED_REFUND, run_transaction
+
+BASE_URL = "https://api-terminal-gateway.tillvision.show/devices"
+DETAILS_URL = f"{BASE_URL}/merchant/test-mid/intent/parent-1"
+CREATE_URL = f"{BASE_URL}/merchant/test-mid/intent/payment"
+
+
+@pytest.fixture
+def timeouts(app):
+    return app.extensions["api_timeouts"]
+
+
+def observe(timeouts, url, seconds, count=20, method="GET", outcome=None):
+    for _ in range(count):
+        timeouts.record(method, url, outcome, seconds)
+
+
+class TestAdaptiveTimeouts:
+    """Tests for per-endpoint adaptive timeouts and transaction deadlines"""
+
+    def test_timeouts_follow_endpoint_latency(self, timeouts):
+        # Until an endpoint has enough responses the ceiling (API_REQUEST_TIMEOUT) applies
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 60
+        observe(timeouts, DETAILS_URL, 0.2, count=19)
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 60
+
+        observe(timeouts, DETAILS_URL, 1.5, count=1)
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 4.5
+        # Other intents share the endpoint's template, other endpoints don't
+        assert timeouts.timeout_for("GET", f"{BASE_URL}/merchant/m2/intent/parent-2") == 4.5
+        assert timeouts.timeout_for("POST", CREATE_URL) == 60
+
+        observe(timeouts, CREATE_URL, 50, method="GET", count=200)
+        assert timeouts.timeout_for("GET", CREATE_URL) == timeouts.ceiling
+        # POSTs aren't retried after a timeout, so a fast window doesn't shorten theirs
+        observe(timeouts, CREATE_URL, 0.05, method="POST")
+        assert timeouts.timeout_for("POST", CREATE_URL) == 60
+
+        timeouts.enabled = False
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 60
+
+    def test_timeouts_grow_after_timeouts(self, timeouts):
+        observe(timeouts, DETAILS_URL, 0.1, count=200)
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 2.0
+
+        # Connection failures say nothing about the endpoint's latency
+        observe(timeouts, DETAILS_URL, 10, count=5, outcome="connect")
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 2.0
+        observe(timeouts, DETAILS_URL, 2.0, count=3, outcome=TIMED_OUT)
+        assert timeouts.timeout_for("GET", DETAILS_URL) == 6.0
+
+    def test_calls_use_the_endpoint_timeout(self, app, timeouts):
+        observe(timeouts, DETAILS_URL, 0.5)
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            m.get(DETAILS_URL, json={"intentId": "parent-1"})
+            m.post(CREATE_URL, json={"intentId": "i-1"})
+            make_api_request("/merchant/test-mid/intent/parent-1", method="GET")
+            make_api_request("/merchant/test-mid/intent/payment", payload={"subTotal": 100})
+
+        assert [r.timeout for r in m.request_history] == [2.0, 60]
+        # Both responses were recorded for their endpoints
+        assert {e["endpoint"]: e["samples"] for e in timeouts.snapshot()["endpoints"]} == {
+            "/merchant/{mid}/intent/{intent_id}": 21,
+            "/merchant/{mid}/intent/payment": 1,
+        }
+
+    def test_transaction_calls_share_a_deadline(self, app, timeouts):
+        timeouts.deadline = 0.5
+        external = (
+            '{"gatewayReferenceNumber": "1", "originalAmount": 100, "originalApprovalCode": "A", '
+            '"originalTransactionType": "SALE", "hostMerchantId": "h-mid", "hostTerminalId": "h-tid"}'
+        )
+
+        def slow_details(request, context):
+            time.sleep(0.5)
+            return {"intentId": "parent-1", "transactionDetails": {"externalData": external}}
+
+        def hung(request, context):
+            time.sleep(0.5)
+            raise requests.exceptions.ReadTimeout()
+
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            session.update(MID="test-mid", TID="WP123456")
+            m.get(DETAILS_URL, json=slow_details)
+            result = run_transaction(LINKED_REFUND, "ref-1", amount=Decimal("1.00"), parent_intent_id="parent-1")
+
+        # The details lookup spent the budget, so the refund was never created
+        assert [r.method for r in m.request_history] == ["GET"]
+        assert m.request_history[0].timeout <= 0.5
+        assert (result["stage"], result["error"]) == ("create", DEADLINE_EXCEEDED)
+
+        with app.test_request_context(), requests_mock.Mocker() as m:
+            session.update(MID="test-mid", TID="test-tid")
+            m.post(CREATE_URL, json=hung)
+            result = run_transaction("sale", "ref-2", amount=Decimal("1.00"))
+            # Calls outside a transaction have no deadline
+            m.get(DETAILS_URL, json={"intentId": "parent-1"})
+            assert make_api_request("/merchant/test-mid/intent/parent-1", method="GET")[1] is None
+
+        # The timed out create isn't retried past the deadline
+        assert [r.method for r in m.request_history] == ["POST", "GET"]
+        assert result["stage"] == "create"
+
+    def test_admin_timeout_metrics(self, client, app, timeouts):
+        observe(timeouts, DETAILS_URL, 1.0)
+        with app.app_context():
+            admin = User(email="admin@test.com", role="admin")
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            token = create_access_token(identity=str(admin.id))
+
+        response = client.get("/api/admin/metrics/api-timeouts", headers={"Authorization": f"Bearer {token}"})
+
+        data = response.get_json()["api_timeouts"]
+        assert (data["adaptive"], data["ceiling"], data["deadline"]) == (True, 60.0, 180.0)
+        assert data["endpoints"] == [
+            {
+                "environment": "sandbox",
+                "endpoint": "/merchant/{mid}/intent/{intent_id}",
+                "method": "GET",
+                "samples": 20,
+                "timeout": 3.0,
+            }
+        ]
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+import requests_mock
+
+from app import create_app, db
+
+INTENT_URL = "https://api-terminal-gateway.tillvision.show/devices/merchant/test-mid/intent/payment"
+PROCESS_URL = "https://api-terminal-gateway.tillvision.show/devices/merchant/test-mid/intent/sale-1/process"
+
+
+@pytest.fixture
+def jobs_app():
+    """App that submits sales as background jobs."""
+    app = create_app(
+        {
+            "TESTING": True,
+            "SECRET_KEY": "test-key",
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SESSION_FILE_DIR": tempfile.mkdtemp(),
+            "POSTBACKS_FILE": os.path.join(tempfile.mkdtemp(), "postbacks.json"),
+            "TRANSACTION_MODE": "jobs",
+            "TRANSACTION_JOB_WORKERS": 2,
+            "TRANSACTION_JOB_MAX_PENDING": 1,
+            "TRANSACTION_JOB_DIR": tempfile.mkdtemp(),
+        }
+    )
+    app.extensions["api_retries"].max_attempts = 1
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def configured_guest(app, mock_config):
+    client = app.test_client()
+    client.get("/user/guest-login", follow_redirects=True)
+    client.post("/config", data=mock_config)
+    return client
+
+
+def submit_sale(client):
+    response = client.post("/sale", data={"amount": "10.00", "merchant_reference": "job-ref"})
+    assert response.status_code == 302
+    return response.headers["Location"].split("job=")[-1]
+
+
+def wait_for_job(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/sale/jobs/{job_id}").get_json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+class TestTransactionJobs:
+    """Tests for sales submitted as background jobs"""
+
+    def test_sale_job_succeeds(self, jobs_app, mock_config):
+        client = configured_guest(jobs_app, mock_config)
+        with requests_mock.Mocker() as m:
+            m.post(INTENT_URL, json={"intentId": "sale-1"})
+            m.post(PROCESS_URL, json={"status": "processing"})
+            job_id = submit_sale(client)
+            job = wait_for_job(client, job_id)
+
+        assert (job["status"], job["intent_id"], job["category"]) == ("succeeded", "sale-1", "success")
+        assert job["message"] == "Successfully processed Intent ID: sale-1"
+        assert m.request_history[0].json()["merchantReference"] == "job-ref"
+        assert b"job-status" in client.get(f"/sale?job={job_id}").data
+
+        # Only the submitting session can see the job
+        other = configured_guest(jobs_app, mock_config)
+        assert other.get(f"/sale/jobs/{job_id}").status_code == 404
+        assert client.get("/sale/jobs/../../etc/passwd").status_code == 404
+
+    def test_failed_job_reports_error(self, jobs_app, mock_config):
+        client = configured_guest(jobs_app, mock_config)
+        with requests_mock.Mocker() as m:
+            m.post(INTENT_URL, status_code=400, json={"message": "Invalid amount"})
+            job = wait_for_job(client, submit_sale(client))
+
+        assert (job["status"], job["stage"], job["category"]) == ("failed", "create", "danger")
+        assert job["message"] == "Error creating payment intent: Invalid amount"
+
+    def test_pending_jobs_are_capped(self, jobs_app, mock_config):
+        client = configured_guest(jobs_app, mock_config)
+        release = threading.Event()
+
+        def slow_create(request, context):
+            release.wait(5)
+            return {"intentId": "sale-1"}
+
+        with requests_mock.Mocker() as m:
+            m.post(INTENT_URL, json=slow_create)
+            m.post(PROCESS_URL, json={"status": "processing"})
+            job_id = submit_sale(client)
+            response = client.post(
+                "/sale", data={"amount": "10.00", "merchant_reference": "job-ref"}, follow_redirects=True
+            )
+            assert b"Too many transactions are in progress" in response.data
+            assert client.get(f"/sale/jobs/{job_id}").get_json()["status"] in ("queued", "running")
+            release.set()
+            assert wait_for_job(client, job_id)["status"] == "succeeded"
+
+        assert jobs_app.extensions["transaction_jobs"].snapshot()["rejected"] == 1
+
+    def test_expired_jobs_are_removed(self, jobs_app, mock_config):
+        client = configured_guest(jobs_app, mock_config)
+        with requests_mock.Mocker() as m:
+            m.post(INTENT_URL, json={"intentId": "sale-1"})
+            m.post(PROCESS_URL, json={"status": "processing"})
+            job_id = wait_for_job(client, submit_sale(client))["id"]
+
+        jobs = jobs_app.extensions["transaction_jobs"]
+        assert jobs.expire(time.time() + jobs.ttl + 1) == 1
+        assert client.get(f"/sale/jobs/{job_id}").status_code == 404
+
+    def test_sync_mode_has_no_jobs(self, app):
+        assert "transaction_jobs" not in app.extensions
@@ -65,3 +65,15 @@ def test_generate_merchant_reference():
     current_time = int(time.time())
     assert abs(current_time - int(ref1)) < 10
     assert abs(current_time - int(ref2)) < 10
+
+
+def test_cursor_round_trip():
+    """Test keyset cursor encoding and decoding."""
+    from datetime import datetime
+    from app.utils.pagination import encode_cursor, decode_cursor
+
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678)
+    token = encode_cursor(created_at, 42, "next")
+    assert decode_cursor(token) == (created_at, 42, "next")
+    assert decode_cursor("garbage") is None
+    assert decode_cursor(None) is None